@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from cache import file_stamp
+from raster_io import CogWriter, read_scaled
+
+UMBRAL_Z = 2.0
+# Mismo epsilon que la version del notebook para evitar dividir por cero
+EPS_STD = 1e-10
+Z_DESCRIPTIONS = ("ANOMALIA_Z",)
+DIRECCION_DESCRIPTIONS = ("ANOMALIA_DIRECCION",)
+# Pixeles minimos por franja de lectura; los momentos se recorren por filas completas
+STRIP_PIXELS = 1 << 20
+_ARRAYS = ("count", "mean", "m2")
+
+
+def fecha_de_ruta(path: Path, prefijo: str = "indices_") -> str:
+    """Etiqueta de fecha de un raster de indices: `indices_2024.tif` -> "2024", `indices_2020_03.tif` -> "2020_03"."""
+    stem = Path(path).stem
+    return stem[len(prefijo) :] if stem.startswith(prefijo) else stem
+
+
+def _franjas(height: int, width: int, block_h: int):
+    rows = max(block_h, -(-STRIP_PIXELS // max(width, 1)))
+    rows = -(-rows // block_h) * block_h
+    for row in range(0, height, rows):
+        yield row, min(rows, height - row)
+
+
+@dataclass
+class ResumenAnomalia:
+    pixeles_validos: int = 0
+    negativas: int = 0
+    positivas: int = 0
+
+    @classmethod
+    def from_block(cls, z_score: np.ndarray, direccion: np.ndarray) -> "ResumenAnomalia":
+        return cls(
+            int(np.sum(np.isfinite(z_score))),
+            int(np.sum(direccion == -1)),
+            int(np.sum(direccion == 1)),
+        )
+
+    def merge(self, other: "ResumenAnomalia") -> None:
+        self.pixeles_validos += other.pixeles_validos
+        self.negativas += other.negativas
+        self.positivas += other.positivas
+
+    def imprimir(self) -> None:
+        total = max(self.pixeles_validos, 1)
+        print(f"Anomalias negativas: {self.negativas} ({100*self.negativas/total:.1f}%)")
+        print(f"Anomalias positivas: {self.positivas} ({100*self.positivas/total:.1f}%)")
+
+
+class AlmacenMomentos:
+    """
+    Momentos por pixel (conteo, media y M2 de Welford) de una banda sobre todas las fechas
+    agregadas, guardados en disco como arreglos memmap (`count.npy`, `mean.npy`, `m2.npy`)
+    mas `meta.json` con la grilla y las fechas incluidas.
+
+    Cada raster se lee una sola vez, por franjas, al agregarlo; agregar una fecha nueva no
+    vuelve a leer las anteriores. Los NaN no cuentan, igual que `np.nanmean`/`np.nanstd`.
+    """
+
+    def __init__(self, directorio: Path, banda: int = 1):
+        self.directorio = Path(directorio)
+        self.banda = banda
+        self._meta_path = self.directorio / "meta.json"
+        try:
+            self.meta = json.loads(self._meta_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.meta = None
+        if self.meta is not None and (self.meta.get("banda") != banda or self.meta.get("pendiente")):
+            # Otra banda o una actualizacion interrumpida: los momentos no son confiables.
+            self.meta = None
+        self._arrays: dict[str, np.ndarray] = {}
+
+    @property
+    def fechas(self) -> list[str]:
+        return list(self.meta["capas"]) if self.meta else []
+
+    def _guardar_meta(self) -> None:
+        tmp = self._meta_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.meta, indent=1), encoding="utf-8")
+        os.replace(tmp, self._meta_path)
+
+    def _array(self, name: str) -> np.ndarray:
+        if name not in self._arrays:
+            self._arrays[name] = np.load(self.directorio / f"{name}.npy", mmap_mode="r+")
+        return self._arrays[name]
+
+    def _crear(self, src) -> None:
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self._arrays = {}
+        for name in _ARRAYS:
+            dtype = np.uint32 if name == "count" else np.float64
+            arr = np.lib.format.open_memmap(self.directorio / f"{name}.npy", mode="w+", dtype=dtype, shape=src.shape)
+            arr[:] = 0
+            arr.flush()
+            self._arrays[name] = arr
+        self.meta = {
+            "banda": self.banda,
+            "shape": list(src.shape),
+            "transform": list(src.transform)[:6],
+            "crs_wkt": src.crs.to_wkt() if src.crs else "",
+            "capas": {},
+        }
+        self._guardar_meta()
+
+    def _alineado(self, src) -> bool:
+        return (
+            tuple(self.meta["shape"]) == tuple(src.shape)
+            and np.allclose(self.meta["transform"], list(src.transform)[:6])
+            and self.meta["crs_wkt"] == (src.crs.to_wkt() if src.crs else "")
+        )
+
+    def agregar(self, ruta: Path, fecha: str | None = None) -> None:
+        """Incorpora `ruta` a los momentos con una sola lectura por franjas."""
+        import rasterio
+        from rasterio.windows import Window
+
+        ruta = Path(ruta)
+        fecha = fecha or fecha_de_ruta(ruta)
+        with rasterio.open(ruta) as src:
+            if self.meta is None:
+                self._crear(src)
+            elif not self._alineado(src):
+                raise ValueError(f"{ruta} no esta en la misma grilla que {self.directorio}")
+            if fecha in self.meta["capas"]:
+                raise ValueError(f"La fecha {fecha} ya esta en {self.directorio}")
+
+            self.meta["pendiente"] = fecha
+            self._guardar_meta()
+            count, mean, m2 = (self._array(name) for name in _ARRAYS)
+            for row, h in _franjas(src.height, src.width, src.block_shapes[0][0]):
+                x = read_scaled(src, self.banda, window=Window(0, row, src.width, h)).astype(np.float64)
+                valid = np.isfinite(x)
+                if src.nodata is not None and not np.isnan(src.nodata):
+                    valid &= x != src.nodata
+                n = count[row : row + h]
+                mu = mean[row : row + h]
+                n[valid] += 1
+                delta = np.where(valid, x - mu, 0.0)
+                mu += np.divide(delta, n, out=np.zeros_like(delta), where=valid)
+                m2[row : row + h] += delta * np.where(valid, x - mu, 0.0)
+            for arr in (count, mean, m2):
+                arr.flush()
+
+        self.meta["capas"][fecha] = file_stamp(ruta)
+        del self.meta["pendiente"]
+        self._guardar_meta()
+
+    def sincronizar(self, rutas: list[Path]) -> list[str]:
+        """
+        Deja el almacen con exactamente las fechas de `rutas`. Solo se leen los rasters nuevos;
+        si una fecha ya incluida cambio o desaparecio, los momentos se recalculan desde cero.
+        Retorna las fechas leidas.
+        """
+        rutas = {fecha_de_ruta(p): Path(p) for p in rutas}
+        capas = self.meta["capas"] if self.meta else {}
+        if any(fecha not in rutas or file_stamp(rutas[fecha]) != huella for fecha, huella in capas.items()):
+            self.meta = None
+        nuevas = [fecha for fecha in sorted(rutas) if fecha not in self.fechas]
+        for fecha in nuevas:
+            self.agregar(rutas[fecha], fecha)
+        return nuevas
+
+    def anomalias(
+        self,
+        ruta_objetivo: Path,
+        out_z: Path,
+        out_direccion: Path,
+        umbral: float = UMBRAL_Z,
+    ) -> ResumenAnomalia:
+        """
+        Escribe el z-score de `ruta_objetivo` respecto del historico y su direccion
+        (-1 bajo, 0 normal, 1 sobre el historico). Si la fecha objetivo esta en el almacen,
+        se descuenta de los momentos al vuelo (el historico son las demas fechas), sin
+        volver a leer ningun otro raster.
+        """
+        import rasterio
+        from rasterio.windows import Window
+
+        if self.meta is None:
+            raise ValueError(f"No hay momentos en {self.directorio}")
+        ruta_objetivo = Path(ruta_objetivo)
+        excluir = fecha_de_ruta(ruta_objetivo) in self.meta["capas"]
+        count, mean, m2 = (self._array(name) for name in _ARRAYS)
+        resumen = ResumenAnomalia()
+
+        with rasterio.open(ruta_objetivo) as src:
+            if not self._alineado(src):
+                raise ValueError(f"{ruta_objetivo} no esta en la misma grilla que {self.directorio}")
+            z_profile = dict(src.profile)
+            z_profile.update(dtype="float32", count=1, nodata=np.nan)
+            dir_profile = dict(src.profile)
+            dir_profile.update(dtype="int8", count=1, nodata=None)
+            with CogWriter(out_z, z_profile, Z_DESCRIPTIONS) as dst_z, CogWriter(
+                out_direccion, dir_profile, DIRECCION_DESCRIPTIONS, categorical=True
+            ) as dst_dir:
+                for row, h in _franjas(src.height, src.width, src.block_shapes[0][0]):
+                    window = Window(0, row, src.width, h)
+                    x = read_scaled(src, self.banda, window=window).astype(np.float64)
+                    if src.nodata is not None and not np.isnan(src.nodata):
+                        x[x == src.nodata] = np.nan
+                    n = count[row : row + h].astype(np.float64)
+                    mu = np.array(mean[row : row + h])
+                    s2 = np.array(m2[row : row + h])
+                    if excluir:
+                        # Welford inverso: quita la fecha objetivo de los momentos acumulados.
+                        valid = np.isfinite(x)
+                        n_h = n - valid
+                        mu_h = np.divide(n * mu - np.where(valid, x, 0.0), n_h, out=np.full_like(mu, np.nan), where=n_h > 0)
+                        s2 = np.where(valid, s2 - (np.nan_to_num(x) - mu_h) * (np.nan_to_num(x) - mu), s2)
+                        n, mu = n_h, np.where(valid, mu_h, mu)
+                    with np.errstate(invalid="ignore", divide="ignore"):
+                        mu = np.where(n > 0, mu, np.nan)
+                        std = np.sqrt(np.maximum(s2, 0.0) / n)
+                        z_score = ((x - mu) / (std + EPS_STD)).astype(np.float32)
+                    direccion = np.zeros(z_score.shape, dtype=np.int8)
+                    direccion[z_score < -umbral] = -1
+                    direccion[z_score > umbral] = 1
+                    dst_z.write(z_score, 1, window=window)
+                    dst_dir.write(direccion, 1, window=window)
+                    resumen.merge(ResumenAnomalia.from_block(z_score, direccion))
+        return resumen
+
+
+def anomalias_temporales(
+    rutas: list[Path],
+    directorio_momentos: Path,
+    fecha_analisis: str | None = None,
+    out_z: Path | None = None,
+    out_direccion: Path | None = None,
+    umbral: float = UMBRAL_Z,
+    banda: int = 1,
+) -> ResumenAnomalia:
+    """
+    Actualiza los momentos con las fechas nuevas de `rutas` y escribe las anomalias de
+    `fecha_analisis` (por defecto la ultima) en `anomalia_z_<fecha>.tif` y
+    `anomalia_direccion_<fecha>.tif` junto a los rasters de entrada.
+    """
+    rutas = sorted(Path(p) for p in rutas)
+    if not rutas:
+        raise FileNotFoundError("No hay rasters de indices para calcular anomalias")
+    almacen = AlmacenMomentos(directorio_momentos, banda)
+    almacen.sincronizar(rutas)
+    por_fecha = {fecha_de_ruta(p): p for p in rutas}
+    fecha = fecha_analisis or sorted(por_fecha)[-1]
+    if fecha not in por_fecha:
+        raise ValueError(f"No hay raster para la fecha {fecha}")
+    objetivo = por_fecha[fecha]
+    out_z = out_z or objetivo.with_name(f"anomalia_z_{fecha}.tif")
+    out_direccion = out_direccion or objetivo.with_name(f"anomalia_direccion_{fecha}.tif")
+    return almacen.anomalias(objetivo, out_z, out_direccion, umbral)
@@ -1,47 +1,113 @@
 from __future__ import annotations
 
+import json
 from pathlib import Path
 
-import folium
 import pandas as pd
-import plotly.express as px
 import streamlit as st
-from streamlit_folium import st_folium
 
-from config import APP_ICON, APP_TITLE, PROCESSED_DIR
-from utils import DataPaths, detect_join_column, join_stats, list_index_years, load_indices_stats, load_stats, raster_to_rgb, read_zones
+import perf
+from bundle import AppBundle, bundle_version
+from config import (
+    APP_ICON,
+    APP_TITLE,
+    BUNDLE_DIR,
+    JOB_RESULTS,
+    MAP_COLUMNS,
+    MAP_DETAIL_ZOOM,
+    MAP_START_ZOOM,
+    PROCESSED_DIR,
+)
+from utils import DataPaths, list_index_years, load_indices_stats, raster_to_rgb
+
+# folium, plotly, streamlit_folium y geopandas se importan en la seccion que los usa: con el
+# bundle precalculado (scripts/build_bundle.py) el primer render no necesita ninguno.
 
 
 page_config = {"page_title": APP_TITLE, "layout": "wide"}
 if APP_ICON:
     page_config["page_icon"] = APP_ICON
 st.set_page_config(**page_config)
+# Medicion de tiempos, memoria y caches: con APP_PERF=1 o con el panel de la barra lateral.
+perfil = perf.iniciar(perf.env_enabled() or st.session_state.get("perf_panel", False))
 st.title(APP_TITLE)
 st.markdown("### Detección de cambios mediante imágenes satelitales")
 
 paths = DataPaths()
+change_options = dict(zip(("Urbanizacion", "Pérdida vegetación", "Ganancia vegetación"), MAP_COLUMNS))
+
+
+@perf.cacheado(st.cache_resource(max_entries=2), "app.bundle")
+def _cached_bundle(version: str) -> AppBundle:
+    return AppBundle(BUNDLE_DIR)
+
 
+@perf.cacheado(st.cache_resource, "app.zone_cache")
+def _zone_cache():
+    from cache import ZoneCache
 
-@st.cache_data
-def _cached_stats():
-    return load_stats(paths)
+    return ZoneCache(paths)
 
 
-@st.cache_data
+@perf.cacheado(st.cache_data, "app.indices_stats")
 def _cached_indices_stats():
     return load_indices_stats(paths)
 
 
-@st.cache_data
-def _cached_zones():
-    return read_zones(paths)
+@perf.cacheado(st.cache_resource(max_entries=2), "app.derived")
+def _cached_derived(version: str):
+    from derived import DerivedData
+
+    # Una instancia por version de los insumos, compartida entre reruns y sesiones.
+    return DerivedData(_zone_cache(), version)
+
+
+@perf.cacheado(st.cache_resource(max_entries=4), "app.histogramas")
+def _cached_histogramas(periodo: str, mtime_ns: int):
+    from sensibilidad import load_histogramas
+
+    return load_histogramas(paths.histograms_dir, periodo)
+
+
+@perf.cacheado(st.cache_resource(max_entries=8), "app.umbrales")
+def _cached_umbrales(periodo: str, mtime_ns: int, umbrales: tuple):
+    from derived import ChangeView
+
+    # Las zonas salen de los datos en vivo: el bundle solo trae la capa ya serializada.
+    hist, _ = _cached_histogramas(periodo, mtime_ns)
+    live = _cached_derived(_zone_cache().data_version())
+    return ChangeView(hist.tabla(dict(umbrales)), live.zones, live.join_column)
+
+
+@perf.cacheado(st.cache_resource, "app.jobs")
+def _job_manager():
+    from jobs import JobManager
+
+    # Un ejecutor por proceso: las sesiones que piden el mismo par comparten el calculo.
+    return JobManager()
+
+
+@perf.cacheado(st.cache_resource(max_entries=JOB_RESULTS), "app.job_view")
+def _cached_job_view(key: tuple):
+    from derived import ChangeView
 
+    live = _cached_derived(_zone_cache().data_version())
+    return ChangeView(_job_manager().get(key).resultado, live.zones, live.join_column)
 
-stats = _cached_stats()
-indices_stats = _cached_indices_stats()
-zones, boundary = _cached_zones()
 
-available_years = list_index_years(PROCESSED_DIR)
+# Con un bundle vigente todo sale de ahi; si falta o sus insumos cambiaron, se calcula en vivo.
+with perf.medir("app.bundle_version"):
+    bundle_vigente = bundle_version(BUNDLE_DIR, paths)
+if bundle_vigente is not None:
+    derived = _cached_bundle(bundle_vigente)
+    indices_stats = derived.indices_stats
+    available_years = derived.years
+else:
+    derived = _cached_derived(_zone_cache().data_version())
+    indices_stats = _cached_indices_stats()
+    available_years = list_index_years(PROCESSED_DIR)
+boundary = derived.boundary
+
 if not available_years:
     available_years = [2018, 2020, 2022, 2024]
 
@@ -60,11 +126,6 @@ fecha_inicio = st.sidebar.selectbox("Fecha inicial", available_years, index=0)
 valid_end_years = [y for y in available_years if y >= fecha_inicio]
 fecha_fin = st.sidebar.selectbox("Fecha final", valid_end_years, index=len(valid_end_years) - 1)
 
-change_options = {
-    "Urbanizacion": "urbanizacion_ha",
-    "Pérdida vegetación": "perdida_veg_ha",
-    "Ganancia vegetación": "ganancia_veg_ha",
-}
 tipos_cambio = st.sidebar.multiselect(
     "Tipos de cambio a mostrar",
     list(change_options.keys()),
@@ -72,79 +133,154 @@ tipos_cambio = st.sidebar.multiselect(
 )
 st.sidebar.caption("ha = hectáreas. Selecciona una o más capas para el mapa.")
 
-if zones is not None and zones.crs is not None:
-    zones = zones.to_crs(epsg=4326)
-if boundary is not None and boundary.crs is not None:
-    boundary = boundary.to_crs(epsg=4326)
-
-join_col = detect_join_column(stats, zones)
-zones_joined = join_stats(zones, stats, join_col)
+# Cambio del par de fechas elegido si esta en la tabla multiperiodo; si no, el cambio total.
+cambios = derived.periodo(fecha_inicio, fecha_fin)
+if cambios is not None:
+    map_caption = f"Mapa de cambio entre {fecha_inicio} y {fecha_fin}."
+    csv_name = f"estadisticas_cambio_{fecha_inicio}_{fecha_fin}.csv"
+else:
+    cambios = derived.total
+    map_caption = "Mapa de cambio total (no depende del año seleccionado)."
+    csv_name = "estadisticas_cambio.csv"
+
+# Par sin tabla precalculada: se puede calcular en segundo plano (jobs.JobManager) sin
+# bloquear la app; el resultado queda en memoria y lo comparten todas las sesiones.
+rutas_par = [PROCESSED_DIR / f"indices_{year}.tif" for year in (fecha_inicio, fecha_fin)]
+if cambios is derived.total and fecha_inicio != fecha_fin and all(ruta.exists() for ruta in rutas_par):
+    from jobs import CANCELADO, ERROR, LISTO, cambio_periodo
+
+    jobs = _job_manager()
+    job_key = ("cambio", str(fecha_inicio), str(fecha_fin)) + tuple(ruta.stat().st_mtime_ns for ruta in rutas_par)
+    job = jobs.get(job_key)
+    if job is not None and job.estado == LISTO:
+        cambios = _cached_job_view(job_key)
+        map_caption = f"Mapa de cambio entre {fecha_inicio} y {fecha_fin} (calculado en la app)."
+        csv_name = f"estadisticas_cambio_{fecha_inicio}_{fecha_fin}.csv"
+    else:
+        with st.sidebar:
+            st.markdown("---")
+            st.subheader("Cálculo bajo demanda")
+            if job is not None and job.estado == ERROR:
+                st.error(f"El cálculo falló: {job.error}")
+            elif job is not None and job.estado == CANCELADO:
+                st.caption("El cálculo anterior fue cancelado.")
+            if job is None or job.terminado:
+                st.caption(f"No hay estadísticas precalculadas para {fecha_inicio}-{fecha_fin}.")
+                if st.button(f"Calcular cambio {fecha_inicio}-{fecha_fin}"):
+                    jobs.submit(
+                        job_key,
+                        cambio_periodo,
+                        *rutas_par,
+                        _zone_cache(),
+                        descripcion=f"cambio {fecha_inicio}-{fecha_fin}",
+                    )
+                    st.rerun()
+            else:
+
+                @st.fragment(run_every=1.0)
+                def _progreso_job():
+                    # Solo este fragmento se reejecuta mientras dura el calculo.
+                    actual = jobs.get(job_key)
+                    if actual is None or actual.terminado:
+                        st.rerun(scope="app")
+                    st.progress(actual.progreso, text=f"Calculando {actual.descripcion} ({actual.estado})")
+                    if st.button("Cancelar cálculo"):
+                        jobs.cancel(job_key)
+                        st.rerun(scope="app")
+
+                _progreso_job()
+
+# Umbrales de clasificacion: con los histogramas por zona del periodo (etapa `histogramas`
+# del pipeline incremental) el cambio por zona se recalcula sin leer rasters.
+from zonal_store import periodo_key, periodo_total
+
+periodo_sel = periodo_key(fecha_inicio, fecha_fin) if cambios is not derived.total else periodo_total(derived.periodos)
+hist_path = paths.histograms_dir / f"{periodo_sel}.npz"
+with st.sidebar.expander("Umbrales de clasificación"):
+    cargados = _cached_histogramas(periodo_sel, hist_path.stat().st_mtime_ns) if hist_path.exists() else None
+    if cargados is None:
+        st.caption("No hay histogramas por zona para este periodo; se muestran los umbrales del pipeline.")
+    else:
+        hist, meta = cargados
+        base = {**meta.get("umbrales", {}), "umbral": meta.get("umbral")}
+        etiquetas = {
+            "ndvi_veg": "NDVI mínimo de vegetación (fecha inicial)",
+            "ndbi_urbano": "NDBI mínimo urbano (fecha final)",
+            "cambio_min": "Cambio mínimo de NDVI",
+        }
+        opciones = {nombre: hist.bordes[nombre].tolist() for nombre in etiquetas}
+        if any(base.get(nombre) not in opciones[nombre] for nombre in etiquetas):
+            st.caption("Los umbrales del pipeline no estan en la grilla de los histogramas.")
+        else:
+            umbrales = {
+                nombre: st.select_slider(etiqueta, opciones[nombre], value=base[nombre], key=f"umbral_{nombre}")
+                for nombre, etiqueta in etiquetas.items()
+            }
+            if any(umbrales[nombre] != base[nombre] for nombre in etiquetas):
+                cambios = _cached_umbrales(periodo_sel, hist_path.stat().st_mtime_ns, tuple(sorted(umbrales.items())))
+                map_caption += " Umbrales ajustados en la barra lateral."
+                csv_name = csv_name.replace(".csv", "_umbrales.csv")
+            if base["umbral"] in opciones["cambio_min"]:
+                umbral = st.select_slider(
+                    "Umbral de diferencia NDVI", opciones["cambio_min"], value=base["umbral"], key="umbral_diferencia"
+                )
+                diferencia = hist.diferencia_ha(umbral)
+                st.caption(
+                    f"Diferencia NDVI mayor a {umbral}: pérdida {diferencia['perdida_ha'].sum():.2f} ha, "
+                    f"ganancia {diferencia['ganancia_ha'].sum():.2f} ha."
+                )
+stats = cambios.stats
+join_col = cambios.join_column
+map_data = cambios.map_data(MAP_COLUMNS)
 
 col1, col2 = st.columns([2, 1])
 
 with col1:
     st.subheader("Mapa de cambios")
-    st.caption("Mapa de cambio total (no depende del año seleccionado).")
-    if zones_joined is None or zones_joined.empty:
+    st.caption(map_caption)
+    if map_data is None:
         st.info("No se encontraron zonas para mostrar en el mapa.")
     else:
-        center = [
-            zones_joined.geometry.centroid.y.mean(),
-            zones_joined.geometry.centroid.x.mean(),
-        ]
-        mapa = folium.Map(location=center, zoom_start=12, tiles="OpenStreetMap")
-
-        if boundary is not None and not boundary.empty:
-            folium.GeoJson(
-                boundary,
-                name="Límite comunal",
-                style_function=lambda _: {"color": "#1f4e79", "weight": 2, "fillOpacity": 0},
-            ).add_to(mapa)
-
-        for label in tipos_cambio:
-            col_name = change_options[label]
-            if col_name not in zones_joined.columns:
-                continue
-            values = zones_joined[col_name].fillna(0)
-            vmin, vmax = float(values.min()), float(values.max())
-            if vmin == vmax:
-                vmin, vmax = 0.0, max(vmax, 1.0)
-
-            def _style(feat, column=col_name, vmin=vmin, vmax=vmax):
-                value = feat["properties"].get(column)
-                if value is None:
-                    return {"fillColor": "#dddddd", "color": "#333333", "weight": 0.5, "fillOpacity": 0.2}
-                scaled = (float(value) - vmin) / (vmax - vmin) if vmax != vmin else 0
-                idx = int(max(0, min(8, round(scaled * 8))))
-                color = px.colors.sequential.YlOrRd[idx]
-                return {"fillColor": color, "color": "#333333", "weight": 0.5, "fillOpacity": 0.6}
-
-            tooltip = None
-            tooltip_fields = []
-            tooltip_aliases = []
-            if join_col:
-                tooltip_fields.append(join_col)
-                tooltip_aliases.append("Zona")
-            for alias, col_name in change_options.items():
-                if col_name in zones_joined.columns:
-                    tooltip_fields.append(col_name)
-                    tooltip_aliases.append(f"{alias} (ha)")
-            if tooltip_fields:
-                tooltip = folium.GeoJsonTooltip(fields=tooltip_fields, aliases=tooltip_aliases)
-
-            folium.GeoJson(zones_joined, name=label, style_function=_style, tooltip=tooltip).add_to(mapa)
+        import folium
+        from streamlit_folium import st_folium
+
+        mapa = folium.Map(location=list(derived.view.center), zoom_start=MAP_START_ZOOM, tiles="OpenStreetMap")
+
+        # GeoDataFrame en vivo o texto GeoJSON desde el bundle
+        if boundary is not None and len(boundary):
+            with perf.medir("app.folium_limite"):
+                folium.GeoJson(
+                    boundary,
+                    name="Límite comunal",
+                    style_function=lambda _: {"color": "#1f4e79", "weight": 2, "fillOpacity": 0},
+                ).add_to(mapa)
+
+        # Una sola copia de la geometria (simplificada para el zoom) para todas las capas;
+        # el color se calcula en el navegador desde las propiedades de cada manzana.
+        tooltip_aliases = {join_col: "Zona"} if join_col else {}
+        for alias, col_name in change_options.items():
+            tooltip_aliases[col_name] = f"{alias} (ha)"
+        with perf.medir("app.folium_capas"):
+            map_data.add_to(
+                mapa,
+                {label: change_options[label] for label in tipos_cambio},
+                zoom=MAP_DETAIL_ZOOM,
+                tooltip_aliases=tooltip_aliases,
+            )
 
         folium.LayerControl().add_to(mapa)
-        st_folium(mapa, width=700, height=500)
+        # El mapa no se usa como entrada: sin objetos de retorno, mover o hacer zoom no reejecuta la app.
+        with perf.medir("app.st_folium"):
+            st_folium(mapa, width=700, height=500, returned_objects=[])
 
 with col2:
     st.subheader("Estadísticas")
     if stats is None or stats.empty:
         st.info("No hay estadísticas disponibles.")
     else:
-        total_urb = stats["urbanizacion_ha"].sum() if "urbanizacion_ha" in stats.columns else 0
-        total_perd = stats["perdida_veg_ha"].sum() if "perdida_veg_ha" in stats.columns else 0
-        total_gan = stats["ganancia_veg_ha"].sum() if "ganancia_veg_ha" in stats.columns else 0
+        total_urb = cambios.totals.get("urbanizacion_ha", 0)
+        total_perd = cambios.totals.get("perdida_veg_ha", 0)
+        total_gan = cambios.totals.get("ganancia_veg_ha", 0)
 
         st.metric("Total urbanización", f"{total_urb:.2f} ha")
         st.metric("Pérdida vegetación", f"{total_perd:.2f} ha")
@@ -157,12 +293,12 @@ with col2:
             index=list(change_options.keys()).index(tipos_cambio[0]) if tipos_cambio else 0,
         )
         selected_metric = change_options.get(metric_label, "urbanizacion_ha")
-        if selected_metric in stats.columns:
-            stats_plot = stats.copy()
-            stats_plot["zona"] = stats_plot["zona"].astype(str)
-            stats_plot["zona_label"] = stats_plot["zona"].str[-6:]
+        top_stats = cambios.top(selected_metric, 10)
+        if top_stats is not None:
+            import plotly.express as px
+
             fig = px.bar(
-                stats_plot.nlargest(10, selected_metric),
+                top_stats,
                 x="zona_label",
                 y=selected_metric,
                 title=f"Top 10 zonas con más {metric_label.lower()}",
@@ -173,22 +309,27 @@ with col2:
                 hover_data={"zona": True},
             )
             fig.update_layout(xaxis_tickangle=-30)
-            st.plotly_chart(fig, use_container_width=True)
+            with perf.medir("app.grafico_top"):
+                st.plotly_chart(fig, use_container_width=True)
 
 st.subheader("Comparación temporal")
 col3, col4 = st.columns(2)
 
+
+def _preview(year):
+    rgb = derived.preview(year) if bundle_vigente is not None else None
+    return rgb if rgb is not None else raster_to_rgb(PROCESSED_DIR / f"indices_{year}.tif")
+
+
 with col3:
-    img_path = PROCESSED_DIR / f"indices_{fecha_inicio}.tif"
-    rgb = raster_to_rgb(img_path)
+    rgb = _preview(fecha_inicio)
     if rgb is not None:
         st.image(rgb, caption=f"NDVI {fecha_inicio}")
     else:
         st.info(f"No se pudo cargar la imagen NDVI {fecha_inicio}.")
 
 with col4:
-    img_path = PROCESSED_DIR / f"indices_{fecha_fin}.tif"
-    rgb = raster_to_rgb(img_path)
+    rgb = _preview(fecha_fin)
     if rgb is not None:
         st.image(rgb, caption=f"NDVI {fecha_fin}")
     else:
@@ -196,6 +337,8 @@ with col4:
 
 st.subheader("Evolución temporal")
 if indices_stats is not None and not indices_stats.empty:
+    import plotly.express as px
+
     indices_plot = indices_stats.copy()
     indices_plot["fecha"] = indices_plot["fecha"].astype(str)
     ordered_years = sorted(indices_plot["fecha"].unique())
@@ -222,7 +365,8 @@ if indices_stats is not None and not indices_stats.empty:
     )
     fig_temporal.update_layout(legend_title_text="Índice")
     fig_temporal.update_xaxes(type="category", categoryorder="array", categoryarray=ordered_years)
-    st.plotly_chart(fig_temporal, use_container_width=True)
+    with perf.medir("app.grafico_temporal"):
+        st.plotly_chart(fig_temporal, use_container_width=True)
     st.caption(
         "El eje X muestra los años disponibles (por ejemplo, 2018, 2020, 2022, 2024). "
         "Cada punto es el promedio del índice en toda el área de estudio para ese año. "
@@ -234,10 +378,33 @@ else:
 st.sidebar.markdown("---")
 st.sidebar.subheader("Descargar datos")
 if stats is not None and not stats.empty:
-    csv = stats.to_csv(index=False)
     st.sidebar.download_button(
         "Descargar estadísticas (CSV)",
-        csv,
-        "estadisticas_cambio.csv",
+        cambios.stats_csv,
+        csv_name,
         "text/csv",
     )
+
+st.sidebar.markdown("---")
+st.sidebar.subheader("Rendimiento")
+st.sidebar.checkbox(
+    "Mostrar tiempos y caches",
+    key="perf_panel",
+    help="Mide cada carga y renderizado de esta ejecucion y lo agrega al log JSON de rendimiento.",
+)
+if perfil is not None:
+    if st.session_state.get("perf_panel"):
+        resumen = pd.DataFrame(perfil.resumen())
+        if not resumen.empty:
+            # Sangria segun anidamiento: una etapa incluye el tiempo de las que contiene.
+            resumen["etapa"] = ["  " * nivel + etapa for nivel, etapa in zip(resumen["nivel"], resumen["etapa"])]
+            st.sidebar.dataframe(resumen.drop(columns="nivel").round(3), hide_index=True)
+        if perfil.cache:
+            st.sidebar.dataframe(pd.DataFrame.from_dict(perfil.cache, orient="index"))
+        st.sidebar.download_button(
+            "Descargar rendimiento (JSON)",
+            json.dumps(perfil.as_dict(), indent=1),
+            "rendimiento.json",
+            "application/json",
+        )
+    perfil.guardar()
@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from cache import digest_key, source_files
+from config import BUNDLE_DIR, CACHE_DIR, MAP_COLUMNS, MAP_DETAIL_ZOOM, PROCESSED_DIR, STATS_COLUMNS
+from derived import ChangeView, MapView
+from utils import DataPaths
+
+BUNDLE_FORMAT = 2
+MANIFEST = "manifest.json"
+# Clave de la vista total cuando no hay almacen por periodo (solo estadisticas_cambio.csv)
+TOTAL = "total"
+
+
+def _sources(paths: DataPaths, processed_dir: Path) -> list[Path]:
+    """Archivos de los que depende el bundle: si alguno cambia, aparece o desaparece, queda obsoleto."""
+    from zonal_store import periodo_files
+
+    files = periodo_files(paths.stats_store) or source_files(paths.stats_csv)
+    files += source_files(paths.indices_stats_csv)
+    files += source_files(paths.zones_shp) + source_files(paths.boundary_gpkg)
+    files += sorted(processed_dir.glob(paths.indices_pattern))
+    return files
+
+
+def _stamps(files: list[Path]) -> dict[str, list[int]]:
+    stamps = {}
+    for path in files:
+        stat = path.stat()
+        stamps[str(path.resolve())] = [stat.st_size, stat.st_mtime_ns]
+    return stamps
+
+
+def _write_arrow(df: pd.DataFrame, path: Path) -> None:
+    # IPC sin comprimir: se lee con memory map, sin decodificar.
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+def _read_arrow(path: Path) -> pd.DataFrame:
+    import pyarrow as pa
+
+    with pa.memory_map(str(path), "r") as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+def build_bundle(
+    paths: DataPaths | None = None,
+    out_dir: Path = BUNDLE_DIR,
+    processed_dir: Path = PROCESSED_DIR,
+    cache_dir: Path = CACHE_DIR,
+    zoom: int = MAP_DETAIL_ZOOM,
+    columns: tuple[str, ...] = MAP_COLUMNS,
+) -> dict:
+    """
+    Precalcula todo lo que muestra la app en `out_dir`: estadisticas de cada periodo (Arrow
+    IPC, y CSV completo para la descarga), la capa del mapa ya unida, simplificada y serializada por periodo (GeoJSON), el
+    limite comunal, resumen de indices, anos disponibles y previews NDVI (npy). El manifiesto
+    se escribe al final y registra tamano y mtime de los insumos para detectar si quedo obsoleto.
+    """
+    from cache import ZoneCache
+    from derived import DerivedData
+    from utils import list_index_years, load_indices_stats, load_stats, raster_to_rgb
+    from zonal_store import periodo_total
+
+    # Sin `paths`, los insumos salen de `processed_dir` (y no de data/processed)
+    paths = paths or DataPaths.from_dirs(processed_dir)
+    stamps = _stamps(_sources(paths, processed_dir))
+    zone_cache = ZoneCache(paths, cache_dir)
+    derived = DerivedData(zone_cache, zone_cache.data_version())
+
+    tmp = out_dir.with_name(out_dir.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    vistas = {
+        key: ChangeView(load_stats(paths, key, STATS_COLUMNS), derived.zones, derived.join_column, paths, key)
+        for key in derived.periodos
+    }
+    if not vistas and derived.stats is not None:
+        vistas[TOTAL] = derived.total
+    periodos = {}
+    for key, vista in vistas.items():
+        entry = {"stats": f"stats_{key}.arrow", "csv": f"stats_{key}.csv"}
+        _write_arrow(vista.stats, tmp / entry["stats"])
+        # CSV de descarga con la tabla completa (el Arrow solo trae las columnas que se muestran)
+        (tmp / entry["csv"]).write_text(vista.stats_csv, encoding="utf-8")
+        map_data = vista.map_data(tuple(columns))
+        if map_data is not None:
+            entry["map"] = f"map_{key}.geojson"
+            (tmp / entry["map"]).write_text(map_data.geojson(zoom), encoding="utf-8")
+            entry["columns"] = map_data.columns
+            entry["ranges"] = {col: list(map_data.value_range(col)) for col in map_data.columns}
+        periodos[key] = entry
+
+    boundary = derived.boundary
+    if boundary is not None and not boundary.empty:
+        (tmp / "boundary.geojson").write_text(boundary.to_json(), encoding="utf-8")
+
+    previews = {}
+    years = list_index_years(processed_dir, paths.indices_pattern)
+    for year in years:
+        rgb = raster_to_rgb(processed_dir / f"indices_{year}.tif")
+        if rgb is not None:
+            previews[str(year)] = f"preview_{year}.npy"
+            np.save(tmp / previews[str(year)], rgb)
+
+    indices_stats = load_indices_stats(paths) if paths.indices_stats_csv.exists() else None
+    view = derived.view
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "version": digest_key(BUNDLE_FORMAT, zoom, columns, json.dumps(stamps, sort_keys=True)),
+        "built": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sources": stamps,
+        "zoom": zoom,
+        "join_column": derived.join_column,
+        "periodos": periodos,
+        "periodo_total": periodo_total(list(derived.periodos)) or TOTAL,
+        "years": years,
+        "previews": previews,
+        "indices_stats": None if indices_stats is None else indices_stats.to_dict("list"),
+        "view": None if view is None else {"center": list(view.center), "bounds": list(view.bounds)},
+    }
+    (tmp / MANIFEST).write_text(json.dumps(manifest), encoding="utf-8")
+
+    # Reemplazo del directorio completo: la app nunca ve un bundle a medio escribir.
+    old = out_dir.with_name(out_dir.name + ".old")
+    shutil.rmtree(old, ignore_errors=True)
+    if out_dir.exists():
+        os.replace(out_dir, old)
+    os.replace(tmp, out_dir)
+    shutil.rmtree(old, ignore_errors=True)
+    return manifest
+
+
+def bundle_version(
+    directory: Path = BUNDLE_DIR, paths: DataPaths | None = None, processed_dir: Path = PROCESSED_DIR
+) -> str | None:
+    """Version del bundle si existe y sus insumos no cambiaron (un `stat` por archivo); si no, None."""
+    try:
+        manifest = json.loads((directory / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if manifest.get("format") != BUNDLE_FORMAT:
+        return None
+    try:
+        stamps = _stamps(_sources(paths or DataPaths.from_dirs(processed_dir), processed_dir))
+    except OSError:
+        return None
+    return manifest["version"] if stamps == manifest.get("sources") else None
+
+
+class BundleChangeView(ChangeView):
+    """ChangeView de un periodo del bundle: la capa del mapa ya viene serializada."""
+
+    def __init__(self, directory: Path, entry: dict, join_column: str | None):
+        # Sin ChangeView.__init__: `stats` se lee del bundle la primera vez que se pide.
+        self.directory = directory
+        self.entry = entry
+        self.zones = None
+        self.join_column = join_column
+        self._top = {}
+        self._map_data = {}
+
+    @cached_property
+    def stats(self) -> pd.DataFrame:
+        return _read_arrow(self.directory / self.entry["stats"])
+
+    @cached_property
+    def stats_csv(self) -> str:
+        return (self.directory / self.entry["csv"]).read_text(encoding="utf-8")
+
+    def map_data(self, columns: tuple[str, ...]):
+        from map_layer import SerializedMapData
+
+        stored = self.entry.get("columns", [])
+        if "map" not in self.entry or not set(columns) <= set(stored):
+            return None
+        if columns not in self._map_data:
+            geojson = (self.directory / self.entry["map"]).read_text(encoding="utf-8")
+            self._map_data[columns] = SerializedMapData(geojson, stored, self.join_column, self.entry["ranges"])
+        return self._map_data[columns]
+
+
+class AppBundle:
+    """
+    Datos de la app desde el bundle, con la misma interfaz que `derived.DerivedData`
+    (boundary, view, total, periodo) mas anos, resumen de indices y previews. Cada archivo
+    se lee la primera vez que se pide.
+    """
+
+    def __init__(self, directory: Path = BUNDLE_DIR):
+        self.directory = directory
+        self.manifest = json.loads((directory / MANIFEST).read_text(encoding="utf-8"))
+        self.version = self.manifest["version"]
+        self._periodos: dict[str, BundleChangeView] = {}
+
+    @property
+    def periodos(self) -> list[str]:
+        return [key for key in self.manifest["periodos"] if key != TOTAL]
+
+    @property
+    def years(self) -> list[int]:
+        return list(self.manifest["years"])
+
+    @cached_property
+    def indices_stats(self) -> pd.DataFrame | None:
+        data = self.manifest["indices_stats"]
+        return None if data is None else pd.DataFrame(data)
+
+    @cached_property
+    def boundary(self) -> str | None:
+        """Limite comunal como texto GeoJSON (folium.GeoJson lo acepta directamente)."""
+        path = self.directory / "boundary.geojson"
+        return path.read_text(encoding="utf-8") if path.exists() else None
+
+    @cached_property
+    def view(self) -> MapView | None:
+        view = self.manifest["view"]
+        return None if view is None else MapView(tuple(view["center"]), tuple(view["bounds"]))
+
+    def _vista(self, key: str) -> BundleChangeView | None:
+        entry = self.manifest["periodos"].get(key)
+        if entry is None:
+            return None
+        if key not in self._periodos:
+            self._periodos[key] = BundleChangeView(self.directory, entry, self.manifest["join_column"])
+        return self._periodos[key]
+
+    @cached_property
+    def total(self) -> ChangeView:
+        return self._vista(self.manifest["periodo_total"]) or ChangeView(None, None, None)
+
+    def periodo(self, t1, t2) -> ChangeView | None:
+        from zonal_store import periodo_key
+
+        key = periodo_key(t1, t2)
+        return self._vista(key) if key in self.periodos else None
+
+    def preview(self, year) -> np.ndarray | None:
+        """Preview NDVI del ano, mapeado en memoria (solo lectura)."""
+        name = self.manifest["previews"].get(str(year))
+        return None if name is None else np.load(self.directory / name, mmap_mode="r")
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+import perf
+from config import CACHE_DIR
+from utils import DataPaths, detect_join_column
+
+# Archivos que acompanan a un shapefile y tambien definen su contenido
+_SHAPEFILE_SIDECARS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+_HASH_CHUNK = 1 << 20
+# umask del proceso, leida una vez al importar (os.umask no se puede consultar sin cambiarla
+# y cambiarla con hilos en curso no es seguro)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _temporal(path: Path) -> Path:
+    """
+    Temporal unico junto a `path` (mismo directorio, para que `os.replace` sea atomico):
+    varios procesos o hilos pueden escribir el mismo artefacto a la vez sin pisarse. mkstemp
+    crea el archivo con permisos 0600; se dejan los de un archivo normal (0666 menos la umask).
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    os.close(fd)
+    os.chmod(tmp, 0o666 & ~_UMASK)
+    return Path(tmp)
+
+
+def _replace(tmp: Path, path: Path) -> None:
+    """
+    `os.replace` que acepta perder la carrera: si falla pero otro escritor ya dejo `path`
+    (mismo contenido, misma clave), el temporal se descarta y se da por escrito.
+    """
+    try:
+        os.replace(tmp, path)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+        if not path.exists():
+            raise
+
+
+def source_files(path: Path) -> list[Path]:
+    """Archivos que definen el contenido de `path` (un shapefile con sus acompanantes); [] si no existe."""
+    if path.suffix.lower() == ".shp":
+        return [p for p in (path.with_suffix(ext) for ext in _SHAPEFILE_SIDECARS) if p.exists()]
+    return [path] if path.exists() else []
+
+
+def file_stamp(path: Path) -> dict:
+    """Huella barata de un archivo (ruta, tamano y mtime), sin leer su contenido."""
+    stat = path.stat()
+    return {"ruta": str(path.resolve()), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+class FingerprintStore:
+    """
+    Huella de archivos (tamano, mtime y sha256). El hash de contenido solo se recalcula
+    cuando cambia el tamano o el mtime, asi que el camino normal es un `stat` por archivo.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        try:
+            self._entries = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._entries = {}
+        self._dirty = False
+        # Los hilos de la app (jobs.JobManager) comparten la misma instancia
+        self._lock = threading.Lock()
+
+    def file(self, path: Path) -> str:
+        stat = path.stat()
+        key = str(path.resolve())
+        entry = self._entries.get(key)
+        if entry is None or entry["size"] != stat.st_size or entry["mtime_ns"] != stat.st_mtime_ns:
+            entry = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": _sha256(path)}
+            with self._lock:
+                self._entries[key] = entry
+                self._dirty = True
+        return entry["sha256"]
+
+    def source(self, path: Path) -> str | None:
+        """Huella combinada de un archivo y sus acompanantes; None si no existe."""
+        files = source_files(path)
+        if not files:
+            return None
+        return digest_key(*(f"{p.name}:{self.file(p)}" for p in files))
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            contenido = json.dumps(self._entries, indent=1)
+            self._dirty = False
+        tmp = _temporal(self.path)
+        tmp.write_text(contenido, encoding="utf-8")
+        _replace(tmp, self.path)
+
+
+def digest_key(*parts) -> str:
+    """Clave corta (16 hex) que resume `parts`: huellas de insumos, parametros, variantes."""
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()[:16]
+
+
+def _crs_key(crs) -> str:
+    from pyproj import CRS
+
+    return CRS.from_user_input(crs).to_wkt()
+
+
+class ZoneCache:
+    """
+    Cache en disco de las capas vectoriales derivadas, con clave por huella de insumos:
+    - zonas y limite reproyectados (GeoParquet),
+    - columna de union detectada entre estadisticas y zonas (JSON),
+    - grilla de etiquetas rasterizada (npz, ver zonal.ZoneGrid).
+
+    Cada artefacto se guarda como `<tipo>-<variante>-<huella>.<ext>`, donde la variante es el
+    CRS o la grilla destino y la huella resume el contenido de los insumos. Al escribir una
+    huella nueva se eliminan las demas de la misma variante, asi que los insumos modificados
+    invalidan la cache automaticamente.
+    """
+
+    def __init__(self, paths: DataPaths | None = None, cache_dir: Path = CACHE_DIR):
+        self.paths = paths or DataPaths()
+        self.cache_dir = cache_dir
+        self.fingerprints = FingerprintStore(cache_dir / "fingerprints.json")
+
+    def stats_fingerprint(self) -> str | None:
+        """Huella de las estadisticas zonales: particiones del almacen Parquet o, si no hay, el CSV."""
+        from zonal_store import periodo_files
+
+        files = periodo_files(self.paths.stats_store)
+        if not files:
+            return self.fingerprints.source(self.paths.stats_csv)
+        return digest_key(*(f"{p.parent.name}:{self.fingerprints.file(p)}" for p in files))
+
+    @perf.medido("cache.data_version")
+    def data_version(self) -> str:
+        """
+        Version de los datos del dashboard: huella combinada de estadisticas, zonas y limite.
+        Sirve como clave explicita para las caches en memoria de la app.
+        """
+        sources = (self.paths.zones_shp, self.paths.boundary_gpkg)
+        version = digest_key(self.stats_fingerprint(), *(self.fingerprints.source(p) for p in sources))
+        self.fingerprints.save()
+        return version
+
+    def _entry(self, kind: str, variant: str, key: str, ext: str) -> Path:
+        return self.cache_dir / f"{kind}-{variant}-{key}.{ext}"
+
+    def _commit(self, tmp: Path, path: Path) -> None:
+        _replace(tmp, path)
+        prefix = path.name.rsplit("-", 1)[0] + "-"
+        for old in self.cache_dir.glob(prefix + "*"):
+            if old != path and not old.name.endswith(".tmp"):
+                old.unlink(missing_ok=True)
+        self.fingerprints.save()
+
+    def _tmp(self, path: Path) -> Path:
+        return _temporal(path)
+
+    def _read_layer(self, kind: str, source: Path, crs):
+        import geopandas as gpd
+
+        fingerprint = self.fingerprints.source(source)
+        if fingerprint is None:
+            return None
+        variant = digest_key(_crs_key(crs)) if crs is not None else "native"
+        path = self._entry(kind, variant, fingerprint, "parquet")
+        if path.exists():
+            try:
+                with perf.medir(f"cache.{kind}.read_parquet"):
+                    layer = gpd.read_parquet(path)
+                perf.contar(f"cache.{kind}", hit=True)
+                return layer
+            except (ImportError, OSError, ValueError):
+                pass
+
+        perf.contar(f"cache.{kind}", hit=False)
+        with perf.medir(f"cache.{kind}.read_file"):
+            layer = gpd.read_file(source)
+        if crs is not None and layer.crs is not None:
+            with perf.medir(f"cache.{kind}.to_crs"):
+                layer = layer.to_crs(crs)
+        tmp = self._tmp(path)
+        try:
+            layer.to_parquet(tmp)
+            self._commit(tmp, path)
+        except ImportError:
+            # Sin pyarrow no hay GeoParquet: se trabaja sin cache.
+            tmp.unlink(missing_ok=True)
+            self.fingerprints.save()
+        return layer
+
+    def zones(self, crs=None):
+        return self._read_layer("zones", self.paths.zones_shp, crs)
+
+    def boundary(self, crs=None):
+        return self._read_layer("boundary", self.paths.boundary_gpkg, crs)
+
+    def join_column(self, stats: pd.DataFrame, zones) -> str | None:
+        stats_fp = self.stats_fingerprint()
+        zones_fp = self.fingerprints.source(self.paths.zones_shp)
+        if stats_fp is None or zones_fp is None:
+            return detect_join_column(stats, zones)
+        path = self._entry("join", "stats", digest_key(stats_fp, zones_fp), "json")
+        if path.exists():
+            try:
+                join_col = json.loads(path.read_text(encoding="utf-8"))["join_column"]
+                perf.contar("cache.join_column", hit=True)
+                return join_col
+            except (OSError, ValueError, KeyError):
+                pass
+        perf.contar("cache.join_column", hit=False)
+        join_col = detect_join_column(stats, zones)
+        tmp = self._tmp(path)
+        tmp.write_text(json.dumps({"join_column": join_col}), encoding="utf-8")
+        self._commit(tmp, path)
+        return join_col
+
+    def label_grid(self, ruta_cambios: Path, columna_zona: str):
+        """Grilla de etiquetas de las zonas alineada con `ruta_cambios`."""
+        import rasterio
+
+        from zonal import ZoneGrid, rasterize_zones
+
+        with rasterio.open(ruta_cambios) as src:
+            transform, shape = src.transform, src.shape
+            crs_wkt = src.crs.to_wkt() if src.crs else ""
+        zones_fp = self.fingerprints.source(self.paths.zones_shp)
+        if zones_fp is None:
+            return None
+        variant = digest_key(columna_zona, tuple(transform)[:6], shape, crs_wkt)
+        path = self._entry("grid", variant, zones_fp, "npz")
+        if path.exists():
+            try:
+                grid, _ = ZoneGrid.load(path)
+                if grid.matches(transform, shape, crs_wkt):
+                    return grid
+            except (OSError, ValueError, KeyError):
+                pass
+
+        zones = self.zones(crs_wkt or None)
+        grid = rasterize_zones(zones, zones[columna_zona].to_numpy(), transform, shape, crs_wkt)
+        tmp = self._tmp(path)
+        grid.save(tmp)
+        self._commit(tmp, path)
+        return grid
+
@@ -0,0 +1,358 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from raster_io import CogWriter, dequantize_int16, quantize_int16, read_scaled
+
+CLASES_CAMBIO = {
+    0: "sin_cambio",
+    1: "urbanizacion",
+    2: "perdida_veg",
+    3: "ganancia_veg",
+    4: "agua_nueva",
+    5: "agua_perdida",
+}
+UMBRALES_DEFECTO = {
+    "ndvi_veg": 0.3,
+    "ndbi_urbano": 0.0,
+    "cambio_min": 0.1,
+}
+UMBRAL_DIFERENCIA = 0.15
+CLASE_DESCRIPTIONS = ("CAMBIO_CLASE",)
+DIFF_DESCRIPTIONS = ("CAMBIO_NDVI",)
+# Metadatos de cambio_clasificado.tif con los anios comparados
+TAG_T1, TAG_T2 = "T1", "T2"
+
+
+def leer_indices(ruta: Path, window=None):
+    import rasterio
+
+    with rasterio.open(ruta) as src:
+        indices = leer_bloque_indices(src, window)
+        profile = src.profile
+    return indices, profile
+
+
+def leer_bloque_indices(src, window=None) -> dict[str, np.ndarray]:
+    """NDVI, NDBI y NDWI del bloque como float (los rasters int16 cuantizados se decodifican)."""
+    return {
+        "ndvi": read_scaled(src, 1, window=window),
+        "ndbi": read_scaled(src, 2, window=window),
+        "ndwi": read_scaled(src, 3, window=window),
+    }
+
+
+# Umbrales fijos de NDWI usados por las reglas de agua.
+NDWI_AGUA = 0.1
+NDWI_NO_AGUA = 0.0
+
+# Bits del codigo por pixel. Cada regla del clasificador es una combinacion de estos bits.
+_BIT_ERA_VEGETACION = 0
+_BIT_ES_URBANO = 1
+_BIT_PERDIO_VEG = 2
+_BIT_GANO_VEG = 3
+_BIT_ERA_NO_AGUA = 4
+_BIT_ES_AGUA = 5
+_BIT_ERA_AGUA = 6
+_BIT_NO_ES_AGUA = 7
+
+
+def _construir_lut() -> np.ndarray:
+    """Tabla codigo (8 bits) -> clase, respetando la prioridad de `clasificar_cambio_urbano`."""
+    codes = np.arange(256, dtype=np.uint16)
+
+    def bit(k):
+        return (codes >> k) & 1 == 1
+
+    reglas = [
+        (1, bit(_BIT_ERA_VEGETACION) & bit(_BIT_ES_URBANO)),
+        (2, bit(_BIT_PERDIO_VEG)),
+        (3, bit(_BIT_GANO_VEG)),
+        (4, bit(_BIT_ERA_NO_AGUA) & bit(_BIT_ES_AGUA)),
+        (5, bit(_BIT_ERA_AGUA) & bit(_BIT_NO_ES_AGUA)),
+    ]
+    lut = np.zeros(256, dtype=np.uint8)
+    # Se aplican de menor a mayor prioridad: la regla con mayor prioridad escribe al final.
+    for clase, cumple in reversed(reglas):
+        lut[cumple] = clase
+    return lut
+
+
+CLASES_LUT = _construir_lut()
+
+
+class ClasificadorCambio:
+    """
+    Clasificador de cambio en una sola pasada por bloque.
+
+    Cada comparacion de umbral se empaqueta como un bit de un codigo uint8 y la clase
+    se obtiene de una tabla de 256 entradas. Los buffers se reutilizan entre bloques.
+    """
+
+    def __init__(self, umbrales=None):
+        self.umbrales = dict(UMBRALES_DEFECTO if umbrales is None else umbrales)
+        self._shape = None
+        self._diff = None
+
+    def _buffers(self, shape, dtype):
+        if (
+            self._shape is None
+            or self._shape[0] < shape[0]
+            or self._shape[1] < shape[1]
+            or self._diff.dtype != dtype
+        ):
+            self._shape = shape
+            self._diff = np.empty(shape, dtype=dtype)
+            self._mask = np.empty(shape, dtype=bool)
+            self._bit = np.empty(shape, dtype=np.uint8)
+            self._code = np.empty(shape, dtype=np.uint8)
+        h, w = shape
+        return self._diff[:h, :w], self._mask[:h, :w], self._bit[:h, :w], self._code[:h, :w]
+
+    def clasificar(self, indices_t1, indices_t2, out: np.ndarray | None = None) -> np.ndarray:
+        ndvi_t1 = indices_t1["ndvi"]
+        ndwi_t1 = indices_t1["ndwi"]
+        ndvi_t2 = indices_t2["ndvi"]
+        ndbi_t2 = indices_t2["ndbi"]
+        ndwi_t2 = indices_t2["ndwi"]
+
+        diff, mask, bit, code = self._buffers(ndvi_t1.shape, np.result_type(ndvi_t1, ndvi_t2))
+        code.fill(0)
+
+        def _set_bit(k):
+            np.left_shift(mask.view(np.uint8), k, out=bit)
+            np.bitwise_or(code, bit, out=code)
+
+        np.greater(ndvi_t1, self.umbrales["ndvi_veg"], out=mask)
+        _set_bit(_BIT_ERA_VEGETACION)
+        np.greater(ndbi_t2, self.umbrales["ndbi_urbano"], out=mask)
+        _set_bit(_BIT_ES_URBANO)
+        # perdida: (t1 - t2) > cambio_min ; ganancia: (t2 - t1) > cambio_min  <=>  (t1 - t2) < -cambio_min
+        np.subtract(ndvi_t1, ndvi_t2, out=diff)
+        np.greater(diff, self.umbrales["cambio_min"], out=mask)
+        _set_bit(_BIT_PERDIO_VEG)
+        np.less(diff, -self.umbrales["cambio_min"], out=mask)
+        _set_bit(_BIT_GANO_VEG)
+        np.less(ndwi_t1, NDWI_NO_AGUA, out=mask)
+        _set_bit(_BIT_ERA_NO_AGUA)
+        np.greater(ndwi_t2, NDWI_AGUA, out=mask)
+        _set_bit(_BIT_ES_AGUA)
+        np.greater(ndwi_t1, NDWI_AGUA, out=mask)
+        _set_bit(_BIT_ERA_AGUA)
+        np.less(ndwi_t2, NDWI_NO_AGUA, out=mask)
+        _set_bit(_BIT_NO_ES_AGUA)
+
+        if out is None:
+            out = np.empty(ndvi_t1.shape, dtype=np.uint8)
+        np.take(CLASES_LUT, code, out=out)
+        return out
+
+
+def clasificar_cambio_urbano(indices_t1, indices_t2, umbrales=None):
+    """
+    Clases:
+    0: Sin cambio
+    1: Urbanizacion (vegetacion -> construido)
+    2: Perdida de vegetacion
+    3: Ganancia de vegetacion
+    4: Nuevo cuerpo de agua
+    5: Perdida de agua
+    """
+    return ClasificadorCambio(umbrales).clasificar(indices_t1, indices_t2)
+
+
+def clasificar_cambio_urbano_mascaras(indices_t1, indices_t2, umbrales=None):
+    """Implementacion original con mascaras completas; se mantiene como referencia."""
+    if umbrales is None:
+        umbrales = UMBRALES_DEFECTO
+
+    ndvi_t1 = indices_t1["ndvi"]
+    ndwi_t1 = indices_t1["ndwi"]
+    ndvi_t2 = indices_t2["ndvi"]
+    ndbi_t2 = indices_t2["ndbi"]
+    ndwi_t2 = indices_t2["ndwi"]
+
+    clase = np.zeros_like(ndvi_t1, dtype=np.uint8)
+
+    era_vegetacion = ndvi_t1 > umbrales["ndvi_veg"]
+    es_urbano = ndbi_t2 > umbrales["ndbi_urbano"]
+    clase[era_vegetacion & es_urbano] = 1
+
+    perdio_veg = (ndvi_t1 - ndvi_t2) > umbrales["cambio_min"]
+    clase[(perdio_veg) & (clase == 0)] = 2
+
+    gano_veg = (ndvi_t2 - ndvi_t1) > umbrales["cambio_min"]
+    clase[(gano_veg) & (clase == 0)] = 3
+
+    era_no_agua = ndwi_t1 < 0
+    es_agua = ndwi_t2 > 0.1
+    clase[(era_no_agua) & (es_agua) & (clase == 0)] = 4
+
+    era_agua = ndwi_t1 > 0.1
+    no_es_agua = ndwi_t2 < 0
+    clase[(era_agua) & (no_es_agua) & (clase == 0)] = 5
+
+    return clase
+
+
+def cambio_diferencia(ndvi_t1: np.ndarray, ndvi_t2: np.ndarray, umbral: float = UMBRAL_DIFERENCIA):
+    """Retorna: cambio (-1 perdida, 0 sin cambio, 1 ganancia), diferencia"""
+    diferencia = ndvi_t2 - ndvi_t1
+    cambio = np.zeros_like(diferencia, dtype=np.int8)
+    cambio[diferencia < -umbral] = -1
+    cambio[diferencia > umbral] = 1
+    return cambio, diferencia
+
+
+@dataclass
+class ResumenDiferencia:
+    pixeles_total: int = 0
+    perdida: int = 0
+    ganancia: int = 0
+
+    @classmethod
+    def from_block(cls, cambio: np.ndarray, diferencia: np.ndarray) -> "ResumenDiferencia":
+        return cls(
+            int(np.sum(~np.isnan(diferencia))),
+            int(np.sum(cambio == -1)),
+            int(np.sum(cambio == 1)),
+        )
+
+    def merge(self, other: "ResumenDiferencia") -> None:
+        self.pixeles_total += other.pixeles_total
+        self.perdida += other.perdida
+        self.ganancia += other.ganancia
+
+    def imprimir(self) -> None:
+        total = max(self.pixeles_total, 1)
+        print(f"Pixeles con perdida: {self.perdida} ({100*self.perdida/total:.1f}%)")
+        print(f"Pixeles con ganancia: {self.ganancia} ({100*self.ganancia/total:.1f}%)")
+        print(f"Sin cambio significativo: {self.pixeles_total - self.perdida - self.ganancia}")
+
+
+def _nodata_para(nodata, dtype: str):
+    """El nodata de los indices si cabe en `dtype` (el de int16 cuantizado no cabe en uint8)."""
+    if nodata is None or np.isnan(nodata):
+        return None
+    info = np.iinfo(dtype)
+    return nodata if info.min <= nodata <= info.max else None
+
+
+def output_profiles(src_profile: dict) -> tuple[dict, dict]:
+    """Perfiles de cambio_clasificado.tif (uint8) y cambio_diferencia_ndvi.tif (int8)."""
+    clase_profile = dict(src_profile)
+    clase_profile.update(dtype="uint8", count=1, nodata=_nodata_para(src_profile.get("nodata"), "uint8"))
+    diff_profile = dict(src_profile)
+    diff_profile.update(dtype="int8", count=1, nodata=_nodata_para(src_profile.get("nodata"), "int8"))
+    return clase_profile, diff_profile
+
+
+def procesar_bloque_cambio(src_t1, src_t2, window, clasificador: ClasificadorCambio, umbral: float = UMBRAL_DIFERENCIA):
+    """Clasifica y diferencia un bloque. Retorna (clase, cambio_diff, resumen)."""
+    indices_t1 = leer_bloque_indices(src_t1, window)
+    indices_t2 = leer_bloque_indices(src_t2, window)
+    clase = clasificador.clasificar(indices_t1, indices_t2)
+    cambio, diferencia = cambio_diferencia(indices_t1["ndvi"], indices_t2["ndvi"], umbral)
+    return clase, cambio, ResumenDiferencia.from_block(cambio, diferencia)
+
+
+def periodo_tags(ruta_t1: Path, ruta_t2: Path) -> dict:
+    """Etiquetas T1/T2 del raster de cambios, con los anios de los nombres indices_<anio>.tif."""
+    return {TAG_T1: Path(ruta_t1).stem.split("_")[-1], TAG_T2: Path(ruta_t2).stem.split("_")[-1]}
+
+
+def leer_periodo(ruta_cambios: Path) -> tuple[str, str] | None:
+    """(t1, t2) guardados en un raster de cambios; None si es de una version sin etiquetas."""
+    import rasterio
+
+    with rasterio.open(ruta_cambios) as src:
+        tags = src.tags()
+    if TAG_T1 in tags and TAG_T2 in tags:
+        return tags[TAG_T1], tags[TAG_T2]
+    return None
+
+
+def detectar_cambios(
+    ruta_t1: Path,
+    ruta_t2: Path,
+    out_clase: Path,
+    out_diff: Path,
+    umbrales=None,
+    umbral: float = UMBRAL_DIFERENCIA,
+) -> ResumenDiferencia:
+    """
+    Genera cambio_clasificado.tif y cambio_diferencia_ndvi.tif recorriendo los bloques
+    internos de `ruta_t1`, sin cargar las escenas completas.
+    """
+    import rasterio
+
+    resumen = ResumenDiferencia()
+    clasificador = ClasificadorCambio(umbrales)
+    with rasterio.open(ruta_t1) as src_t1, rasterio.open(ruta_t2) as src_t2:
+        windows = [window for _, window in src_t1.block_windows(1)]
+        clase_profile, diff_profile = output_profiles(src_t1.profile)
+        tags = periodo_tags(ruta_t1, ruta_t2)
+        with CogWriter(
+            out_clase, clase_profile, CLASE_DESCRIPTIONS, categorical=True, tags=tags
+        ) as dst_clase, CogWriter(out_diff, diff_profile, DIFF_DESCRIPTIONS, categorical=True, tags=tags) as dst_diff:
+            for window in windows:
+                clase, cambio, parcial = procesar_bloque_cambio(src_t1, src_t2, window, clasificador, umbral)
+                dst_clase.write(clase, 1, window=window)
+                dst_diff.write(cambio, 1, window=window)
+                resumen.merge(parcial)
+    return resumen
+
+
+@dataclass
+class ValidacionCuantizacion:
+    """Diferencias entre clasificar los indices float32 y los mismos indices cuantizados a int16."""
+
+    pixeles: int = 0
+    distintos_clase: int = 0
+    distintos_diferencia: int = 0
+    conteos_float: np.ndarray | None = None
+    conteos_int16: np.ndarray | None = None
+
+    @property
+    def fraccion(self) -> float:
+        return max(self.distintos_clase, self.distintos_diferencia) / max(self.pixeles, 1)
+
+    def imprimir(self) -> None:
+        total = max(self.pixeles, 1)
+        print(f"Pixeles comparados: {self.pixeles}")
+        print(f"Clase distinta: {self.distintos_clase} ({100*self.distintos_clase/total:.4f}%)")
+        print(f"Cambio NDVI distinto: {self.distintos_diferencia} ({100*self.distintos_diferencia/total:.4f}%)")
+        for clase, nombre in CLASES_CAMBIO.items():
+            print(f"  {nombre}: {self.conteos_float[clase]} -> {self.conteos_int16[clase]}")
+
+
+def validar_cuantizacion(
+    ruta_t1: Path, ruta_t2: Path, umbrales=None, umbral: float = UMBRAL_DIFERENCIA
+) -> ValidacionCuantizacion:
+    """
+    Clasifica cada bloque de dos rasters de indices float32 tal cual y tras codificarlos y
+    decodificarlos en int16, y cuenta los pixeles cuya clase o cambio NDVI difiere. Solo
+    cambian pixeles a menos de medio paso de cuantizacion (5e-5) de algun umbral.
+    """
+    import rasterio
+
+    validacion = ValidacionCuantizacion(conteos_float=np.zeros(len(CLASES_CAMBIO), dtype=np.int64))
+    validacion.conteos_int16 = validacion.conteos_float.copy()
+    clasificador = ClasificadorCambio(umbrales)
+    with rasterio.open(ruta_t1) as src_t1, rasterio.open(ruta_t2) as src_t2:
+        for _, window in src_t1.block_windows(1):
+            indices = [leer_bloque_indices(src, window) for src in (src_t1, src_t2)]
+            cuantizados = [{k: dequantize_int16(quantize_int16(v)) for k, v in bloque.items()} for bloque in indices]
+            clase = clasificador.clasificar(*indices)
+            clase_q = clasificador.clasificar(*cuantizados)
+            cambio, _ = cambio_diferencia(indices[0]["ndvi"], indices[1]["ndvi"], umbral)
+            cambio_q, _ = cambio_diferencia(cuantizados[0]["ndvi"], cuantizados[1]["ndvi"], umbral)
+            validacion.pixeles += clase.size
+            validacion.distintos_clase += int(np.count_nonzero(clase != clase_q))
+            validacion.distintos_diferencia += int(np.count_nonzero(cambio != cambio_q))
+            validacion.conteos_float += np.bincount(clase.ravel(), minlength=len(CLASES_CAMBIO))
+            validacion.conteos_int16 += np.bincount(clase_q.ravel(), minlength=len(CLASES_CAMBIO))
+    return validacion
@@ -8,3 +8,19 @@ OUTPUTS_DIR = ROOT_DIR / "outputs"
 
 APP_TITLE = "Análisis de Cambio Urbano"
 APP_ICON = None
+CACHE_DIR = DATA_DIR / "cache"
+
+# Columnas de cambio que muestra el mapa, zoom inicial y zoom para el que se simplifica su
+# geometria. Se serializa un solo nivel, el de detalle (dos sobre el inicial), para que las
+# manzanas no se vean facetadas al acercarse; la capa pesa ~1/3 mas que simplificada a zoom 12.
+MAP_COLUMNS = ("urbanizacion_ha", "perdida_veg_ha", "ganancia_veg_ha")
+MAP_START_ZOOM = 12
+MAP_DETAIL_ZOOM = 14
+# Columnas de las estadisticas zonales que lee la app (ademas de `zona`): total de pixeles,
+# porcentajes y hectareas de cada cambio; el almacen Parquet solo lee estas columnas.
+STATS_COLUMNS = ("count", "urbanizacion_pct", "perdida_veg_pct", "ganancia_veg_pct") + MAP_COLUMNS
+# Artefacto precalculado que carga la app (ver bundle.py)
+BUNDLE_DIR = CACHE_DIR / "app_bundle"
+# Calculos en segundo plano de la app (ver jobs.py): hilos y resultados guardados (LRU)
+JOB_WORKERS = 2
+JOB_RESULTS = 8
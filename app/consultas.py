@@ -0,0 +1,306 @@
+from __future__ import annotations
+
+import json
+import math
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, unquote, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from config import CACHE_DIR, PROCESSED_DIR
+from utils import DataPaths, list_index_years, load_stats
+
+# CRS de las consultas por extension (lon/lat, igual que el mapa de la app)
+BBOX_CRS = "EPSG:4326"
+# Respuestas JSON guardadas en memoria (LRU) y limites de las consultas
+CACHE_RESPUESTAS = 4096
+MAX_TOP = 1000
+MAX_LOTE = 500
+# Clave del periodo cuando no hay almacen por periodo (solo estadisticas_cambio.csv)
+TOTAL = "total"
+
+
+class ErrorConsulta(Exception):
+    """Consulta invalida (400) o recurso inexistente (404); el mensaje va en la respuesta."""
+
+    def __init__(self, mensaje: str, status: int = 400):
+        super().__init__(mensaje)
+        self.status = status
+
+
+def _registros(df: pd.DataFrame) -> list[dict]:
+    """Filas como dicts con tipos nativos de Python y NaN -> None (JSON valido)."""
+    return [
+        {k: (None if isinstance(v, float) and math.isnan(v) else v) for k, v in fila.items()}
+        for fila in df.to_dict("records")
+    ]
+
+
+class IndiceConsultas:
+    """
+    Estadisticas de cambio por zona en memoria para responder consultas sin leer archivos:
+    un dict `zona -> fila` por periodo del almacen (`utils.load_stats`), las zonas ordenadas
+    por cada metrica para el top-N, un `STRtree` de las zonas (lon/lat) para consultas por
+    extension y, si estan los `indices_*.tif`, el promedio de cada indice por zona y ano.
+    Los datos no cambian despues de cargarlos; `responder` guarda las respuestas en una LRU.
+    """
+
+    def __init__(
+        self,
+        paths: DataPaths | None = None,
+        processed_dir: Path = PROCESSED_DIR,
+        cache_dir: Path = CACHE_DIR,
+        columna_zona: str = "MANZENT",
+        indices_por_zona: bool = True,
+        cache_respuestas: int = CACHE_RESPUESTAS,
+    ):
+        from cache import ZoneCache
+        from zonal_store import list_periodos, periodo_total
+
+        self.paths = paths or DataPaths()
+        zone_cache = ZoneCache(self.paths, cache_dir)
+        periodos = list_periodos(self.paths.stats_store)
+        self.periodo_defecto = periodo_total(periodos) if periodos else TOTAL
+        tablas = {p: load_stats(self.paths, p) for p in periodos} if periodos else {TOTAL: load_stats(self.paths)}
+
+        self.tablas: dict[str, pd.DataFrame] = {}
+        self.por_zona: dict[str, dict[str, dict]] = {}
+        for periodo, stats in tablas.items():
+            stats = stats.assign(zona=stats["zona"].astype(str)).drop_duplicates("zona").reset_index(drop=True)
+            self.tablas[periodo] = stats
+            self.por_zona[periodo] = dict(zip(stats["zona"], _registros(stats)))
+        base = self.tablas[self.periodo_defecto]
+        self.metricas = [col for col in base.columns if col != "zona" and pd.api.types.is_numeric_dtype(base[col])]
+        # Orden descendente por metrica y periodo, calculado la primera vez que se pide
+        self._orden: dict[tuple[str, str], np.ndarray] = {}
+
+        self._zonas_ids = np.array([], dtype=object)
+        self._tree = None
+        self.extension: list[float] | None = None
+        zones = zone_cache.zones(crs=BBOX_CRS)
+        if zones is not None and not zones.empty:
+            join_col = zone_cache.join_column(self.tablas[self.periodo_defecto], zones)
+            if join_col is not None:
+                import shapely
+
+                zones = zones[zones.geometry.notna()]
+                self._zonas_ids = zones[join_col].astype(str).str.strip().to_numpy()
+                self._tree = shapely.STRtree(zones.geometry.to_numpy())
+                self.extension = [float(v) for v in zones.total_bounds]
+
+        self.indices = self._indices_por_zona(zone_cache, processed_dir, columna_zona) if indices_por_zona else {}
+        self.responder = lru_cache(maxsize=cache_respuestas)(self._responder)
+
+    def _indices_por_zona(self, zone_cache, processed_dir: Path, columna_zona: str) -> dict[str, dict[str, dict]]:
+        """Promedio de cada indice por zona y ano: {zona: {ano: {"ndvi": ..., ...}}}."""
+        from indices import INDEX_NAMES
+        from zonal import zone_band_means
+
+        resultado: dict[str, dict[str, dict]] = {}
+        for year in list_index_years(processed_dir, self.paths.indices_pattern):
+            ruta = processed_dir / f"indices_{year}.tif"
+            grid = zone_cache.label_grid(ruta, columna_zona)
+            if grid is None:
+                return {}
+            means = zone_band_means(grid, ruta)
+            nombres = [nombre.lower() for nombre in INDEX_NAMES][: means.shape[1]]
+            for zona, fila in zip(grid.zone_ids.astype(str), means.tolist()):
+                resultado.setdefault(zona, {})[str(year)] = {
+                    nombre: None if math.isnan(valor) else valor for nombre, valor in zip(nombres, fila)
+                }
+        return resultado
+
+    # --- Consultas -------------------------------------------------------------------
+
+    def _periodo(self, periodo: str | None) -> str:
+        periodo = periodo or self.periodo_defecto
+        if periodo not in self.por_zona:
+            raise ErrorConsulta(f"Periodo desconocido: {periodo} (disponibles: {sorted(self.por_zona)})", 404)
+        return periodo
+
+    def periodos(self) -> dict:
+        return {
+            "periodos": sorted(self.por_zona),
+            "periodo_defecto": self.periodo_defecto,
+            "metricas": self.metricas,
+            "extension": self.extension,
+        }
+
+    def zona(self, zona: str, periodo: str | None = None) -> dict:
+        periodo = self._periodo(periodo)
+        fila = self.por_zona[periodo].get(str(zona).strip())
+        if fila is None:
+            raise ErrorConsulta(f"Zona desconocida: {zona}", 404)
+        return {"periodo": periodo, "zona": fila}
+
+    def zonas(self, zonas: list[str], periodo: str | None = None) -> dict:
+        """Lote de zonas; las que no existen van en `faltantes` en vez de fallar la consulta."""
+        periodo = self._periodo(periodo)
+        tabla = self.por_zona[periodo]
+        encontradas = {z: tabla[z] for z in (str(z).strip() for z in zonas) if z in tabla}
+        return {"periodo": periodo, "zonas": encontradas, "faltantes": [z for z in zonas if str(z).strip() not in tabla]}
+
+    def bbox(self, minx: float, miny: float, maxx: float, maxy: float, periodo: str | None = None) -> dict:
+        """Zonas que intersectan la extension (lon/lat) segun el STRtree."""
+        import shapely
+
+        periodo = self._periodo(periodo)
+        if self._tree is None:
+            raise ErrorConsulta("No hay geometrias de zonas para consultas por extension", 404)
+        if minx > maxx or miny > maxy:
+            raise ErrorConsulta("bbox debe ser minx,miny,maxx,maxy con min <= max")
+        hits = np.sort(self._tree.query(shapely.box(minx, miny, maxx, maxy), predicate="intersects"))
+        tabla = self.por_zona[periodo]
+        zonas = [tabla[z] for z in dict.fromkeys(self._zonas_ids[hits]) if z in tabla]
+        return {"periodo": periodo, "bbox": [minx, miny, maxx, maxy], "n": len(zonas), "zonas": zonas}
+
+    def top(self, metrica: str = "urbanizacion_ha", n: int = 10, periodo: str | None = None) -> dict:
+        periodo = self._periodo(periodo)
+        if metrica not in self.metricas:
+            raise ErrorConsulta(f"Metrica desconocida: {metrica} (disponibles: {self.metricas})")
+        if not 1 <= n <= MAX_TOP:
+            raise ErrorConsulta(f"n debe estar entre 1 y {MAX_TOP}")
+        orden = self._orden.get((periodo, metrica))
+        if orden is None:
+            valores = self.tablas[periodo][metrica].to_numpy(dtype=np.float64)
+            # NaN al final; estable para que los empates salgan en el orden de la tabla
+            orden = np.argsort(-np.nan_to_num(valores, nan=-np.inf), kind="stable")
+            self._orden[(periodo, metrica)] = orden
+        zonas = self.tablas[periodo]["zona"].to_numpy()[orden[:n]]
+        tabla = self.por_zona[periodo]
+        return {"periodo": periodo, "metrica": metrica, "zonas": [tabla[z] for z in zonas]}
+
+    def trayectoria(self, zona: str) -> dict:
+        """Cambio de la zona en cada periodo (ordenados por fecha) y sus indices por ano."""
+        zona = str(zona).strip()
+        periodos = {p: t[zona] for p, t in sorted(self.por_zona.items()) if zona in t}
+        if not periodos and zona not in self.indices:
+            raise ErrorConsulta(f"Zona desconocida: {zona}", 404)
+        return {"zona": zona, "periodos": periodos, "indices": self.indices.get(zona, {})}
+
+    def trayectorias(self, zonas: list[str]) -> dict:
+        resultado, faltantes = {}, []
+        for zona in zonas:
+            try:
+                resultado[str(zona).strip()] = self.trayectoria(zona)
+            except ErrorConsulta:
+                faltantes.append(zona)
+        return {"trayectorias": resultado, "faltantes": faltantes}
+
+    # --- Rutas HTTP ------------------------------------------------------------------
+
+    def _responder(self, ruta: str, query: tuple[tuple[str, str], ...]) -> tuple[int, bytes]:
+        """(status, cuerpo JSON) de una ruta GET; se guarda en la LRU de `responder`."""
+        try:
+            cuerpo = self._despachar(ruta, dict(query))
+            status = 200
+        except ErrorConsulta as exc:
+            cuerpo, status = {"error": str(exc)}, exc.status
+        return status, json.dumps(cuerpo, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def _despachar(self, ruta: str, query: dict) -> dict:
+        # Cada segmento se decodifica por separado: un "%2F" queda dentro del identificador
+        partes = [unquote(p) for p in ruta.split("/") if p]
+        periodo = query.get("periodo")
+        try:
+            if partes == ["periodos"]:
+                return self.periodos()
+            if len(partes) == 2 and partes[0] == "zona":
+                return self.zona(partes[1], periodo)
+            if partes == ["zonas"]:
+                return self.zonas(_lista(query, "ids"), periodo)
+            if partes == ["bbox"]:
+                valores = [float(v) for v in query.get("bbox", "").split(",")] if "bbox" in query else []
+                if len(valores) != 4:
+                    raise ErrorConsulta("bbox requiere minx,miny,maxx,maxy")
+                return self.bbox(*valores, periodo)
+            if partes == ["top"]:
+                return self.top(query.get("metrica", "urbanizacion_ha"), int(query.get("n", 10)), periodo)
+            if len(partes) == 2 and partes[0] == "trayectoria":
+                return self.trayectoria(partes[1])
+            if partes == ["trayectorias"]:
+                return self.trayectorias(_lista(query, "ids"))
+        except ValueError as exc:
+            raise ErrorConsulta(f"Parametro invalido: {exc}") from None
+        raise ErrorConsulta(f"Ruta desconocida: {ruta}", 404)
+
+    def lote(self, consultas: list) -> bytes:
+        """
+        Varias consultas GET en una sola peticion: cada una es una URL relativa
+        (p. ej. "/top?n=5"). Las respuestas salen de la misma LRU que las individuales y se
+        insertan ya serializadas en el JSON del lote.
+        """
+        if not isinstance(consultas, list) or len(consultas) > MAX_LOTE:
+            raise ErrorConsulta(f"`consultas` debe ser una lista de hasta {MAX_LOTE} URLs")
+        partes = []
+        for consulta in consultas:
+            status, cuerpo = self.responder(*_normalizar(str(consulta)))
+            encabezado = json.dumps({"consulta": str(consulta), "status": status}, ensure_ascii=False)[:-1]
+            partes.append(encabezado.encode("utf-8") + b',"respuesta":' + cuerpo + b"}")
+        return b'{"respuestas":[' + b",".join(partes) + b"]}"
+
+
+def _lista(query: dict, nombre: str) -> list[str]:
+    valores = [v for v in query.get(nombre, "").split(",") if v.strip()]
+    if not valores:
+        raise ErrorConsulta(f"Falta el parametro {nombre}=a,b,c")
+    if len(valores) > MAX_LOTE:
+        raise ErrorConsulta(f"Maximo {MAX_LOTE} valores en {nombre}")
+    return valores
+
+
+def _normalizar(url: str) -> tuple[str, tuple[tuple[str, str], ...]]:
+    """Ruta y parametros ordenados: la misma consulta con otro orden usa la misma entrada de cache."""
+    partes = urlsplit(url)
+    return partes.path.rstrip("/") or "/", tuple(sorted(parse_qsl(partes.query)))
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # HTTP/1.1: los clientes reutilizan la conexion entre consultas
+    protocol_version = "HTTP/1.1"
+    # Encabezados y cuerpo van en escrituras separadas: sin TCP_NODELAY cada respuesta espera el ACK diferido (~40 ms)
+    disable_nagle_algorithm = True
+    server: "ServidorConsultas"
+
+    def _enviar(self, status: int, cuerpo: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self) -> None:
+        self._enviar(*self.server.consultas.responder(*_normalizar(self.path)))
+
+    def do_POST(self) -> None:
+        if _normalizar(self.path)[0] != "/lote":
+            self._enviar(404, json.dumps({"error": f"Ruta desconocida: {self.path}"}).encode("utf-8"))
+            return
+        largo = int(self.headers.get("Content-Length") or 0)
+        try:
+            consultas = json.loads(self.rfile.read(largo) or b"{}").get("consultas")
+            self._enviar(200, self.server.consultas.lote(consultas))
+            return
+        except (ValueError, AttributeError):
+            cuerpo, status = {"error": 'El cuerpo debe ser JSON: {"consultas": ["/zona/...", ...]}'}, 400
+        except ErrorConsulta as exc:
+            cuerpo, status = {"error": str(exc)}, exc.status
+        self._enviar(status, json.dumps(cuerpo, ensure_ascii=False).encode("utf-8"))
+
+    def log_message(self, format: str, *args) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ServidorConsultas(ThreadingHTTPServer):
+    """Servidor HTTP/JSON (solo biblioteca estandar) sobre un `IndiceConsultas` compartido por los hilos."""
+
+    daemon_threads = True
+
+    def __init__(self, consultas: IndiceConsultas, host: str = "127.0.0.1", port: int = 8765, verbose: bool = False):
+        super().__init__((host, port), _Handler)
+        self.consultas = consultas
+        self.verbose = verbose
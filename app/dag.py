@@ -0,0 +1,539 @@
+from __future__ import annotations
+
+import inspect
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+from cache import FingerprintStore, digest_key
+from change import UMBRAL_DIFERENCIA, UMBRALES_DEFECTO, detectar_cambios
+from indices import calcular_indices, save_indices_stats, year_from_path
+from multiperiodo import pares_periodos
+from zonal_store import PART_FILE, PARTITION, periodo_key
+
+VIGENTE = "vigente"
+EJECUTADO = "ejecutado"
+ERROR = "error"
+OMITIDO = "omitido"
+APP_DIR = Path(__file__).resolve().parent
+
+
+@dataclass
+class Node:
+    """
+    Nodo del pipeline. La clave del nodo resume el nombre, los parametros, el codigo de la
+    funcion y de los modulos en `code`, y el contenido de `inputs`; si coincide con la guardada y los `outputs` siguen
+    intactos, el nodo no se vuelve a ejecutar. `deps` solo fija el orden de ejecucion.
+    Con `pass_results`, la funcion recibe como primer argumento {dep: resultado} y esos
+    resultados tambien forman parte de la clave.
+    """
+
+    name: str
+    fn: Callable
+    args: tuple = ()
+    inputs: list[Path] = field(default_factory=list)
+    outputs: list[Path] = field(default_factory=list)
+    params: dict = field(default_factory=dict)
+    deps: list[str] = field(default_factory=list)
+    pass_results: bool = False
+    code: list[Path] = field(default_factory=list)
+
+
+def _run_node(fn: Callable, args: tuple):
+    return fn(*args)
+
+
+class Dag:
+    """
+    Ejecutor incremental: recorre los nodos en orden de dependencias, ejecuta en paralelo
+    (procesos) los que estan listos y desactualizados, y guarda en `state_path` la clave,
+    la huella de las salidas y el resultado de cada nodo.
+
+    Como las claves usan el contenido de las entradas, si un nodo se recalcula y produce
+    los mismos archivos, los nodos siguientes quedan vigentes.
+    """
+
+    def __init__(self, nodes: list[Node], state_path: Path, fingerprints: FingerprintStore | None = None):
+        self.nodes = {node.name: node for node in nodes}
+        for node in nodes:
+            missing = [dep for dep in node.deps if dep not in self.nodes]
+            if missing:
+                raise ValueError(f"{node.name} depende de nodos inexistentes: {missing}")
+        self.state_path = state_path
+        self.fingerprints = fingerprints or FingerprintStore(state_path.with_name(state_path.stem + "_fingerprints.json"))
+        try:
+            self.state = json.loads(state_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.state = {}
+
+    def _save_state(self) -> None:
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.state_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state, indent=1), encoding="utf-8")
+        os.replace(tmp, self.state_path)
+        self.fingerprints.save()
+
+    def _code_key(self, node: Node) -> str:
+        return digest_key(
+            f"{node.fn.__module__}.{node.fn.__qualname__}",
+            inspect.getsource(node.fn),
+            *(self.fingerprints.file(Path(path)) for path in node.code),
+        )
+
+    def key(self, node: Node) -> str:
+        inputs = []
+        for path in node.inputs:
+            fingerprint = self.fingerprints.source(Path(path))
+            if fingerprint is None:
+                raise FileNotFoundError(f"Falta la entrada {path} del nodo {node.name}")
+            inputs.append(f"{Path(path).name}:{fingerprint}")
+        return digest_key(
+            node.name,
+            self._code_key(node),
+            json.dumps(node.params, sort_keys=True, default=str),
+            *inputs,
+            # Los resultados de las dependencias solo cuentan si el nodo los recibe;
+            # lo demas llega a traves de los archivos de `inputs`.
+            *(json.dumps(self.state[dep].get("result"), sort_keys=True, default=str) for dep in node.deps if node.pass_results),
+        )
+
+    def _outputs_intact(self, node: Node, entry: dict) -> bool:
+        recorded = entry.get("outputs", {})
+        for path in node.outputs:
+            path = Path(path)
+            if not path.exists() or recorded.get(str(path)) != self.fingerprints.file(path):
+                return False
+        return True
+
+    def is_fresh(self, node: Node, key: str) -> bool:
+        entry = self.state.get(node.name)
+        return entry is not None and entry.get("key") == key and self._outputs_intact(node, entry)
+
+    def run(self, workers: int | None = None, force: bool = False) -> dict[str, str]:
+        """Ejecuta lo necesario y retorna el estado final de cada nodo (vigente/ejecutado/error/omitido)."""
+        status: dict[str, str] = {}
+        pending = dict(self.nodes)
+        running: dict[Future, tuple[Node, str]] = {}
+        failure: BaseException | None = None
+
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            while pending or running:
+                for name, node in list(pending.items()):
+                    if failure is not None or any(status.get(dep) in (ERROR, OMITIDO) for dep in node.deps):
+                        status[name] = OMITIDO
+                        del pending[name]
+                        continue
+                    if not all(status.get(dep) in (VIGENTE, EJECUTADO) for dep in node.deps):
+                        continue
+                    del pending[name]
+                    key = self.key(node)
+                    if not force and self.is_fresh(node, key):
+                        status[name] = VIGENTE
+                        continue
+                    args = node.args
+                    if node.pass_results:
+                        args = ({dep: self.state[dep].get("result") for dep in node.deps},) + args
+                    print(f"[{name}] ejecutando")
+                    running[executor.submit(_run_node, node.fn, args)] = (node, key)
+
+                if not running:
+                    if pending and failure is None and not any(
+                        all(status.get(dep) in (VIGENTE, EJECUTADO) for dep in node.deps) for node in pending.values()
+                    ):
+                        raise ValueError(f"Dependencias circulares entre {sorted(pending)}")
+                    continue
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    node, key = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as exc:  # noqa: BLE001 - se reporta y se relanza al final
+                        print(f"[{node.name}] error: {exc}")
+                        status[node.name] = ERROR
+                        self.state.pop(node.name, None)
+                        failure = failure or exc
+                        continue
+                    self.state[node.name] = {
+                        "key": key,
+                        "outputs": {str(Path(p)): self.fingerprints.file(Path(p)) for p in node.outputs},
+                        "result": result,
+                    }
+                    self._save_state()
+                    status[node.name] = EJECUTADO
+
+        self._save_state()
+        if failure is not None:
+            raise failure
+        return status
+
+
+# --- Etapas del pipeline -------------------------------------------------------------
+
+
+def _etapa_indices(ruta_imagen: Path, ruta_salida: Path, formato: str) -> dict:
+    return calcular_indices(ruta_imagen, ruta_salida, formato)
+
+
+def _etapa_estadisticas_indices(resultados: dict, processed_dir: Path) -> None:
+    rows = {name.split("_", 1)[1]: row for name, row in resultados.items()}
+    save_indices_stats(rows, processed_dir)
+
+
+def _etapa_cambios(ruta_t1: Path, ruta_t2: Path, out_clase: Path, out_diff: Path, umbrales: dict, umbral: float) -> dict:
+    resumen = detectar_cambios(ruta_t1, ruta_t2, out_clase, out_diff, umbrales, umbral)
+    return {"pixeles_total": resumen.pixeles_total, "perdida": resumen.perdida, "ganancia": resumen.ganancia}
+
+
+def _etapa_zonal(ruta_cambios: Path, ruta_grilla: Path, store: Path, periodo: str, out_csv: Path) -> dict:
+    from zonal import ZoneGrid, tabla_zonal, zone_class_counts
+    from zonal_store import export_csv, write_periodo
+
+    # Misma grilla que periodos/histogramas/vialidad (etapa grilla_zonas), sin volver a rasterizar
+    grid, _ = ZoneGrid.load(ruta_grilla)
+    resultados = tabla_zonal(zone_class_counts(grid, ruta_cambios), grid.zone_ids)
+    write_periodo(resultados, store, periodo)
+    export_csv(store, periodo, out_csv)
+    return {col: float(resultados[col].sum()) for col in ("urbanizacion_ha", "perdida_veg_ha", "ganancia_veg_ha")}
+
+
+def _etapa_grilla_zonas(ruta_referencia: Path, zonas: Path, columna_zona: str, cache_dir: Path, salida: Path) -> dict:
+    from cache import ZoneCache
+    from utils import DataPaths
+
+    # Una sola rasterizacion (y reproyeccion de zonas) para todas las etapas por zona
+    grid = ZoneCache(DataPaths(zones_shp=zonas), cache_dir).label_grid(ruta_referencia, columna_zona)
+    grid.save(salida)
+    return {"zonas": grid.n_zones}
+
+
+def _etapa_periodos(rutas: dict, ruta_grilla: Path, store: Path, pares: list, umbrales: dict) -> dict:
+    from multiperiodo import cambios_periodos
+    from zonal import ZoneGrid
+    from zonal_store import periodo_key, write_periodo
+
+    grid, _ = ZoneGrid.load(ruta_grilla)
+    resultado = cambios_periodos(rutas, grid, pares, umbrales)
+    for t1, t2 in resultado.pares:
+        write_periodo(resultado.tabla(t1, t2), store, periodo_key(t1, t2))
+    return {"pares": len(resultado.pares)}
+
+
+def _etapa_histogramas(rutas: dict, ruta_grilla: Path, directorio: Path, pares: list, umbrales: dict, umbral: float) -> dict:
+    from sensibilidad import histogramas_path, histogramas_periodos
+    from zonal import ZoneGrid
+    from zonal_store import periodo_key
+
+    grid, _ = ZoneGrid.load(ruta_grilla)
+    histogramas = histogramas_periodos(rutas, grid, pares)
+    for (t1, t2), hist in histogramas.items():
+        hist.save(histogramas_path(directorio, periodo_key(t1, t2)), {"umbrales": umbrales, "umbral": umbral})
+    return {"celdas": sum(len(hist.pixeles) for hist in histogramas.values())}
+
+
+def _etapa_vialidad(
+    ruta_cambios: Path, ruta_grilla: Path, ruta_red: Path, store: Path, periodo: str, out_parquet: Path, out_csv: Path
+) -> dict:
+    from utils import DataPaths, load_stats
+    from vialidad import cambio_por_distancia_vial, columnas_por_banda
+    from zonal import ZoneGrid
+
+    grid, _ = ZoneGrid.load(ruta_grilla)
+    cambio_vial = cambio_por_distancia_vial(ruta_cambios, grid, ruta_red)
+    cambio_vial.to_parquet(out_parquet, index=False)
+    # Estadisticas zonales del par principal (particion del almacen) con las columnas por banda al lado
+    stats = load_stats(DataPaths(stats_store=store), periodo)
+    stats["zona"] = stats["zona"].astype(str)
+    bandas = columnas_por_banda(cambio_vial).astype({"zona": str})
+    stats = stats.merge(bandas, on="zona", how="left")
+    stats[bandas.columns.drop("zona")] = stats[bandas.columns.drop("zona")].fillna(0.0)
+    stats.to_csv(out_csv, index=False)
+    return {"urbanizacion_ha": float(cambio_vial["urbanizacion_ha"].sum())}
+
+
+def _etapa_anomalias(rutas: list[Path], directorio_momentos: Path) -> dict:
+    from anomalias import anomalias_temporales
+
+    resumen = anomalias_temporales(rutas, directorio_momentos)
+    return {"pixeles_validos": resumen.pixeles_validos, "negativas": resumen.negativas, "positivas": resumen.positivas}
+
+
+def _etapa_datacube(rutas: list[Path], directorio: Path) -> dict:
+    from datacube import construir_datacube
+
+    cubo = construir_datacube(rutas, directorio, forzar=True)
+    return {"forma": list(cubo.shape)}
+
+
+def _etapa_cache_app(
+    store: Path, stats_csv: Path, zones_shp: Path, boundary_gpkg: Path, cache_dir: Path
+) -> str | None:
+    from cache import ZoneCache
+    from utils import DataPaths, load_stats
+
+    paths = DataPaths(stats_csv=stats_csv, stats_store=store, zones_shp=zones_shp, boundary_gpkg=boundary_gpkg)
+    cache = ZoneCache(paths, cache_dir)
+    zones = cache.zones(crs="EPSG:4326")
+    cache.boundary(crs="EPSG:4326")
+    # La deteccion de la columna de union solo mira `zona`
+    return cache.join_column(load_stats(paths, columns=["zona"]), zones)
+
+
+def _etapa_bundle(
+    store: Path,
+    stats_csv: Path,
+    indices_csv: Path,
+    zones_shp: Path,
+    boundary_gpkg: Path,
+    processed_dir: Path,
+    cache_dir: Path,
+) -> str:
+    from bundle import build_bundle
+    from utils import DataPaths
+
+    paths = DataPaths(
+        stats_csv=stats_csv,
+        indices_stats_csv=indices_csv,
+        stats_store=store,
+        zones_shp=zones_shp,
+        boundary_gpkg=boundary_gpkg,
+    )
+    return build_bundle(paths, cache_dir / "app_bundle", processed_dir, cache_dir)["version"]
+
+
+def construir_dag(
+    raw_dir: Path,
+    processed_dir: Path,
+    vector_dir: Path,
+    cache_dir: Path,
+    t1: str | None = None,
+    t2: str | None = None,
+    umbrales: dict | None = None,
+    umbral: float = UMBRAL_DIFERENCIA,
+    columna_zona: str = "MANZENT",
+    pattern: str = "sentinel2_*.tif",
+    modo_periodos: str | None = "todos",
+    formato_indices: str = "float32",
+) -> list[Node]:
+    """
+    Nodos de indices -> estadisticas de indices / anomalias / cubo de indices / grilla de
+    etiquetas de las zonas -> cambios por zona de todos los pares de fechas (`modo_periodos`, None para omitirlos) / histogramas
+    por zona para recalcular el cambio con otros umbrales, cambios -> estadisticas zonales
+    (-> cambio por distancia a la red vial, si existe `red_vial.gpkg`) -> artefactos de la app (zonas reproyectadas y columna de union en data/cache) -> bundle
+    precalculado que carga la app. Con `formato_indices="int16"` los rasters de indices se
+    guardan cuantizados y todas las etapas los leen decodificados.
+    """
+    imagenes = sorted(raw_dir.glob(pattern))
+    if not imagenes:
+        raise FileNotFoundError(f"No se encontraron archivos {pattern} en {raw_dir}")
+    umbrales = dict(UMBRALES_DEFECTO if umbrales is None else umbrales)
+    # Modulos cuyo codigo invalida cada etapa
+    modulos = (
+        "indices",
+        "change",
+        "zonal",
+        "anomalias",
+        "datacube",
+        "multiperiodo",
+        "sensibilidad",
+        "vialidad",
+        "zonal_store",
+        "raster_io",
+        "cache",
+        "utils",
+        "bundle",
+        "derived",
+        "map_layer",
+    )
+    codigo = {name: APP_DIR / f"{name}.py" for name in modulos}
+
+    nodes = []
+    indices = {}
+    for img in imagenes:
+        year = year_from_path(img)
+        indices[year] = processed_dir / f"indices_{year}.tif"
+        nodes.append(
+            Node(
+                f"indices_{year}",
+                _etapa_indices,
+                (img, indices[year], formato_indices),
+                inputs=[img],
+                outputs=[indices[year]],
+                params={"formato": formato_indices},
+                code=[codigo["indices"], codigo["raster_io"]],
+            )
+        )
+    years = sorted(indices)
+    nodes.append(
+        Node(
+            "estadisticas_indices",
+            _etapa_estadisticas_indices,
+            (processed_dir,),
+            outputs=[processed_dir / "estadisticas_indices.csv"],
+            deps=[f"indices_{year}" for year in years],
+            pass_results=True,
+            code=[codigo["indices"]],
+        )
+    )
+    nodes.append(
+        Node(
+            "anomalias",
+            _etapa_anomalias,
+            ([indices[year] for year in years], cache_dir / "momentos_ndvi"),
+            inputs=[indices[year] for year in years],
+            outputs=[processed_dir / f"anomalia_z_{years[-1]}.tif", processed_dir / f"anomalia_direccion_{years[-1]}.tif"],
+            deps=[f"indices_{year}" for year in years],
+            code=[codigo["anomalias"], codigo["raster_io"]],
+        )
+    )
+    nodes.append(
+        Node(
+            "datacube",
+            _etapa_datacube,
+            ([indices[year] for year in years], cache_dir / "datacube_indices"),
+            inputs=[indices[year] for year in years],
+            outputs=[cache_dir / "datacube_indices" / "meta.json"],
+            deps=[f"indices_{year}" for year in years],
+            code=[codigo["datacube"], codigo["raster_io"]],
+        )
+    )
+
+    t1, t2 = t1 or years[0], t2 or years[-1]
+    for year in (t1, t2):
+        if year not in indices:
+            raise ValueError(f"No hay imagen para el ano {year} en {raw_dir}")
+    zonas = vector_dir / "manzanas_censales.shp"
+    store = processed_dir / "estadisticas_cambio"
+    # El par (t1, t2) lo escribe la etapa zonal; aqui solo los demas pares.
+    pares = [par for par in pares_periodos(years, modo_periodos) if par != (t1, t2)] if modo_periodos else []
+    red_vial = vector_dir / "red_vial.gpkg"
+    # Grilla de etiquetas de las zonas, compartida por zonal, periodos, histogramas y vialidad: todos
+    # los rasters de indices (y los de cambio) estan en la grilla del primer ano.
+    grilla = cache_dir / "grilla_zonas.npz"
+    nodes.append(
+        Node(
+            "grilla_zonas",
+            _etapa_grilla_zonas,
+            (indices[years[0]], zonas, columna_zona, cache_dir, grilla),
+            inputs=[indices[years[0]], zonas],
+            outputs=[grilla],
+            params={"columna_zona": columna_zona},
+            deps=[f"indices_{years[0]}"],
+            code=[codigo["zonal"], codigo["cache"]],
+        )
+    )
+    if pares:
+        nodes.append(
+            Node(
+                "periodos",
+                _etapa_periodos,
+                (indices, grilla, store, pares, umbrales),
+                inputs=[indices[year] for year in years] + [grilla],
+                outputs=[store / f"{PARTITION}={periodo_key(*par)}" / PART_FILE for par in pares],
+                params={"pares": pares, "umbrales": umbrales},
+                deps=[f"indices_{year}" for year in years] + ["grilla_zonas"],
+                code=[
+                    codigo["multiperiodo"],
+                    codigo["change"],
+                    codigo["zonal"],
+                    codigo["zonal_store"],
+                    codigo["raster_io"],
+                ],
+            )
+        )
+
+    histogramas = processed_dir / "histogramas_umbrales"
+    todos = [(t1, t2)] + pares
+    nodes.append(
+        Node(
+            "histogramas",
+            _etapa_histogramas,
+            (indices, grilla, histogramas, todos, umbrales, umbral),
+            inputs=[indices[year] for year in years] + [grilla],
+            outputs=[histogramas / f"{periodo_key(*par)}.npz" for par in todos],
+            params={"pares": todos, "umbrales": umbrales, "umbral": umbral},
+            deps=[f"indices_{year}" for year in years] + ["grilla_zonas"],
+            code=[codigo["sensibilidad"], codigo["change"], codigo["zonal"], codigo["raster_io"]],
+        )
+    )
+
+    out_clase = processed_dir / "cambio_clasificado.tif"
+    out_diff = processed_dir / "cambio_diferencia_ndvi.tif"
+    nodes.append(
+        Node(
+            "cambios",
+            _etapa_cambios,
+            (indices[t1], indices[t2], out_clase, out_diff, umbrales, umbral),
+            inputs=[indices[t1], indices[t2]],
+            outputs=[out_clase, out_diff],
+            params={"t1": t1, "t2": t2, "umbrales": umbrales, "umbral": umbral},
+            deps=[f"indices_{t1}", f"indices_{t2}"],
+            code=[codigo["change"], codigo["raster_io"]],
+        )
+    )
+
+    stats_csv = processed_dir / "estadisticas_cambio.csv"
+    nodes.append(
+        Node(
+            "zonal",
+            _etapa_zonal,
+            (out_clase, grilla, store, periodo_key(t1, t2), stats_csv),
+            inputs=[out_clase, grilla],
+            outputs=[store / f"{PARTITION}={periodo_key(t1, t2)}" / PART_FILE, stats_csv],
+            params={"periodo": periodo_key(t1, t2)},
+            deps=["cambios", "grilla_zonas"],
+            code=[codigo["zonal"], codigo["zonal_store"]],
+        )
+    )
+    if red_vial.exists():
+        nodes.append(
+            Node(
+                "vialidad",
+                _etapa_vialidad,
+                (
+                    out_clase,
+                    grilla,
+                    red_vial,
+                    store,
+                    periodo_key(t1, t2),
+                    processed_dir / "cambio_vial.parquet",
+                    processed_dir / "estadisticas_cambio_vial.csv",
+                ),
+                inputs=[out_clase, grilla, red_vial, store / f"{PARTITION}={periodo_key(t1, t2)}" / PART_FILE],
+                outputs=[processed_dir / "cambio_vial.parquet", processed_dir / "estadisticas_cambio_vial.csv"],
+                params={"periodo": periodo_key(t1, t2)},
+                deps=["cambios", "zonal", "grilla_zonas"],
+                code=[codigo["vialidad"], codigo["zonal"], codigo["zonal_store"], codigo["utils"]],
+            )
+        )
+    boundary = vector_dir / "limite_comuna.gpkg"
+    nodes.append(
+        Node(
+            "cache_app",
+            _etapa_cache_app,
+            (store, stats_csv, zonas, boundary, cache_dir),
+            inputs=[store / f"{PARTITION}={periodo_key(*par)}" / PART_FILE for par in [(t1, t2)] + pares]
+            + [zonas]
+            + ([boundary] if boundary.exists() else []),
+            deps=["zonal"] + (["periodos"] if pares else []),
+            code=[codigo["cache"], codigo["utils"]],
+        )
+    )
+    indices_csv = processed_dir / "estadisticas_indices.csv"
+    nodes.append(
+        Node(
+            "bundle",
+            _etapa_bundle,
+            (store, stats_csv, indices_csv, zonas, boundary, processed_dir, cache_dir),
+            inputs=nodes[-1].inputs + [indices_csv] + [indices[year] for year in years],
+            outputs=[cache_dir / "app_bundle" / "manifest.json"],
+            deps=["cache_app", "estadisticas_indices"] + [f"indices_{year}" for year in years],
+            code=[codigo["bundle"], codigo["derived"], codigo["map_layer"], codigo["cache"], codigo["utils"]],
+        )
+    )
+    return nodes
@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from anomalias import fecha_de_ruta
+from cache import file_stamp
+from indices import INDEX_NAMES
+from raster_io import is_scaled, read_scaled
+
+# Lado de los chunks espaciales. Cada chunk guarda todas las fechas e indices de su tesela,
+# pixel por pixel: (TILE, TILE, fechas, indices) float32 = 4 MB con 4 fechas y 4 indices, y
+# los 16 valores de un pixel quedan juntos (64 bytes).
+TILE = 256
+# Version del orden de los datos en cube.npy: un cubo con otra version se reconstruye
+FORMATO = 2
+_DATA = "cube.npy"
+_META = "meta.json"
+
+
+def _as_window(window) -> tuple[int, int, int, int]:
+    """(fila, columna, alto, ancho) de una `rasterio.windows.Window` o de una tupla igual."""
+    if hasattr(window, "row_off"):
+        return int(window.row_off), int(window.col_off), int(window.height), int(window.width)
+    row, col, height, width = window
+    return int(row), int(col), int(height), int(width)
+
+
+class Datacube:
+    """
+    Cubo de indices (fecha, indice, y, x) de todas las fechas de `indices_*.tif`, guardado
+    como un memmap por chunks: `cube.npy` con forma (teselas_y, teselas_x, TILE, TILE,
+    fechas, indices) mas `meta.json` con fechas, nombres de indices (descripciones de banda:
+    NDVI, NDBI, NDWI, BSI), grilla y huella de cada raster de origen.
+
+    Todas las fechas e indices de un pixel son contiguos, asi que `serie` lee un solo tramo
+    de 64 bytes. Una ventana dentro de una tesela son `alto` tramos contiguos del chunk y
+    `leer` la retorna sin copiar (una vista transpuesta a (fechas, indices, alto, ancho));
+    las ventanas que cruzan teselas se arman en un arreglo nuevo. Los pixeles fuera de la
+    escena (relleno de las teselas del borde) valen NaN.
+    """
+
+    def __init__(self, directorio: Path):
+        self.directorio = Path(directorio)
+        self.meta = json.loads((self.directorio / _META).read_text(encoding="utf-8"))
+        if self.meta.get("formato") != FORMATO:
+            raise ValueError(f"El cubo de {self.directorio} tiene otro formato; reconstruirlo con construir_datacube")
+        self.fechas: list[str] = list(self.meta["fechas"])
+        self.indices: list[str] = list(self.meta["indices"])
+        self.height, self.width = self.meta["shape"]
+        self.tile = self.meta["tile"]
+        self.transform = tuple(self.meta["transform"])
+        self.crs_wkt = self.meta["crs_wkt"]
+        self.data = np.load(self.directorio / _DATA, mmap_mode="r")
+
+    @property
+    def shape(self) -> tuple[int, int, int, int]:
+        return len(self.fechas), len(self.indices), self.height, self.width
+
+    def _fecha(self, fecha) -> int:
+        try:
+            return self.fechas.index(str(fecha))
+        except ValueError:
+            raise KeyError(f"La fecha {fecha} no esta en el cubo ({self.fechas})") from None
+
+    def _indice(self, indice) -> int:
+        nombres = [nombre.upper() for nombre in self.indices]
+        try:
+            return nombres.index(str(indice).upper())
+        except ValueError:
+            raise KeyError(f"El indice {indice} no esta en el cubo ({self.indices})") from None
+
+    def _selector(self, values, lookup, nombre: str):
+        # Una etiqueta -> slice de largo 1 (vista); lista -> indices (copia); None -> todo.
+        if values is None:
+            return slice(None)
+        if isinstance(values, (list, tuple)):
+            if not values:
+                raise ValueError(f"La lista de {nombre} esta vacia")
+            return np.array([lookup(v) for v in values])
+        i = lookup(values)
+        return slice(i, i + 1)
+
+    def leer(self, fechas=None, indices=None, window=None) -> np.ndarray:
+        """
+        Arreglo (fechas, indices, alto, ancho). `fechas`/`indices` aceptan una etiqueta, una
+        lista o None (todas); `window` una `Window` de rasterio o (fila, columna, alto, ancho).
+        """
+        sel_f = self._selector(fechas, self._fecha, "fechas")
+        sel_i = self._selector(indices, self._indice, "indices")
+        row, col, height, width = _as_window(window) if window is not None else (0, 0, self.height, self.width)
+        if height <= 0 or width <= 0:
+            raise ValueError(f"La ventana {(row, col, height, width)} no tiene pixeles")
+        if row < 0 or col < 0 or row + height > self.height or col + width > self.width:
+            raise ValueError(f"La ventana {(row, col, height, width)} sale de la grilla {self.height}x{self.width}")
+
+        t = self.tile
+        ty0, tx0 = row // t, col // t
+        ty1, tx1 = (row + height - 1) // t, (col + width - 1) // t
+        if ty0 == ty1 and tx0 == tx1:
+            chunk = self.data[ty0, tx0, row - ty0 * t : row - ty0 * t + height, col - tx0 * t : col - tx0 * t + width]
+            return chunk[:, :, sel_f][:, :, :, sel_i].transpose(2, 3, 0, 1)
+
+        n_f = len(np.arange(len(self.fechas))[sel_f])
+        n_i = len(np.arange(len(self.indices))[sel_i])
+        out = np.empty((n_f, n_i, height, width), dtype=self.data.dtype)
+        for ty in range(ty0, ty1 + 1):
+            r0, r1 = max(row, ty * t), min(row + height, (ty + 1) * t)
+            for tx in range(tx0, tx1 + 1):
+                c0, c1 = max(col, tx * t), min(col + width, (tx + 1) * t)
+                chunk = self.data[ty, tx, r0 - ty * t : r1 - ty * t, c0 - tx * t : c1 - tx * t]
+                out[:, :, r0 - row : r1 - row, c0 - col : c1 - col] = chunk[:, :, sel_f][:, :, :, sel_i].transpose(2, 3, 0, 1)
+        return out
+
+    def serie(self, row: int, col: int, indice=None) -> np.ndarray:
+        """Trayectoria del pixel: (fechas,) para un indice o (fechas, indices) sin indice (vista contigua)."""
+        if not (0 <= row < self.height and 0 <= col < self.width):
+            raise ValueError(f"El pixel ({row}, {col}) esta fuera de la grilla {self.height}x{self.width}")
+        t = self.tile
+        valores = self.data[row // t, col // t, row % t, col % t]
+        return valores if indice is None else valores[:, self._indice(indice)]
+
+    def indice(self, indice, fecha) -> np.ndarray:
+        """Escena completa (alto, ancho) de un indice en una fecha."""
+        return self.leer(fecha, indice)[0, 0]
+
+
+def construir_datacube(rutas: list[Path], directorio: Path, tile: int = TILE, forzar: bool = False) -> Datacube:
+    """
+    Construye (o reutiliza, si ningun raster cambio) el cubo de `rutas` (`indices_<fecha>.tif`
+    en la misma grilla) en `directorio`. Cada raster se lee una vez por franjas de una tesela
+    de alto.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    directorio = Path(directorio)
+    rutas = {fecha_de_ruta(p): Path(p) for p in rutas}
+    if not rutas:
+        raise FileNotFoundError("No hay rasters de indices para el cubo")
+    fechas = sorted(rutas)
+    fuentes = {fecha: file_stamp(rutas[fecha]) for fecha in fechas}
+    meta_path = directorio / _META
+    if not forzar:
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            if meta.get("fuentes") == fuentes and meta.get("tile") == tile and meta.get("formato") == FORMATO:
+                return Datacube(directorio)
+        except (OSError, ValueError):
+            pass
+
+    with rasterio.open(rutas[fechas[0]]) as ref:
+        height, width = ref.shape
+        transform, crs_wkt = tuple(ref.transform)[:6], ref.crs.to_wkt() if ref.crs else ""
+        indices = [d or n for d, n in zip(ref.descriptions, INDEX_NAMES)] if ref.count == len(INDEX_NAMES) else None
+        indices = indices or [d or f"B{i + 1}" for i, d in enumerate(ref.descriptions)]
+
+    directorio.mkdir(parents=True, exist_ok=True)
+    # Sin meta.json el cubo no se abre: una construccion interrumpida nunca se lee a medias.
+    meta_path.unlink(missing_ok=True)
+    n_ty, n_tx = -(-height // tile), -(-width // tile)
+    tmp = directorio / (_DATA + ".tmp")
+    cube = np.lib.format.open_memmap(
+        tmp, mode="w+", dtype=np.float32, shape=(n_ty, n_tx, tile, tile, len(fechas), len(indices))
+    )
+    buffer = np.empty((tile, tile, len(indices)), dtype=np.float32)
+    for k, fecha in enumerate(fechas):
+        with rasterio.open(rutas[fecha]) as src:
+            if src.shape != (height, width) or not np.allclose(tuple(src.transform)[:6], transform) or src.count != len(indices):
+                raise ValueError(f"{rutas[fecha]} no esta en la misma grilla que {rutas[fechas[0]]}")
+            for ty in range(n_ty):
+                h = min(tile, height - ty * tile)
+                franja = read_scaled(src, window=Window(0, ty * tile, width, h), out_dtype=np.float32)
+                if src.nodata is not None and not np.isnan(src.nodata) and not is_scaled(src):
+                    franja[franja == src.nodata] = np.nan
+                for tx in range(n_tx):
+                    w = min(tile, width - tx * tile)
+                    if h < tile or w < tile:
+                        buffer.fill(np.nan)
+                    buffer[:h, :w] = franja[:, :, tx * tile : tx * tile + w].transpose(1, 2, 0)
+                    cube[ty, tx, :, :, k] = buffer
+    cube.flush()
+    del cube
+    os.replace(tmp, directorio / _DATA)
+
+    meta = {
+        "formato": FORMATO,
+        "fechas": fechas,
+        "indices": indices,
+        "shape": [height, width],
+        "tile": tile,
+        "transform": list(transform),
+        "crs_wkt": crs_wkt,
+        "fuentes": fuentes,
+    }
+    tmp_meta = directorio / (_META + ".tmp")
+    tmp_meta.write_text(json.dumps(meta, indent=1), encoding="utf-8")
+    os.replace(tmp_meta, meta_path)
+    return Datacube(directorio)
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import cached_property
+
+import pandas as pd
+
+import perf
+from cache import ZoneCache
+from config import STATS_COLUMNS
+from utils import DataPaths, join_stats, load_stats
+
+# CRS de despliegue del mapa
+MAP_CRS = "EPSG:4326"
+ZONE_LABEL_DIGITS = 6
+
+
+@dataclass(frozen=True)
+class MapView:
+    center: tuple[float, float]
+    bounds: tuple[float, float, float, float]
+
+
+@perf.medido("derived.map_view")
+def map_view(zones) -> MapView | None:
+    """Centro (promedio de centroides, lat/lon) y extension (minx, miny, maxx, maxy) de las zonas."""
+    if zones is None or zones.empty:
+        return None
+    # Centroides en un CRS proyectado (UTM local) y de vuelta a coordenadas del mapa
+    geoms = zones.geometry
+    if geoms.crs is not None and geoms.crs.is_geographic:
+        centroids = geoms.to_crs(geoms.estimate_utm_crs()).centroid.to_crs(geoms.crs)
+    else:
+        centroids = geoms.centroid
+    return MapView((float(centroids.y.mean()), float(centroids.x.mean())), tuple(float(v) for v in zones.total_bounds))
+
+
+def top_zones(stats: pd.DataFrame, metric: str, n: int = 10) -> pd.DataFrame:
+    """Las `n` zonas con mayor `metric`, con la etiqueta corta usada en el grafico."""
+    top = stats.nlargest(n, metric)[["zona", metric]].copy()
+    top["zona"] = top["zona"].astype(str)
+    top["zona_label"] = top["zona"].str[-ZONE_LABEL_DIGITS:]
+    return top
+
+
+class ChangeView:
+    """
+    Estadisticas de cambio por zona (total o de un par de fechas) y sus derivados:
+    zonas unidas, totales, top-N por metrica, CSV de descarga y capa del mapa.
+    Cada derivado se calcula una vez y queda guardado en la instancia. `stats` puede traer
+    solo las columnas que se muestran; con `paths` el CSV de descarga se arma con la tabla
+    completa del `periodo` (conteos por clase incluidos).
+    """
+
+    def __init__(
+        self,
+        stats: pd.DataFrame | None,
+        zones,
+        join_column: str | None,
+        paths: DataPaths | None = None,
+        periodo: str | None = None,
+    ):
+        self.stats = stats
+        self.zones = zones
+        self.join_column = join_column
+        self.paths = paths
+        self.periodo = periodo
+        self._top: dict[tuple[str, int], pd.DataFrame] = {}
+        self._map_data: dict[tuple[str, ...], object] = {}
+
+    @cached_property
+    def zones_joined(self):
+        return join_stats(self.zones, self.stats, self.join_column)
+
+    @cached_property
+    def totals(self) -> dict[str, float]:
+        if self.stats is None:
+            return {}
+        return {col: float(self.stats[col].sum()) for col in self.stats.columns if col.endswith("_ha")}
+
+    @cached_property
+    @perf.medido("derived.stats_csv")
+    def stats_csv(self) -> str | None:
+        if self.stats is None:
+            return None
+        stats = self.stats if self.paths is None else load_stats(self.paths, self.periodo)
+        return stats.to_csv(index=False)
+
+    def map_data(self, columns: tuple[str, ...]):
+        """Capa del mapa (ver map_layer.MapData) con la geometria ya simplificada y serializable."""
+        from map_layer import MapData
+
+        if self.zones_joined is None or self.zones_joined.empty:
+            return None
+        perf.contar("derived.map_data", columns in self._map_data)
+        if columns not in self._map_data:
+            self._map_data[columns] = MapData(self.zones_joined, list(columns), self.join_column)
+        return self._map_data[columns]
+
+    def top(self, metric: str, n: int = 10) -> pd.DataFrame | None:
+        if self.stats is None or metric not in self.stats.columns:
+            return None
+        key = (metric, n)
+        perf.contar("derived.top", key in self._top)
+        if key not in self._top:
+            self._top[key] = top_zones(self.stats, metric, n)
+        return self._top[key]
+
+
+class DerivedData:
+    """
+    Grafo de datos derivados del dashboard para una version de los insumos.
+
+    Cada nodo se calcula la primera vez que se pide y queda guardado en la instancia:
+    estadisticas -> zonas/limite reproyectados -> columna de union -> vistas de cambio
+    (total y por par de fechas) -> zonas unidas, totales y top-N por metrica. La app guarda
+    una instancia por `ZoneCache.data_version()`, de modo que un rerun solo repite el trabajo
+    de los widgets. Los resultados se comparten entre sesiones y no deben modificarse.
+    """
+
+    def __init__(self, zone_cache: ZoneCache, version: str):
+        self.zone_cache = zone_cache
+        self.version = version
+        self._periodos: dict[str, ChangeView] = {}
+
+    @cached_property
+    def stats(self) -> pd.DataFrame | None:
+        if not self.periodos and not self.zone_cache.paths.stats_csv.exists():
+            return None
+        return load_stats(self.zone_cache.paths, columns=STATS_COLUMNS)
+
+    @cached_property
+    def periodos(self) -> list[str]:
+        """Periodos `<t1>_<t2>` disponibles en el almacen de estadisticas zonales."""
+        from zonal_store import list_periodos
+
+        return list_periodos(self.zone_cache.paths.stats_store)
+
+    @cached_property
+    def zones(self):
+        return self.zone_cache.zones(crs=MAP_CRS)
+
+    @cached_property
+    def boundary(self):
+        return self.zone_cache.boundary(crs=MAP_CRS)
+
+    @cached_property
+    def join_column(self) -> str | None:
+        stats = self.stats
+        if stats is None or self.zones is None:
+            return None
+        return self.zone_cache.join_column(stats, self.zones)
+
+    @cached_property
+    def view(self) -> MapView | None:
+        return map_view(self.zones)
+
+    @cached_property
+    def total(self) -> ChangeView:
+        """Cambio del periodo de mayor extension (o de estadisticas_cambio.csv si no hay almacen)."""
+        return ChangeView(self.stats, self.zones, self.join_column, self.zone_cache.paths)
+
+    def periodo(self, t1, t2) -> ChangeView | None:
+        """Cambio entre dos fechas desde el almacen por periodo; None si el par no esta calculado."""
+        from zonal_store import periodo_key
+
+        key = periodo_key(t1, t2)
+        if key not in self.periodos:
+            return None
+        perf.contar("derived.periodo", key in self._periodos)
+        if key not in self._periodos:
+            stats = load_stats(self.zone_cache.paths, key, STATS_COLUMNS)
+            self._periodos[key] = ChangeView(stats, self.zones, self.join_column, self.zone_cache.paths, key)
+        return self._periodos[key]
@@ -0,0 +1,201 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from raster_io import INT16_NODATA, INT16_OFFSET, INT16_SCALE, CogWriter, quantize_int16
+
+INDEX_NAMES = ("NDVI", "NDBI", "NDWI", "BSI")
+# "float32" o "int16" cuantizado con scale/offset (la mitad de bytes; ver raster_io.quantize_int16)
+INDEX_FORMATS = ("float32", "int16")
+REFLECTANCE_SCALE = 10000
+EPS = 1e-10
+
+
+@dataclass
+class RunningMoments:
+    """Media y desviacion (ddof=0) acumuladas por bloques, ignorando NaN."""
+
+    count: int = 0
+    mean: float = 0.0
+    m2: float = 0.0
+
+    @classmethod
+    def from_block(cls, values: np.ndarray) -> "RunningMoments":
+        valid = values[~np.isnan(values)]
+        if valid.size == 0:
+            return cls()
+        mean = float(valid.mean(dtype=np.float64))
+        m2 = float(np.square(valid - mean, dtype=np.float64).sum())
+        return cls(int(valid.size), mean, m2)
+
+    def merge(self, other: "RunningMoments") -> None:
+        # Combinacion de Chan et al.: permite sumar bloques en una sola pasada.
+        if other.count == 0:
+            return
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            return
+        total = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / total
+        self.m2 += other.m2 + delta * delta * self.count * other.count / total
+        self.count = total
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / self.count)) if self.count else float("nan")
+
+
+@dataclass
+class IndexStats:
+    moments: dict[str, RunningMoments] = field(
+        default_factory=lambda: {name: RunningMoments() for name in INDEX_NAMES}
+    )
+
+    def update(self, block: np.ndarray) -> None:
+        for i, name in enumerate(INDEX_NAMES):
+            self.moments[name].merge(RunningMoments.from_block(block[i]))
+
+    def merge(self, other: "IndexStats") -> None:
+        for name in INDEX_NAMES:
+            self.moments[name].merge(other.moments[name])
+
+    def as_row(self) -> dict[str, float]:
+        # Mismo orden de columnas que estadisticas_indices.csv
+        row = {}
+        for name in INDEX_NAMES:
+            moments = self.moments[name]
+            row[f"{name.lower()}_mean"] = moments.mean if moments.count else float("nan")
+        for name in INDEX_NAMES:
+            row[f"{name.lower()}_std"] = self.moments[name].std
+        return row
+
+
+class IndexBlockComputer:
+    """Calcula los cuatro indices de un bloque reutilizando buffers preasignados."""
+
+    def __init__(self, max_height: int, max_width: int):
+        shape = (max_height, max_width)
+        self._bands = np.empty((5,) + shape, dtype="float32")
+        self._tmp = np.empty((2,) + shape, dtype="float32")
+        self._out = np.empty((len(INDEX_NAMES),) + shape, dtype="float32")
+
+    def compute(self, raw: np.ndarray) -> np.ndarray:
+        """
+        raw: bandas (B2, B3, B4, B8, B11) del bloque, en el orden exportado desde GEE.
+        Retorna una vista (4, alto, ancho) con NDVI, NDBI, NDWI y BSI.
+        """
+        h, w = raw.shape[1:]
+        bands = self._bands[:, :h, :w]
+        num, den = self._tmp[0, :h, :w], self._tmp[1, :h, :w]
+        out = self._out[:, :h, :w]
+
+        np.copyto(bands, raw[:5], casting="unsafe")
+        bands /= REFLECTANCE_SCALE
+        blue, green, red, nir, swir = bands
+
+        _normalized(nir, red, num, den, out[0])
+        _normalized(swir, nir, num, den, out[1])
+        _normalized(green, nir, num, den, out[2])
+        # BSI: ((swir + red) - (nir + blue)) / ((swir + red) + (nir + blue) + eps)
+        # green ya no se usa y blue se consume antes de sobrescribirlo.
+        np.add(nir, blue, out=bands[1])
+        np.add(swir, red, out=bands[0])
+        _normalized(bands[0], bands[1], num, den, out[3])
+        return out
+
+
+def _normalized(a: np.ndarray, b: np.ndarray, num: np.ndarray, den: np.ndarray, dst: np.ndarray) -> None:
+    # (a - b) / (a + b + eps), mismo orden de operaciones que el notebook
+    np.subtract(a, b, out=num)
+    np.add(a, b, out=den)
+    den += EPS
+    np.divide(num, den, out=dst)
+
+
+def index_profile(src_profile: dict, formato: str = "float32") -> dict:
+    if formato not in INDEX_FORMATS:
+        raise ValueError(f"Formato de indices desconocido: {formato} (opciones: {INDEX_FORMATS})")
+    profile = dict(src_profile)
+    profile.update(count=len(INDEX_NAMES), dtype=formato)
+    if formato == "int16":
+        profile["nodata"] = INT16_NODATA
+    return profile
+
+
+def index_writer(path: Path, src_profile: dict, formato: str = "float32") -> CogWriter:
+    """CogWriter de un raster de indices; en int16 guarda scale/offset en cada banda."""
+    profile = index_profile(src_profile, formato)
+    if formato == "int16":
+        n = len(INDEX_NAMES)
+        return CogWriter(path, profile, INDEX_NAMES, scales=(INT16_SCALE,) * n, offsets=(INT16_OFFSET,) * n)
+    return CogWriter(path, profile, INDEX_NAMES)
+
+
+def encode_block(block: np.ndarray, formato: str = "float32") -> np.ndarray:
+    """Bloque (4, alto, ancho) de indices en el tipo que se escribe segun `formato`."""
+    return quantize_int16(block) if formato == "int16" else block
+
+
+def _max_block_shape(windows) -> tuple[int, int]:
+    heights = [w.height for w in windows]
+    widths = [w.width for w in windows]
+    return max(heights, default=1), max(widths, default=1)
+
+
+def calcular_indices(ruta_imagen: Path, ruta_salida: Path, formato: str = "float32") -> dict[str, float]:
+    """
+    Calcula indices espectrales para una imagen Sentinel-2 recorriendo sus bloques internos.
+
+    Bandas Sentinel-2 (10m): B2=Blue, B3=Green, B4=Red, B8=NIR
+    Bandas Sentinel-2 (20m): B11=SWIR1, B12=SWIR2
+    El archivo exportado desde GEE tiene las bandas en el orden: B2,B3,B4,B8,B11,B12.
+
+    Escribe `ruta_salida` (COG) bloque a bloque y retorna media/desviacion de cada indice,
+    acumuladas en la misma lectura. La memoria depende del tamano de bloque, no de la escena.
+    Con `formato="int16"` el raster se guarda cuantizado (las estadisticas usan los valores
+    sin cuantizar).
+    """
+    import rasterio
+
+    stats = IndexStats()
+    with rasterio.open(ruta_imagen) as src:
+        windows = [window for _, window in src.block_windows(1)]
+        computer = IndexBlockComputer(*_max_block_shape(windows))
+        with index_writer(ruta_salida, src.profile, formato) as dst:
+            for window in windows:
+                block = computer.compute(src.read([1, 2, 3, 4, 5], window=window))
+                dst.write(encode_block(block, formato), window=window)
+                stats.update(block)
+    return stats.as_row()
+
+
+def year_from_path(path: Path) -> str:
+    return path.stem.split("_")[1]
+
+
+def calcular_indices_directorio(
+    raw_dir: Path, processed_dir: Path, pattern: str = "sentinel2_*.tif", formato: str = "float32"
+) -> pd.DataFrame:
+    """Procesa todas las imagenes de `raw_dir` y guarda estadisticas_indices.csv."""
+    imagenes = sorted(raw_dir.glob(pattern))
+    if not imagenes:
+        raise FileNotFoundError(f"No se encontraron archivos {pattern} en {raw_dir}")
+    processed_dir.mkdir(parents=True, exist_ok=True)
+
+    stats = {}
+    for img in imagenes:
+        year = year_from_path(img)
+        stats[year] = calcular_indices(img, processed_dir / f"indices_{year}.tif", formato)
+        print(f"Procesado {year}: NDVI medio = {stats[year]['ndvi_mean']:.3f}")
+    return save_indices_stats(stats, processed_dir)
+
+
+def save_indices_stats(stats: dict[str, dict[str, float]], processed_dir: Path) -> pd.DataFrame:
+    df_stats = pd.DataFrame.from_dict(stats, orient="index").sort_index()
+    df_stats.to_csv(processed_dir / "estadisticas_indices.csv", index=True)
+    return df_stats
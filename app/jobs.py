@@ -0,0 +1,173 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+from config import JOB_RESULTS, JOB_WORKERS
+
+PENDIENTE = "pendiente"
+EJECUTANDO = "ejecutando"
+LISTO = "listo"
+ERROR = "error"
+CANCELADO = "cancelado"
+TERMINADOS = (LISTO, ERROR, CANCELADO)
+
+
+class Cancelado(Exception):
+    """Se lanza desde `Job.avanzar` cuando se pidio cancelar el trabajo."""
+
+
+@dataclass
+class Job:
+    """Estado de un calculo en segundo plano; lo comparten todas las sesiones que lo pidieron."""
+
+    key: tuple
+    descripcion: str
+    estado: str = PENDIENTE
+    progreso: float = 0.0
+    resultado: object = None
+    error: str | None = None
+    inicio: float = field(default_factory=time.time)
+    fin: float | None = None
+    _cancelar: threading.Event = field(default_factory=threading.Event, repr=False)
+    _future: Future | None = field(default=None, repr=False)
+
+    @property
+    def terminado(self) -> bool:
+        return self.estado in TERMINADOS
+
+    @property
+    def cancelado(self) -> bool:
+        return self._cancelar.is_set()
+
+    def avanzar(self, fraccion: float) -> None:
+        """Callback de progreso de la tarea; corta el calculo si se pidio cancelar."""
+        if self._cancelar.is_set():
+            raise Cancelado(self.descripcion)
+        self.progreso = min(max(float(fraccion), 0.0), 1.0)
+
+
+class JobManager:
+    """
+    Ejecutor de calculos en segundo plano compartido por las sesiones de la app (una instancia
+    por proceso, via `st.cache_resource`). Cada trabajo se identifica por una clave: pedir una
+    clave en curso retorna el mismo `Job` (un solo calculo para todos los usuarios), y los
+    resultados terminados quedan en una cache LRU de `max_resultados` entradas.
+
+    Los hilos alcanzan porque el calculo (lectura GDAL y numpy por bloques) libera el GIL, y
+    los resultados quedan en memoria del proceso, donde la app los usa sin copiarlos.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS, max_resultados: int = JOB_RESULTS):
+        self._executor = ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._en_curso: dict[tuple, Job] = {}
+        self._resultados: OrderedDict[tuple, Job] = OrderedDict()
+        self.max_resultados = max(max_resultados, 1)
+
+    def get(self, key: tuple) -> Job | None:
+        """Trabajo en curso o terminado con `key` (lo marca como usado en la cache LRU)."""
+        with self._lock:
+            job = self._en_curso.get(key)
+            if job is None and key in self._resultados:
+                self._resultados.move_to_end(key)
+                job = self._resultados[key]
+            return job
+
+    def submit(self, key: tuple, fn: Callable, *args, descripcion: str = "", **kwargs) -> Job:
+        """
+        Lanza `fn(*args, job=job, **kwargs)` salvo que `key` ya este en curso o con resultado.
+        Un trabajo con error o cancelado se vuelve a lanzar. `fn` debe llamar `job.avanzar`
+        para informar el progreso y permitir la cancelacion.
+        """
+        with self._lock:
+            job = self._en_curso.get(key) or self._resultados.get(key)
+            if job is not None and job.estado not in (ERROR, CANCELADO):
+                if key in self._resultados:
+                    self._resultados.move_to_end(key)
+                return job
+            self._resultados.pop(key, None)
+            job = Job(key, descripcion or str(key))
+            self._en_curso[key] = job
+            job._future = self._executor.submit(self._run, job, fn, args, kwargs)
+            return job
+
+    def cancel(self, key: tuple) -> bool:
+        """Pide cancelar el trabajo en curso; un trabajo aun en cola no llega a ejecutarse."""
+        with self._lock:
+            job = self._en_curso.get(key)
+            if job is None:
+                return False
+            job._cancelar.set()
+            if job._future is not None and job._future.cancel():
+                self._terminar(job, CANCELADO)
+            return True
+
+    def jobs(self) -> list[Job]:
+        """Trabajos en curso y resultados guardados, del mas antiguo al mas reciente."""
+        with self._lock:
+            return sorted([*self._en_curso.values(), *self._resultados.values()], key=lambda job: job.inicio)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for job in self._en_curso.values():
+                job._cancelar.set()
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+    def _run(self, job: Job, fn: Callable, args: tuple, kwargs: dict) -> None:
+        job.estado = EJECUTANDO
+        try:
+            job.avanzar(0.0)
+            resultado = fn(*args, job=job, **kwargs)
+        except Cancelado:
+            estado = CANCELADO
+        except Exception as exc:  # noqa: BLE001 - el error se muestra en la app
+            job.error = f"{type(exc).__name__}: {exc}"
+            estado = ERROR
+        else:
+            job.resultado, job.progreso = resultado, 1.0
+            estado = LISTO
+        with self._lock:
+            self._terminar(job, estado)
+
+    def _terminar(self, job: Job, estado: str) -> None:
+        # Llamar con el lock tomado
+        job.estado, job.fin = estado, time.time()
+        self._en_curso.pop(job.key, None)
+        self._resultados[job.key] = job
+        while len(self._resultados) > self.max_resultados:
+            self._resultados.popitem(last=False)
+
+
+# --- Tareas de la app ----------------------------------------------------------------
+
+
+def cambio_periodo(
+    ruta_t1: Path,
+    ruta_t2: Path,
+    zone_cache,
+    umbrales: dict | None = None,
+    columna_zona: str = "MANZENT",
+    job: Job | None = None,
+):
+    """
+    Detecta el cambio entre dos rasters de indices y lo resume por zona (mismas columnas que
+    el almacen por periodo), en un recorrido por bloques y sin escribir rasters.
+    """
+    from multiperiodo import cambios_periodos
+    from zonal_store import to_table
+
+    grid = zone_cache.label_grid(ruta_t1, columna_zona)
+    if grid is None:
+        raise FileNotFoundError(f"No se encontraron las zonas {zone_cache.paths.zones_shp}")
+    if job is not None:
+        job.avanzar(0.05)
+    rutas = {"t1": ruta_t1, "t2": ruta_t2}
+    progreso = None if job is None else (lambda fraccion: job.avanzar(0.05 + 0.9 * fraccion))
+    resultado = cambios_periodos(rutas, grid, [("t1", "t2")], umbrales, progreso=progreso)
+    return to_table(resultado.tabla("t1", "t2")).to_pandas()
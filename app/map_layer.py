@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import json
+
+import numpy as np
+from branca.element import MacroElement
+from folium.map import Layer
+from jinja2 import Template
+
+import perf
+
+# Paleta YlOrRd de 9 colores (la misma de plotly que usaba el estilo en Python)
+PALETTE = [
+    "rgb(255,255,204)",
+    "rgb(255,237,160)",
+    "rgb(254,217,118)",
+    "rgb(254,178,76)",
+    "rgb(253,141,60)",
+    "rgb(252,78,42)",
+    "rgb(227,26,28)",
+    "rgb(189,0,38)",
+    "rgb(128,0,38)",
+]
+# Decimales de las coordenadas en grados: 1e-6 ~ 0.1 m
+COORD_PRECISION = 6
+
+
+def tolerance_for_zoom(zoom: int) -> float:
+    """Tolerancia de simplificacion (grados) equivalente a medio pixel de pantalla en `zoom`."""
+    return 0.5 * 360.0 / (256 * 2**zoom)
+
+
+def simplify_coverage(geometries, tolerance: float):
+    """
+    Simplifica preservando la topologia. Con shapely >= 2.1 se usa `coverage_simplify`,
+    que mantiene compartidos los bordes entre manzanas vecinas.
+    """
+    import shapely
+
+    geoms = np.asarray(geometries)
+    if hasattr(shapely, "coverage_simplify"):
+        try:
+            return shapely.coverage_simplify(geoms, tolerance)
+        except shapely.errors.GEOSException:
+            pass
+    return shapely.simplify(geoms, tolerance, preserve_topology=True)
+
+
+class MapData:
+    """
+    Capa de datos del mapa de cambios: una sola FeatureCollection con la geometria simplificada
+    para un zoom y solo las columnas que usa el mapa. La app y el bundle piden un unico nivel
+    (config.MAP_DETAIL_ZOOM); cada zoom pedido se serializa una vez y se reutiliza.
+    """
+
+    def __init__(self, zones, columns: list[str], id_column: str | None = None):
+        keep = [c for c in ([id_column] if id_column else []) + columns if c in zones.columns]
+        self.columns = [c for c in columns if c in zones.columns]
+        self.id_column = id_column if id_column in zones.columns else None
+        self._zones = zones[keep + [zones.geometry.name]]
+        self._levels: dict[int, str] = {}
+
+    def value_range(self, column: str) -> tuple[float, float]:
+        values = self._zones[column].fillna(0)
+        vmin, vmax = float(values.min()), float(values.max())
+        if vmin == vmax:
+            vmin, vmax = 0.0, max(vmax, 1.0)
+        return vmin, vmax
+
+    def geojson(self, zoom: int) -> str:
+        perf.contar("map_layer.geojson", zoom in self._levels)
+        if zoom not in self._levels:
+            self._levels[zoom] = self._serialize(tolerance_for_zoom(zoom))
+        return self._levels[zoom]
+
+    @perf.medido("map_layer.geojson")
+    def _serialize(self, tolerance: float) -> str:
+        import shapely
+
+        with perf.medir("map_layer.simplify"):
+            geoms = simplify_coverage(self._zones.geometry.to_numpy(), tolerance)
+            geoms = shapely.set_precision(geoms, 10**-COORD_PRECISION)
+        props = self._zones.drop(columns=self._zones.geometry.name)
+        records = props.astype(object).where(props.notna(), None).to_dict("records")
+        features = [
+            {"type": "Feature", "properties": rec, "geometry": json.loads(shapely.to_geojson(geom))}
+            for rec, geom in zip(records, geoms)
+            if geom is not None and not shapely.is_empty(geom)
+        ]
+        return json.dumps({"type": "FeatureCollection", "features": features}, separators=(",", ":"))
+
+    def add_to(self, mapa, layers: dict[str, str], zoom: int, tooltip_aliases: dict[str, str] | None = None):
+        """
+        Agrega la FeatureCollection una sola vez al mapa y una capa por columna en `layers`
+        ({nombre visible: columna}); cada capa se colorea en el navegador desde sus propiedades.
+        """
+        data = GeoJsonData(self.geojson(zoom)).add_to(mapa)
+        available = set(self.columns) | {self.id_column}
+        tooltip = {field: alias for field, alias in (tooltip_aliases or {}).items() if field in available}
+        for name, column in layers.items():
+            if column not in self.columns:
+                continue
+            ChoroplethLayer(data, column, self.value_range(column), name, tooltip).add_to(mapa)
+        return data
+
+
+class SerializedMapData(MapData):
+    """MapData ya serializada (ver bundle.py): FeatureCollection fija y rango de cada columna."""
+
+    def __init__(self, geojson: str, columns: list[str], id_column: str | None, ranges: dict[str, tuple[float, float]]):
+        self.columns = list(columns)
+        self.id_column = id_column
+        self._geojson = geojson
+        self._ranges = ranges
+
+    def value_range(self, column: str) -> tuple[float, float]:
+        vmin, vmax = self._ranges[column]
+        return float(vmin), float(vmax)
+
+    def geojson(self, zoom: int) -> str:
+        return self._geojson
+
+
+class GeoJsonData(MacroElement):
+    """Declara la FeatureCollection como variable JS para que varias capas la compartan."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = {{ this.data }};
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, data: str):
+        super().__init__()
+        self._name = "GeoJsonData"
+        self.data = data
+
+
+class ChoroplethLayer(Layer):
+    """Capa coropletica sobre una GeoJsonData compartida, con estilo calculado en el cliente."""
+
+    _template = Template(
+        """
+        {% macro script(this, kwargs) %}
+        var {{ this.get_name() }} = L.geoJson({{ this.data.get_name() }}, {
+            style: function(feature) {
+                var value = feature.properties[{{ this.column|tojson }}];
+                if (value === null || value === undefined) {
+                    return {fillColor: "#dddddd", color: "#333333", weight: 0.5, fillOpacity: 0.2};
+                }
+                var vmin = {{ this.vmin }}, vmax = {{ this.vmax }};
+                var scaled = vmax != vmin ? (value - vmin) / (vmax - vmin) : 0;
+                var idx = Math.max(0, Math.min(8, Math.round(scaled * 8)));
+                var palette = {{ this.palette|tojson }};
+                return {fillColor: palette[idx], color: "#333333", weight: 0.5, fillOpacity: 0.6};
+            },
+            onEachFeature: function(feature, layer) {
+                var fields = {{ this.tooltip|tojson }};
+                var rows = fields.map(function(f) {
+                    var v = feature.properties[f[0]];
+                    return "<tr><th>" + f[1] + "</th><td>" + (v === null || v === undefined ? "" : v) + "</td></tr>";
+                });
+                if (rows.length) { layer.bindTooltip("<table>" + rows.join("") + "</table>", {sticky: true}); }
+            }
+        });
+        {% if this.show %}{{ this.get_name() }}.addTo({{ this._parent.get_name() }});{% endif %}
+        {% endmacro %}
+        """
+    )
+
+    def __init__(self, data: GeoJsonData, column: str, value_range: tuple[float, float], name: str, tooltip: dict[str, str]):
+        super().__init__(name=name, overlay=True, control=True, show=True)
+        self._name = "ChoroplethLayer"
+        self.data = data
+        self.column = column
+        self.vmin, self.vmax = value_range
+        self.palette = PALETTE
+        self.tooltip = [[field, alias] for field, alias in tooltip.items()]
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from itertools import combinations
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+import pandas as pd
+
+from change import CLASE_DESCRIPTIONS, TAG_T1, TAG_T2, ClasificadorCambio, leer_bloque_indices, output_profiles
+from raster_io import CogWriter
+from zonal import N_CLASES, ZoneGrid, tabla_zonal
+
+MODOS_PARES = ("todos", "consecutivos")
+
+
+def pares_periodos(fechas: list[str], modo: str = "todos") -> list[tuple[str, str]]:
+    """
+    Pares (t1, t2) con t1 < t2. "todos": cada par ordenado de fechas;
+    "consecutivos": pares consecutivos mas el acumulado primera -> ultima.
+    """
+    fechas = sorted(fechas)
+    if modo == "todos":
+        return list(combinations(fechas, 2))
+    if modo == "consecutivos":
+        pares = list(zip(fechas[:-1], fechas[1:]))
+        if len(fechas) > 2:
+            pares.append((fechas[0], fechas[-1]))
+        return pares
+    raise ValueError(f"Modo de pares desconocido: {modo} (opciones: {MODOS_PARES})")
+
+
+@dataclass
+class CambiosPeriodos:
+    """
+    Conteos de pixeles por (par de fechas, zona, clase de cambio), en un arreglo
+    (n_pares, n_zonas, n_clases). Permite armar la tabla zonal de cualquier par sin volver
+    a leer rasters; `zonal_store.write_periodo` la guarda como particion del almacen.
+    """
+
+    pares: list[tuple[str, str]]
+    zone_ids: np.ndarray
+    counts: np.ndarray
+
+    def tiene(self, t1, t2) -> bool:
+        return (str(t1), str(t2)) in self._index
+
+    @property
+    def _index(self) -> dict[tuple[str, str], int]:
+        return {par: i for i, par in enumerate(self.pares)}
+
+    def tabla(self, t1, t2) -> pd.DataFrame:
+        """Tabla zonal del par con las mismas columnas que estadisticas_cambio.csv."""
+        i = self._index.get((str(t1), str(t2)))
+        if i is None:
+            raise KeyError(f"No hay cambios calculados para {t1}-{t2}")
+        return tabla_zonal(self.counts[i], self.zone_ids)
+
+
+def cambios_periodos(
+    rutas: dict[str, Path],
+    grid: ZoneGrid,
+    pares: list[tuple[str, str]],
+    umbrales=None,
+    out_dir: Path | None = None,
+    progreso: Callable[[float], None] | None = None,
+) -> CambiosPeriodos:
+    """
+    Clasifica el cambio de todos los `pares` en un solo recorrido por bloques: cada bloque
+    de cada fecha se lee una vez y se reutiliza en todos los pares en que participa. Los
+    conteos por zona salen de un `np.bincount` por par y bloque sobre la grilla de etiquetas.
+    Con `out_dir` tambien escribe `cambio_clasificado_<t1>_<t2>.tif` por par. `progreso`
+    recibe la fraccion de bloques procesados; si lanza una excepcion el recorrido se corta
+    (asi se cancela un calculo en curso, ver `jobs.JobManager`).
+    """
+    import rasterio
+
+    fechas = sorted({fecha for par in pares for fecha in par})
+    faltan = [fecha for fecha in fechas if fecha not in rutas]
+    if faltan:
+        raise FileNotFoundError(f"Faltan rasters de indices para: {faltan}")
+
+    n_bins = (grid.n_zones + 1) * N_CLASES
+    counts = np.zeros((len(pares), n_bins), dtype=np.int64)
+    clasificador = ClasificadorCambio(umbrales)
+    sources = {fecha: rasterio.open(rutas[fecha]) for fecha in fechas}
+    writers = []
+    try:
+        ref = sources[fechas[0]]
+        for fecha, src in sources.items():
+            if not grid.matches(src.transform, src.shape, src.crs.to_wkt() if src.crs else ""):
+                raise ValueError(f"La grilla de zonas no esta alineada con {rutas[fecha]}")
+        if out_dir is not None:
+            clase_profile, _ = output_profiles(ref.profile)
+            writers = [
+                CogWriter(
+                    out_dir / f"cambio_clasificado_{t1}_{t2}.tif",
+                    clase_profile,
+                    CLASE_DESCRIPTIONS,
+                    categorical=True,
+                    tags={TAG_T1: t1, TAG_T2: t2},
+                )
+                for t1, t2 in pares
+            ]
+
+        clase = np.empty(ref.block_shapes[0], dtype=np.uint8)
+        windows = [window for _, window in ref.block_windows(1)]
+        for k, window in enumerate(windows):
+            bloques = {fecha: leer_bloque_indices(src, window) for fecha, src in sources.items()}
+            row, col = int(window.row_off), int(window.col_off)
+            labels = grid.labels[row : row + window.height, col : col + window.width]
+            valid = labels > 0
+            base = labels[valid].astype(np.int64) * N_CLASES
+            out = clase[: window.height, : window.width]
+            for i, (t1, t2) in enumerate(pares):
+                clasificador.clasificar(bloques[t1], bloques[t2], out=out)
+                if writers:
+                    writers[i].write(out, 1, window=window)
+                counts[i] += np.bincount(base + out[valid], minlength=n_bins)
+            if progreso is not None:
+                progreso((k + 1) / len(windows))
+        for writer in writers:
+            writer.close()
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    finally:
+        for src in sources.values():
+            src.close()
+
+    counts = counts.reshape(len(pares), grid.n_zones + 1, N_CLASES)[:, 1:]
+    # int32 alcanza para conteos por zona y reduce el archivo a la mitad
+    dtype = np.int32 if counts.max(initial=0) < np.iinfo(np.int32).max else np.int64
+    return CambiosPeriodos([(str(t1), str(t2)) for t1, t2 in pares], grid.zone_ids, counts.astype(dtype))
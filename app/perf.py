@@ -0,0 +1,192 @@
+from __future__ import annotations
+
+import json
+import os
+import time
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from functools import wraps
+from pathlib import Path
+
+from config import CACHE_DIR
+
+# APP_PERF=1 activa la medicion en todas las ejecuciones; APP_PERF_LOG cambia el archivo
+# JSONL donde se agrega una linea por ejecucion medida.
+ENV_ENABLED = "APP_PERF"
+ENV_LOG = "APP_PERF_LOG"
+DEFAULT_LOG = CACHE_DIR / "rendimiento.jsonl"
+
+_NULL = nullcontext()
+_actual: ContextVar["Perfil | None"] = ContextVar("perfil", default=None)
+try:
+    _PAGE_MB = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+except (AttributeError, ValueError, OSError):
+    _PAGE_MB = None
+
+
+def _rss_mb() -> float | None:
+    """RSS actual del proceso (MB); None si la plataforma no expone /proc."""
+    if _PAGE_MB is None:
+        return None
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_MB
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def env_enabled() -> bool:
+    return os.environ.get(ENV_ENABLED, "").lower() in ("1", "true", "si", "yes")
+
+
+def log_path() -> Path:
+    return Path(os.environ.get(ENV_LOG) or DEFAULT_LOG)
+
+
+@dataclass
+class Medicion:
+    nombre: str
+    segundos: float
+    rss_mb: float | None
+    rss_delta_mb: float | None
+    nivel: int
+
+
+class Perfil:
+    """Mediciones (tiempo y RSS) y contadores de cache de una ejecucion del script."""
+
+    def __init__(self):
+        self.inicio = time.time()
+        self.mediciones: list[Medicion] = []
+        self.cache: dict[str, dict[str, int]] = {}
+        self._nivel = 0
+
+    @contextmanager
+    def medir(self, nombre: str):
+        rss = _rss_mb()
+        nivel = self._nivel
+        self._nivel += 1
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            segundos = time.perf_counter() - inicio
+            self._nivel = nivel
+            despues = _rss_mb()
+            delta = despues - rss if despues is not None and rss is not None else None
+            self.mediciones.append(Medicion(nombre, segundos, despues, delta, nivel))
+
+    def contar(self, nombre: str, hit: bool) -> None:
+        counts = self.cache.setdefault(nombre, {"hits": 0, "misses": 0})
+        counts["hits" if hit else "misses"] += 1
+
+    def misses(self, nombre: str) -> int:
+        return self.cache.get(nombre, {}).get("misses", 0)
+
+    def resumen(self) -> list[dict]:
+        """Mediciones agrupadas por nombre: primero las de nivel superior, luego por tiempo total."""
+        filas: dict[str, dict] = {}
+        for m in self.mediciones:
+            fila = filas.setdefault(
+                m.nombre,
+                {"etapa": m.nombre, "llamadas": 0, "total_s": 0.0, "max_s": 0.0, "rss_delta_mb": 0.0, "nivel": m.nivel},
+            )
+            fila["llamadas"] += 1
+            fila["total_s"] += m.segundos
+            fila["max_s"] = max(fila["max_s"], m.segundos)
+            fila["rss_delta_mb"] += m.rss_delta_mb or 0.0
+            fila["nivel"] = min(fila["nivel"], m.nivel)
+        return sorted(filas.values(), key=lambda f: (f["nivel"] > 0, -f["total_s"]))
+
+    def as_dict(self) -> dict:
+        return {
+            "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.inicio)),
+            "total_s": time.time() - self.inicio,
+            "rss_mb": _rss_mb(),
+            "mediciones": [asdict(m) for m in self.mediciones],
+            "cache": self.cache,
+        }
+
+    def guardar(self, path: Path | None = None) -> Path:
+        """Agrega la ejecucion como una linea JSON (para agregar varias ejecuciones despues)."""
+        path = Path(path or log_path())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(self.as_dict(), separators=(",", ":")) + "\n")
+        return path
+
+
+def iniciar(activo: bool) -> Perfil | None:
+    """Comienza una ejecucion: con `activo` False las mediciones no hacen nada."""
+    perfil = Perfil() if activo else None
+    _actual.set(perfil)
+    return perfil
+
+
+def actual() -> Perfil | None:
+    return _actual.get()
+
+
+def medir(nombre: str):
+    """Context manager que mide tiempo y RSS del bloque si hay un perfil activo."""
+    perfil = _actual.get()
+    return _NULL if perfil is None else perfil.medir(nombre)
+
+
+def contar(nombre: str, hit: bool) -> None:
+    perfil = _actual.get()
+    if perfil is not None:
+        perfil.contar(nombre, hit)
+
+
+def medido(nombre: str | None = None):
+    """Decorador de `medir`; por defecto usa `<modulo>.<funcion>` como nombre."""
+
+    def decorar(fn):
+        etiqueta = nombre or f"{fn.__module__}.{fn.__qualname__}"
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            perfil = _actual.get()
+            if perfil is None:
+                return fn(*args, **kwargs)
+            with perfil.medir(etiqueta):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorar
+
+
+def cacheado(cache_decorator, nombre: str):
+    """
+    Aplica `cache_decorator` (p. ej. `st.cache_resource`) contando aciertos y fallos: la
+    funcion interna solo corre en un fallo, asi que cada llamada sin fallo es un acierto.
+    """
+
+    def decorar(fn):
+        @wraps(fn)
+        def miss(*args, **kwargs):
+            contar(nombre, hit=False)
+            return fn(*args, **kwargs)
+
+        cached = cache_decorator(miss)
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            perfil = _actual.get()
+            if perfil is None:
+                return cached(*args, **kwargs)
+            misses = perfil.misses(nombre)
+            with perfil.medir(nombre):
+                result = cached(*args, **kwargs)
+            if perfil.misses(nombre) == misses:
+                perfil.contar(nombre, hit=True)
+            return result
+
+        if hasattr(cached, "clear"):
+            wrapper.clear = cached.clear
+        return wrapper
+
+    return decorar
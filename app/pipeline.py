@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import os
+from collections import Counter, deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from change import (
+    CLASE_DESCRIPTIONS,
+    DIFF_DESCRIPTIONS,
+    UMBRAL_DIFERENCIA,
+    ClasificadorCambio,
+    ResumenDiferencia,
+    output_profiles,
+    periodo_tags,
+    procesar_bloque_cambio,
+)
+from indices import IndexBlockComputer, IndexStats, encode_block, index_writer, save_indices_stats, year_from_path
+from raster_io import CogWriter
+
+# Bloques internos por tarea: agrupa suficiente trabajo para amortizar el envio entre procesos.
+TILE_BLOCKS = 16
+
+
+def _block_windows(path: Path) -> list:
+    import rasterio
+
+    with rasterio.open(path) as src:
+        return [window for _, window in src.block_windows(1)]
+
+
+def split_tiles(windows: list, tile_blocks: int = TILE_BLOCKS) -> list[list]:
+    tile_blocks = max(1, tile_blocks)
+    return [windows[i : i + tile_blocks] for i in range(0, len(windows), tile_blocks)]
+
+
+def _indices_tile(ruta_imagen: Path, windows: list, formato: str = "float32") -> list:
+    import rasterio
+
+    results = []
+    with rasterio.open(ruta_imagen) as src:
+        computer = IndexBlockComputer(max(w.height for w in windows), max(w.width for w in windows))
+        for window in windows:
+            block = computer.compute(src.read([1, 2, 3, 4, 5], window=window))
+            stats = IndexStats()
+            stats.update(block)
+            # Se codifica en el proceso hijo: en int16 tambien viaja la mitad de bytes.
+            results.append((window, encode_block(block, formato).copy(), stats))
+    return results
+
+
+def _change_tile(ruta_t1: Path, ruta_t2: Path, windows: list, umbrales, umbral: float) -> list:
+    import rasterio
+
+    results = []
+    clasificador = ClasificadorCambio(umbrales)
+    with rasterio.open(ruta_t1) as src_t1, rasterio.open(ruta_t2) as src_t2:
+        for window in windows:
+            results.append((window,) + procesar_bloque_cambio(src_t1, src_t2, window, clasificador, umbral))
+    return results
+
+
+def _ordered_results(executor: Executor, tasks: list, max_inflight: int):
+    """
+    Envia `tasks` (fn, args, ctx) al pool y entrega los resultados en el mismo orden de envio.
+    Mantiene como maximo `max_inflight` tareas pendientes para acotar la memoria del proceso padre,
+    y el orden fijo hace que la escritura sea identica a la del camino secuencial.
+    """
+    pending: deque = deque()
+    task_iter = iter(tasks)
+    for fn, args, ctx in task_iter:
+        pending.append((executor.submit(fn, *args), ctx))
+        if len(pending) >= max_inflight:
+            break
+    while pending:
+        future, ctx = pending.popleft()
+        for fn, args, next_ctx in task_iter:
+            pending.append((executor.submit(fn, *args), next_ctx))
+            break
+        yield ctx, future.result()
+
+
+def _default_workers(workers: int | None) -> int:
+    return workers or os.cpu_count() or 1
+
+
+def calcular_indices_paralelo(
+    imagenes: list[Path],
+    processed_dir: Path,
+    workers: int | None = None,
+    tile_blocks: int = TILE_BLOCKS,
+    formato: str = "float32",
+) -> pd.DataFrame:
+    """
+    Calcula indices de todos los anos repartiendo anos y teselas entre procesos.
+    Los rasters y estadisticas_indices.csv son identicos a los de `indices.calcular_indices`.
+    """
+    import rasterio
+
+    workers = _default_workers(workers)
+    processed_dir.mkdir(parents=True, exist_ok=True)
+
+    tasks = []
+    outputs = {}
+    for img in imagenes:
+        year = year_from_path(img)
+        with rasterio.open(img) as src:
+            profile = src.profile
+        outputs[year] = (processed_dir / f"indices_{year}.tif", profile)
+        for tile in split_tiles(_block_windows(img), tile_blocks):
+            tasks.append((_indices_tile, (img, tile, formato), year))
+
+    stats = {year: IndexStats() for year in outputs}
+    remaining = Counter(year for _, _, year in tasks)
+    datasets = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            for year, results in _ordered_results(executor, tasks, max_inflight=2 * workers):
+                if year not in datasets:
+                    path, profile = outputs[year]
+                    datasets[year] = index_writer(path, profile, formato)
+                for window, block, block_stats in results:
+                    datasets[year].write(block, window=window)
+                    stats[year].merge(block_stats)
+                remaining[year] -= 1
+                if remaining[year] == 0:
+                    datasets.pop(year).close()
+        finally:
+            for dst in datasets.values():
+                dst.abort()
+
+    rows = {year: stats[year].as_row() for year in outputs}
+    for year, row in rows.items():
+        print(f"Procesado {year}: NDVI medio = {row['ndvi_mean']:.3f}")
+    return save_indices_stats(rows, processed_dir)
+
+
+def detectar_cambios_paralelo(
+    pares: list[tuple[Path, Path, Path, Path]],
+    workers: int | None = None,
+    tile_blocks: int = TILE_BLOCKS,
+    umbrales=None,
+    umbral: float = UMBRAL_DIFERENCIA,
+) -> list[ResumenDiferencia]:
+    """
+    Version paralela de `change.detectar_cambios` para uno o varios pares
+    (ruta_t1, ruta_t2, out_clase, out_diff). Retorna un resumen por par.
+    """
+    import rasterio
+
+    workers = _default_workers(workers)
+    tasks = []
+    for i, (ruta_t1, ruta_t2, _, _) in enumerate(pares):
+        for tile in split_tiles(_block_windows(ruta_t1), tile_blocks):
+            tasks.append((_change_tile, (ruta_t1, ruta_t2, tile, umbrales, umbral), i))
+
+    resumenes = [ResumenDiferencia() for _ in pares]
+    remaining = Counter(i for _, _, i in tasks)
+    datasets: dict[int, tuple] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        try:
+            for i, results in _ordered_results(executor, tasks, max_inflight=2 * workers):
+                if i not in datasets:
+                    ruta_t1, ruta_t2, out_clase, out_diff = pares[i]
+                    with rasterio.open(ruta_t1) as src:
+                        clase_profile, diff_profile = output_profiles(src.profile)
+                    tags = periodo_tags(ruta_t1, ruta_t2)
+                    datasets[i] = (
+                        CogWriter(out_clase, clase_profile, CLASE_DESCRIPTIONS, categorical=True, tags=tags),
+                        CogWriter(out_diff, diff_profile, DIFF_DESCRIPTIONS, categorical=True, tags=tags),
+                    )
+                dst_clase, dst_diff = datasets[i]
+                for window, clase, cambio, parcial in results:
+                    dst_clase.write(clase, 1, window=window)
+                    dst_diff.write(cambio, 1, window=window)
+                    resumenes[i].merge(parcial)
+                remaining[i] -= 1
+                if remaining[i] == 0:
+                    for dst in datasets.pop(i):
+                        dst.close()
+        finally:
+            for writers in datasets.values():
+                for dst in writers:
+                    dst.abort()
+    return resumenes
@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+COG_BLOCKSIZE = 512
+COG_COMPRESS = "DEFLATE"
+# Formato cuantizado para rasters continuos acotados (indices en [-1, 1]):
+# valor = entero * INT16_SCALE + INT16_OFFSET, con INT16_NODATA reservado para NaN.
+INT16_SCALE = 1e-4
+INT16_OFFSET = 0.0
+INT16_NODATA = -32768
+
+
+def cog_options(dtype: str, categorical: bool = False, scaled: bool = False) -> dict:
+    """Opciones del driver COG: teselas internas, compresion con predictor segun tipo y piramide."""
+    kind = np.dtype(dtype).kind
+    return {
+        "compress": COG_COMPRESS,
+        # 3 = predictor de punto flotante, 2 = diferencia horizontal para enteros
+        "predictor": "3" if kind == "f" else "2",
+        "blocksize": COG_BLOCKSIZE,
+        # Un entero con scale/offset es continuo: sus overviews se promedian como las de float.
+        "overview_resampling": "NEAREST" if categorical or (kind in "iub" and not scaled) else "AVERAGE",
+        "bigtiff": "IF_SAFER",
+    }
+
+
+def quantize_int16(values: np.ndarray, out: np.ndarray | None = None) -> np.ndarray:
+    """Codifica valores float al formato int16 (redondeo al entero mas cercano; NaN -> nodata)."""
+    if out is None:
+        out = np.empty(values.shape, dtype=np.int16)
+    scaled = np.subtract(values, INT16_OFFSET, dtype=np.float32)
+    scaled /= np.float32(INT16_SCALE)
+    np.rint(scaled, out=scaled)
+    # -32768 queda reservado para nodata
+    np.clip(scaled, INT16_NODATA + 1, np.iinfo(np.int16).max, out=scaled)
+    np.copyto(out, scaled, casting="unsafe")
+    out[np.isnan(values)] = INT16_NODATA
+    return out
+
+
+def dequantize_int16(values: np.ndarray) -> np.ndarray:
+    """Inverso de `quantize_int16`, con la misma aritmetica float32 que `read_scaled`."""
+    out = np.multiply(values, np.float32(INT16_SCALE), dtype=np.float32)
+    if INT16_OFFSET:
+        out += np.float32(INT16_OFFSET)
+    np.putmask(out, values == INT16_NODATA, np.nan)
+    return out
+
+
+def is_scaled(src) -> bool:
+    """True si el raster es entero con scale/offset (formato cuantizado): se lee con `read_scaled`."""
+    return np.dtype(src.dtypes[0]).kind in "iu" and (
+        any(s != 1 for s in src.scales) or any(o != 0 for o in src.offsets)
+    )
+
+
+def _decode(src, data: np.ndarray, bands) -> np.ndarray:
+    shape = (-1,) + (1,) * (data.ndim - 1) if data.ndim == 3 else ()
+    scales = np.array([src.scales[b - 1] for b in bands], dtype=np.float32).reshape(shape)
+    offsets = np.array([src.offsets[b - 1] for b in bands], dtype=np.float32).reshape(shape)
+    out = np.multiply(data, scales, dtype=np.float32)
+    if offsets.any():
+        out += offsets
+    if src.nodata is not None:
+        np.putmask(out, data == src.nodata, np.nan)
+    return out
+
+
+def read_scaled(src, indexes=None, window=None, **kwargs) -> np.ndarray:
+    """
+    `src.read` que decodifica el formato cuantizado a float32 (scale/offset de cada banda y
+    nodata -> NaN). Los rasters float se retornan tal cual, sin copia adicional.
+    """
+    data = src.read(indexes, window=window, **kwargs)
+    if not is_scaled(src):
+        return data
+    if indexes is None:
+        bands = range(1, src.count + 1)
+    elif isinstance(indexes, int):
+        bands = [indexes]
+    else:
+        bands = list(indexes)
+    return _decode(src, data, bands)
+
+
+class CogWriter:
+    """
+    Escritor de rasters procesados como Cloud-Optimized GeoTIFF.
+
+    Se escribe por ventanas sobre un GeoTIFF temporal con el perfil de entrada y, al cerrar,
+    se convierte a COG (teselado, comprimido y con overviews internas). Si hay una excepcion
+    dentro del bloque `with` no se deja ningun archivo a medias. `scales`/`offsets` (una por
+    banda) quedan en los metadatos de cada banda para decodificar rasters cuantizados; `tags`
+    se guardan como metadatos del dataset.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        profile: dict,
+        descriptions=None,
+        categorical: bool = False,
+        scales=None,
+        offsets=None,
+        tags: dict | None = None,
+    ):
+        import rasterio
+
+        self.path = Path(path)
+        self.descriptions = descriptions
+        self.scales = scales
+        self.offsets = offsets
+        self.tags = tags
+        self.options = cog_options(profile["dtype"], categorical, scaled=scales is not None)
+        self._tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp_profile = dict(profile)
+        tmp_profile["driver"] = "GTiff"
+        self.dataset = rasterio.open(self._tmp, "w", **tmp_profile)
+
+    def write(self, *args, **kwargs) -> None:
+        self.dataset.write(*args, **kwargs)
+
+    def close(self) -> None:
+        from rasterio.shutil import copy
+
+        if self.dataset.closed:
+            return
+        if self.descriptions:
+            self.dataset.descriptions = tuple(self.descriptions)
+        if self.scales is not None:
+            self.dataset.scales = tuple(self.scales)
+            self.dataset.offsets = tuple(self.offsets if self.offsets is not None else (0.0,) * len(self.scales))
+        if self.tags:
+            self.dataset.update_tags(**self.tags)
+        self.dataset.close()
+        try:
+            copy(self._tmp, self.path, driver="COG", **self.options)
+        finally:
+            self._tmp.unlink(missing_ok=True)
+
+    def abort(self) -> None:
+        if not self.dataset.closed:
+            self.dataset.close()
+        self._tmp.unlink(missing_ok=True)
+
+    def __enter__(self) -> "CogWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+def preview_shape(height: int, width: int, max_size: int) -> tuple[int, int]:
+    """Forma de lectura reducida cuyo lado mayor no supera `max_size` (sin ampliar)."""
+    scale = max(height, width) / max(max_size, 1)
+    if scale <= 1:
+        return height, width
+    return max(1, round(height / scale)), max(1, round(width / scale))
+
+
+def read_preview(path: Path, max_size: int, band: int = 1, resampling=None) -> tuple[np.ndarray, float | None]:
+    """
+    Lee una banda a una resolucion acorde al tamano de despliegue. Con out_shape reducido,
+    GDAL usa la overview interna mas cercana en lugar de decodificar la resolucion completa.
+    Un raster cuantizado se retorna decodificado (nodata ya es NaN, se retorna None).
+    """
+    import rasterio
+    from rasterio.enums import Resampling
+
+    with rasterio.open(path) as src:
+        out_shape = preview_shape(src.height, src.width, max_size)
+        data = read_scaled(
+            src,
+            band,
+            out_shape=out_shape,
+            resampling=resampling if resampling is not None else Resampling.nearest,
+        )
+        return data, None if is_scaled(src) else src.nodata
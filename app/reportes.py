@@ -0,0 +1,336 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+
+from config import OUTPUTS_DIR
+from change import leer_periodo
+from dag import APP_DIR, Node
+from indices import year_from_path
+from utils import DataPaths, load_indices_stats, load_stats
+from zonal_store import PART_FILE, PARTITION, list_periodos, periodo_key, periodo_total
+
+DPI = 150
+# Lado maximo (px) de los rasters dibujados: ~ tamano de la figura a DPI, se lee de las overviews
+MAX_PIXELES_FIGURA = 1200
+# Bordes de los histogramas de indices (iguales a los del notebook 02)
+BORDES_HISTOGRAMA = np.linspace(-1, 1, 51)
+COLORES_CAMBIO = ["lightgray", "orangered", "gold", "limegreen", "deepskyblue", "navy"]
+ETIQUETAS_CAMBIO = [
+    "Sin cambio",
+    "Urbanización",
+    "Pérdida vegetación",
+    "Ganancia vegetación",
+    "Nuevo cuerpo de agua",
+    "Pérdida de agua",
+]
+
+
+def _pyplot():
+    """pyplot con backend sin ventana (Agg): las figuras se dibujan en procesos sin display."""
+    import matplotlib
+
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    return plt
+
+
+def _guardar(fig, salida: Path, **kwargs) -> None:
+    # Se escribe a un temporal y se reemplaza: una figura interrumpida no queda a medias.
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    tmp = salida.with_name(salida.stem + ".tmp" + salida.suffix)
+    fig.savefig(tmp, dpi=DPI, **kwargs)
+    tmp.replace(salida)
+    _pyplot().close(fig)
+
+
+def histograma_indices(ruta: Path, bordes: np.ndarray = BORDES_HISTOGRAMA) -> np.ndarray:
+    """
+    Conteos (bandas, bins) de cada indice de `ruta` leyendo por bloques: cada valor se
+    asigna a su bin con aritmetica (bordes uniformes) y se acumula con `np.bincount`, sin
+    juntar los pixeles de la escena. Mismo criterio que `np.histogram` (ultimo bin cerrado,
+    NaN y valores fuera de rango se descartan).
+    """
+    import rasterio
+
+    from raster_io import read_scaled
+
+    bordes = np.asarray(bordes, dtype=np.float64)
+    n_bins = len(bordes) - 1
+    inicio, ancho = bordes[0], (bordes[-1] - bordes[0]) / n_bins
+    with rasterio.open(ruta) as src:
+        nodata = src.nodata if src.nodata is not None and not np.isnan(src.nodata) else None
+        counts = np.zeros((src.count, n_bins), dtype=np.int64)
+        for _, window in src.block_windows(1):
+            bloque = read_scaled(src, window=window)
+            for b in range(src.count):
+                valores = bloque[b].ravel()
+                validos = (valores >= bordes[0]) & (valores <= bordes[-1])
+                if nodata is not None:
+                    validos &= valores != nodata
+                idx = ((valores[validos] - inicio) / ancho).astype(np.int64)
+                np.minimum(idx, n_bins - 1, out=idx)
+                counts[b] += np.bincount(idx, minlength=n_bins)
+    return counts
+
+
+# --- Etapas del reporte (una figura o un resultado intermedio por nodo) -------------------
+
+
+def _etapa_histograma(ruta: Path, salida: Path) -> dict:
+    import rasterio
+
+    counts = histograma_indices(ruta)
+    with rasterio.open(ruta) as src:
+        nombres = [d or f"B{i + 1}" for i, d in enumerate(src.descriptions)]
+    salida.parent.mkdir(parents=True, exist_ok=True)
+    with open(salida, "wb") as f:
+        np.savez(f, counts=counts, bordes=BORDES_HISTOGRAMA, nombres=np.array(nombres))
+    return {"pixeles": int(counts[0].sum())}
+
+
+def _figura_histogramas(rutas: dict[str, Path], salida: Path) -> None:
+    plt = _pyplot()
+    datos = {}
+    for fecha, ruta in rutas.items():
+        with np.load(ruta) as data:
+            datos[fecha] = (data["counts"], data["bordes"], [str(n) for n in data["nombres"]])
+    nombres = next(iter(datos.values()))[2]
+    filas = -(-len(nombres) // 2)
+    fig, axes = plt.subplots(filas, 2, figsize=(10, 4 * filas), squeeze=False)
+    for k, (ax, nombre) in enumerate(zip(axes.ravel(), nombres)):
+        for fecha, (counts, bordes, _) in datos.items():
+            ax.stairs(counts[k], bordes, label=fecha)
+        ax.set_title(nombre)
+        ax.legend(fontsize="small")
+    for ax in axes.ravel()[len(nombres) :]:
+        ax.axis("off")
+    fig.tight_layout()
+    _guardar(fig, salida)
+
+
+def _figura_paneles_ndvi(rutas: dict[str, Path], salida: Path) -> None:
+    from raster_io import read_preview
+
+    plt = _pyplot()
+    fig, axes = plt.subplots(1, len(rutas), figsize=(4 * len(rutas), 4), constrained_layout=True, squeeze=False)
+    for ax, (fecha, ruta) in zip(axes[0], rutas.items()):
+        # Cada panel mide 4 pulgadas: no hace falta leer mas que 4 * DPI pixeles por lado
+        ndvi, nodata = read_preview(ruta, 4 * DPI, band=1)
+        if nodata is not None and not np.isnan(nodata):
+            ndvi = np.where(ndvi == nodata, np.nan, ndvi)
+        im = ax.imshow(ndvi, cmap="RdYlGn", vmin=-1, vmax=1)
+        ax.set_title(f"NDVI {fecha}")
+        ax.axis("off")
+    fig.colorbar(im, ax=axes[0], location="right", shrink=0.85, pad=0.02)
+    _guardar(fig, salida)
+
+
+def _figura_cambio_clasificado(ruta_cambios: Path, salida: Path, titulo: str) -> None:
+    import matplotlib.colors as mcolors
+
+    from raster_io import read_preview
+
+    plt = _pyplot()
+    # Lectura reducida con vecino mas cercano (overviews internas): las clases no se mezclan.
+    cambio, _ = read_preview(ruta_cambios, MAX_PIXELES_FIGURA)
+    cmap = mcolors.ListedColormap(COLORES_CAMBIO)
+    fig, ax = plt.subplots(figsize=(8, 8))
+    ax.imshow(cambio, cmap=cmap, vmin=0, vmax=len(COLORES_CAMBIO) - 1, interpolation="nearest")
+    ax.set_title(titulo)
+    ax.axis("off")
+    handles = [
+        plt.Line2D([0], [0], marker="s", linestyle="", markerfacecolor=color, label=etiqueta, markersize=10)
+        for color, etiqueta in zip(COLORES_CAMBIO, ETIQUETAS_CAMBIO)
+    ]
+    ax.legend(handles=handles, loc="lower right")
+    _guardar(fig, salida, bbox_inches="tight")
+
+
+def _figura_top10(paths: DataPaths, periodo: str | None, columna_zona: str, salida: Path) -> None:
+    import geopandas as gpd
+
+    plt = _pyplot()
+    stats = load_stats(paths, periodo, ["urbanizacion_ha"])
+    stats["zona"] = stats["zona"].astype(str)
+    top = stats.nlargest(10, "urbanizacion_ha")
+    zonas = gpd.read_file(paths.zones_shp, columns=[columna_zona])
+    zonas[columna_zona] = zonas[columna_zona].astype(str)
+    top_zonas = zonas[zonas[columna_zona].isin(top["zona"])].merge(top, left_on=columna_zona, right_on="zona")
+    fig, ax = plt.subplots(figsize=(8, 8))
+    top_zonas.plot(column="urbanizacion_ha", cmap="Reds", legend=True, edgecolor="black", ax=ax)
+    ax.set_title(
+        "Top 10 zonas con mayor urbanización acumulada (ha)" + (f" ({periodo.replace('_', '–')})" if periodo else "")
+    )
+    ax.axis("off")
+    _guardar(fig, salida, bbox_inches="tight")
+
+
+def _figura_indices_temporales(indices_csv: Path, salida: Path) -> None:
+    plt = _pyplot()
+    df = load_indices_stats(DataPaths(indices_stats_csv=indices_csv))
+    fechas = df["fecha"].astype(str)
+    fig, ax = plt.subplots(1, 2, figsize=(12, 5))
+    ax[0].plot(fechas, df["ndvi_mean"], marker="o")
+    ax[0].set_title("Evolución NDVI medio")
+    ax[0].set_ylabel("NDVI")
+    ax[1].plot(fechas, df["ndbi_mean"], marker="s")
+    ax[1].set_title("Evolución NDBI medio")
+    ax[1].set_ylabel("NDBI")
+    for a in ax:
+        a.grid(alpha=0.3)
+    fig.tight_layout()
+    _guardar(fig, salida)
+
+
+def construir_reportes(
+    processed_dir: Path,
+    vector_dir: Path,
+    cache_dir: Path,
+    outputs_dir: Path = OUTPUTS_DIR,
+    t1: str | None = None,
+    t2: str | None = None,
+    columna_zona: str = "MANZENT",
+) -> list[Node]:
+    """
+    Nodos del reporte para `dag.Dag`: una figura por nodo, con clave por huella de sus
+    insumos y del codigo de este modulo, de modo que solo se redibujan las figuras cuyos
+    insumos cambiaron. Los histogramas de indices se calculan por fecha (un nodo por
+    raster, guardados en `cache_dir`) y la figura solo junta los conteos. Las figuras cuyos
+    insumos no existen se omiten del grafo.
+    """
+    codigo = [APP_DIR / "reportes.py", APP_DIR / "raster_io.py"]
+    maps_dir, figures_dir = outputs_dir / "maps", outputs_dir / "figures"
+    indices = {year_from_path(p): p for p in sorted(processed_dir.glob("indices_*.tif"))}
+    years = sorted(indices)
+    nodes = []
+
+    if years:
+        histogramas = {}
+        for year in years:
+            histogramas[year] = cache_dir / "histogramas_indices" / f"{year}.npz"
+            nodes.append(
+                Node(
+                    f"histograma_{year}",
+                    _etapa_histograma,
+                    (indices[year], histogramas[year]),
+                    inputs=[indices[year]],
+                    outputs=[histogramas[year]],
+                    params={"bordes": BORDES_HISTOGRAMA.tolist()},
+                    code=codigo,
+                )
+            )
+        salida = figures_dir / "histogramas_indices.png"
+        nodes.append(
+            Node(
+                "histogramas_indices",
+                _figura_histogramas,
+                (histogramas, salida),
+                inputs=list(histogramas.values()),
+                outputs=[salida],
+                deps=[f"histograma_{year}" for year in years],
+                code=codigo,
+            )
+        )
+        salida = figures_dir / "ndvi_paneles.png"
+        nodes.append(
+            Node(
+                "ndvi_paneles",
+                _figura_paneles_ndvi,
+                (indices, salida),
+                inputs=[indices[year] for year in years],
+                outputs=[salida],
+                code=codigo,
+            )
+        )
+
+    store = processed_dir / "estadisticas_cambio"
+    periodos = list_periodos(store)
+    if t1 and t2:
+        pedido = periodo_key(t1, t2)
+    elif (t1 or t2) and years:
+        pedido = periodo_key(t1 or years[0], t2 or years[-1])
+    elif t1 or t2:
+        raise ValueError("Sin rasters de indices hay que indicar t1 y t2")
+    else:
+        pedido = None
+
+    # El mapa dibuja el raster del par pedido (cambio_clasificado_<t1>_<t2>.tif de
+    # multiperiodo) o cambio_clasificado.tif, y se titula con los anios guardados en el raster.
+    cambios = processed_dir / "cambio_clasificado.tif"
+    if pedido and (processed_dir / f"cambio_clasificado_{pedido}.tif").exists():
+        cambios = processed_dir / f"cambio_clasificado_{pedido}.tif"
+    par = leer_periodo(cambios) if cambios.exists() else None
+    if par:
+        periodo = periodo_key(*par)
+        if pedido and periodo != pedido:
+            raise ValueError(
+                f"{cambios} compara {periodo.replace('_', '-')} y se pidio {pedido.replace('_', '-')}: "
+                "genere ese par o quite t1/t2"
+            )
+    elif pedido:
+        # Raster sin etiquetas (version anterior): no se puede verificar el par pedido
+        periodo = pedido
+    elif years:
+        periodo = periodo_key(years[0], years[-1])
+    else:
+        # Sin rasters de indices, el par de mayor extension del almacen
+        periodo = periodo_total(periodos) if periodos else None
+
+    if cambios.exists():
+        titulo = "Mapa de cambio urbano clasificado" + (f" ({periodo.replace('_', '–')})" if periodo else "")
+        salida = maps_dir / "cambio_clasificado.png"
+        nodes.append(
+            Node(
+                "cambio_clasificado",
+                _figura_cambio_clasificado,
+                (cambios, salida, titulo),
+                inputs=[cambios],
+                outputs=[salida],
+                params={"titulo": titulo, "max_pixeles": MAX_PIXELES_FIGURA},
+                code=codigo,
+            )
+        )
+
+    # Top 10 del mismo par que el mapa desde su particion del almacen (o del CSV si no hay almacen)
+    paths = DataPaths(
+        stats_csv=processed_dir / "estadisticas_cambio.csv",
+        stats_store=store,
+        zones_shp=vector_dir / "manzanas_censales.shp",
+    )
+    if periodos and periodo not in periodos:
+        raise ValueError(
+            f"El almacen {store} no tiene el periodo {periodo} del mapa (hay: {', '.join(periodos)}); "
+            "indique t1/t2 de un periodo guardado"
+        )
+    fuente = store / f"{PARTITION}={periodo}" / PART_FILE if periodos else paths.stats_csv
+    if fuente.exists() and paths.zones_shp.exists():
+        salida = maps_dir / "top10_urbanizacion.png"
+        nodes.append(
+            Node(
+                "top10_urbanizacion",
+                _figura_top10,
+                (paths, periodo if periodos else None, columna_zona, salida),
+                inputs=[fuente, paths.zones_shp],
+                outputs=[salida],
+                params={"columna_zona": columna_zona, "periodo": periodo},
+                code=codigo + [APP_DIR / "utils.py", APP_DIR / "zonal_store.py"],
+            )
+        )
+
+    indices_csv = processed_dir / "estadisticas_indices.csv"
+    if indices_csv.exists():
+        salida = figures_dir / "indices_temporales.png"
+        nodes.append(
+            Node(
+                "indices_temporales",
+                _figura_indices_temporales,
+                (indices_csv, salida),
+                inputs=[indices_csv],
+                outputs=[salida],
+                code=codigo + [APP_DIR / "utils.py"],
+            )
+        )
+    return nodes
@@ -0,0 +1,219 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from change import NDWI_AGUA, NDWI_NO_AGUA, UMBRAL_DIFERENCIA, UMBRALES_DEFECTO, leer_bloque_indices
+from zonal import N_CLASES, PIXEL_AREA_HA, ZoneGrid, tabla_zonal
+
+# Valores que puede tomar cada umbral. Los histogramas se cortan exactamente en estos
+# bordes, asi que cualquier combinacion reproduce la clasificacion por pixel.
+# `cambio_min` y el umbral de `cambio_diferencia` comparan la misma diferencia NDVI.
+BORDES = {
+    "ndvi_veg": np.round(np.arange(0.0, 0.8 + 1e-9, 0.05), 4),
+    "ndbi_urbano": np.round(np.arange(-0.3, 0.3 + 1e-9, 0.05), 4),
+    "cambio_min": np.round(np.arange(0.0, 0.5 + 1e-9, 0.025), 4),
+}
+# Codigo de agua por pixel (umbrales NDWI fijos): 0 ninguno, 1 agua nueva, 2 agua perdida
+_CLASE_AGUA = np.array([0, 4, 5], dtype=np.uint8)
+# Entradas acumuladas antes de consolidar los histogramas parciales de los bloques
+_MAX_PARCIALES = 1 << 22
+
+
+def _bin(valores: np.ndarray, bordes: np.ndarray) -> np.ndarray:
+    """Cantidad de bordes estrictamente menores que cada valor: `v > bordes[j]` <=> bin > j. NaN -> 0."""
+    bins = np.searchsorted(bordes.astype(valores.dtype), valores, side="left")
+    bins[np.isnan(valores)] = 0
+    return bins
+
+
+def _posicion(bordes: np.ndarray, valor: float, nombre: str) -> int:
+    j = np.flatnonzero(np.isclose(bordes, valor, atol=1e-6))
+    if not len(j):
+        raise ValueError(f"El umbral {nombre}={valor} no esta en la grilla de histogramas: {bordes.tolist()}")
+    return int(j[0])
+
+
+def _consolidar(partes: list[tuple[np.ndarray, np.ndarray]]) -> tuple[np.ndarray, np.ndarray]:
+    codes = np.concatenate([c for c, _ in partes])
+    counts = np.concatenate([n for _, n in partes])
+    unicos, inversa = np.unique(codes, return_inverse=True)
+    return unicos, np.bincount(inversa, weights=counts, minlength=len(unicos)).astype(np.int64)
+
+
+@dataclass
+class HistogramasUmbrales:
+    """
+    Histograma conjunto por zona de las cantidades que usan las reglas de cambio de un par
+    de fechas: NDVI t1, NDBI t2, diferencia NDVI (t1 - t2, con signo) y el estado de agua
+    del par NDWI. Se guardan solo las celdas no vacias (una fila por celda, en arreglos
+    paralelos), de modo que recalcular las clases para otros umbrales es una pasada sobre
+    esas filas y un `np.bincount` por zona, sin leer rasters.
+    """
+
+    zone_ids: np.ndarray
+    zona: np.ndarray
+    ndvi: np.ndarray
+    ndbi: np.ndarray
+    diferencia: np.ndarray
+    agua: np.ndarray
+    pixeles: np.ndarray
+    bordes: dict[str, np.ndarray]
+
+    @property
+    def n_zones(self) -> int:
+        return len(self.zone_ids)
+
+    def conteos(self, umbrales: dict | None = None) -> np.ndarray:
+        """Pixeles por (zona, clase) con `umbrales`, igual que `ClasificadorCambio` + `zone_class_counts`."""
+        umbrales = {**UMBRALES_DEFECTO, **(umbrales or {})}
+        ja = _posicion(self.bordes["ndvi_veg"], umbrales["ndvi_veg"], "ndvi_veg")
+        jb = _posicion(self.bordes["ndbi_urbano"], umbrales["ndbi_urbano"], "ndbi_urbano")
+        jc = _posicion(self.bordes["cambio_min"], umbrales["cambio_min"], "cambio_min")
+        clase = _CLASE_AGUA[self.agua]
+        clase[self.diferencia < -jc] = 3
+        clase[self.diferencia > jc] = 2
+        clase[(self.ndvi > ja) & (self.ndbi > jb)] = 1
+        codes = self.zona.astype(np.int64) * N_CLASES + clase
+        counts = np.bincount(codes, weights=self.pixeles, minlength=self.n_zones * N_CLASES)
+        return counts.astype(np.int64).reshape(self.n_zones, N_CLASES)
+
+    def tabla(self, umbrales: dict | None = None) -> pd.DataFrame:
+        """Tabla zonal con las columnas del almacen por periodo (ver `zonal_store.to_table`)."""
+        from zonal_store import to_table
+
+        return to_table(tabla_zonal(self.conteos(umbrales), self.zone_ids)).to_pandas()
+
+    def diferencia_ha(self, umbral: float = UMBRAL_DIFERENCIA) -> pd.DataFrame:
+        """Perdida y ganancia por zona de `cambio_diferencia` (diferencia NDVI sin las demas reglas)."""
+        j = _posicion(self.bordes["cambio_min"], umbral, "umbral")
+        perdida = np.bincount(self.zona, weights=self.pixeles * (self.diferencia > j), minlength=self.n_zones)
+        ganancia = np.bincount(self.zona, weights=self.pixeles * (self.diferencia < -j), minlength=self.n_zones)
+        return pd.DataFrame(
+            {"zona": self.zone_ids, "perdida_ha": perdida * PIXEL_AREA_HA, "ganancia_ha": ganancia * PIXEL_AREA_HA}
+        )
+
+    def save(self, path: Path, extra: dict | None = None) -> None:
+        meta = {"bordes": {k: v.tolist() for k, v in self.bordes.items()}}
+        meta.update(extra or {})
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(
+                f,
+                zone_ids=self.zone_ids,
+                zona=self.zona,
+                ndvi=self.ndvi,
+                ndbi=self.ndbi,
+                diferencia=self.diferencia,
+                agua=self.agua,
+                pixeles=self.pixeles,
+                meta=np.array(json.dumps(meta)),
+            )
+        tmp.replace(path)
+
+    @classmethod
+    def load(cls, path: Path) -> tuple["HistogramasUmbrales", dict]:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            arrays = {k: data[k] for k in ("zone_ids", "zona", "ndvi", "ndbi", "diferencia", "agua", "pixeles")}
+        bordes = {k: np.asarray(v) for k, v in meta["bordes"].items()}
+        return cls(**arrays, bordes=bordes), meta
+
+
+def histogramas_periodos(
+    rutas: dict[str, Path], grid: ZoneGrid, pares: list[tuple[str, str]], bordes: dict | None = None
+) -> dict[tuple[str, str], HistogramasUmbrales]:
+    """
+    Histogramas por zona de todos los `pares` en un solo recorrido por bloques (cada bloque
+    de cada fecha se lee una vez, como en `multiperiodo.cambios_periodos`).
+    """
+    import rasterio
+
+    bordes = {k: np.asarray(v) for k, v in (bordes or BORDES).items()}
+    n_a, n_b, n_c = (len(bordes[k]) + 1 for k in ("ndvi_veg", "ndbi_urbano", "cambio_min"))
+    # Celda = (((zona * A + ndvi) * B + ndbi) * D + diferencia + desplazamiento) * 3 + agua
+    n_d = 2 * n_c - 1
+    fechas = sorted({fecha for par in pares for fecha in par})
+    faltan = [fecha for fecha in fechas if fecha not in rutas]
+    if faltan:
+        raise FileNotFoundError(f"Faltan rasters de indices para: {faltan}")
+
+    parciales: dict[tuple[str, str], list] = {par: [] for par in pares}
+    tamanos = dict.fromkeys(pares, 0)
+    sources = {fecha: rasterio.open(rutas[fecha]) for fecha in fechas}
+    try:
+        for fecha, src in sources.items():
+            if not grid.matches(src.transform, src.shape, src.crs.to_wkt() if src.crs else ""):
+                raise ValueError(f"La grilla de zonas no esta alineada con {rutas[fecha]}")
+        ref = sources[fechas[0]]
+        for _, window in ref.block_windows(1):
+            row, col = int(window.row_off), int(window.col_off)
+            labels = grid.labels[row : row + window.height, col : col + window.width]
+            valid = labels > 0
+            if not valid.any():
+                continue
+            bloques = {
+                fecha: {k: v[valid] for k, v in leer_bloque_indices(src, window).items()} for fecha, src in sources.items()
+            }
+            zona = labels[valid].astype(np.int64) - 1
+            for t1, t2 in pares:
+                i1, i2 = bloques[t1], bloques[t2]
+                diferencia = np.subtract(i1["ndvi"], i2["ndvi"])
+                magnitud = _bin(np.abs(diferencia), bordes["cambio_min"])
+                signo = np.sign(np.nan_to_num(diferencia)).astype(np.int64)
+                agua = np.where(
+                    (i1["ndwi"] < NDWI_NO_AGUA) & (i2["ndwi"] > NDWI_AGUA),
+                    1,
+                    np.where((i1["ndwi"] > NDWI_AGUA) & (i2["ndwi"] < NDWI_NO_AGUA), 2, 0),
+                )
+                code = zona * n_a + _bin(i1["ndvi"], bordes["ndvi_veg"])
+                code = code * n_b + _bin(i2["ndbi"], bordes["ndbi_urbano"])
+                code = code * n_d + signo * magnitud + (n_c - 1)
+                code = code * 3 + agua
+                unicos, counts = np.unique(code, return_counts=True)
+                parciales[(t1, t2)].append((unicos, counts))
+                tamanos[(t1, t2)] += len(unicos)
+                if tamanos[(t1, t2)] > _MAX_PARCIALES:
+                    parciales[(t1, t2)] = [_consolidar(parciales[(t1, t2)])]
+                    tamanos[(t1, t2)] = len(parciales[(t1, t2)][0][0])
+    finally:
+        for src in sources.values():
+            src.close()
+
+    resultado = {}
+    for par in pares:
+        if parciales[par]:
+            code, counts = _consolidar(parciales[par])
+        else:
+            code, counts = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        code, agua = np.divmod(code, 3)
+        code, diferencia = np.divmod(code, n_d)
+        code, ndbi = np.divmod(code, n_b)
+        zona, ndvi = np.divmod(code, n_a)
+        dtype = np.int32 if grid.n_zones < np.iinfo(np.int32).max else np.int64
+        resultado[(str(par[0]), str(par[1]))] = HistogramasUmbrales(
+            grid.zone_ids,
+            zona.astype(dtype),
+            ndvi.astype(np.uint8),
+            ndbi.astype(np.uint8),
+            (diferencia - (n_c - 1)).astype(np.int8),
+            agua.astype(np.uint8),
+            counts.astype(np.int32 if counts.max(initial=0) < np.iinfo(np.int32).max else np.int64),
+            bordes,
+        )
+    return resultado
+
+
+def histogramas_path(directorio: Path, periodo: str) -> Path:
+    return directorio / f"{periodo}.npz"
+
+
+def load_histogramas(directorio: Path, periodo: str) -> tuple[HistogramasUmbrales, dict] | None:
+    """Histogramas del periodo y su meta (umbrales con que se calculo el almacen); None si no existen."""
+    path = histogramas_path(directorio, periodo)
+    return HistogramasUmbrales.load(path) if path.exists() else None
@@ -1,11 +1,13 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 
+import perf
 from config import PROCESSED_DIR, VECTOR_DIR
 
 
@@ -13,10 +15,26 @@ from config import PROCESSED_DIR, VECTOR_DIR
 class DataPaths:
     stats_csv: Path = PROCESSED_DIR / "estadisticas_cambio.csv"
     indices_stats_csv: Path = PROCESSED_DIR / "estadisticas_indices.csv"
+    # Almacen Parquet de estadisticas zonales particionado por periodo (ver zonal_store.py)
+    stats_store: Path = PROCESSED_DIR / "estadisticas_cambio"
+    # Histogramas por zona para recalcular el cambio con otros umbrales (ver sensibilidad.py)
+    histograms_dir: Path = PROCESSED_DIR / "histogramas_umbrales"
     indices_pattern: str = "indices_*.tif"
     zones_shp: Path = VECTOR_DIR / "manzanas_censales.shp"
     boundary_gpkg: Path = VECTOR_DIR / "limite_comuna.gpkg"
 
+    @classmethod
+    def from_dirs(cls, processed_dir: Path = PROCESSED_DIR, vector_dir: Path = VECTOR_DIR) -> "DataPaths":
+        """Rutas con los nombres de siempre dentro de otros directorios de datos procesados y vectoriales."""
+        return cls(
+            stats_csv=processed_dir / "estadisticas_cambio.csv",
+            indices_stats_csv=processed_dir / "estadisticas_indices.csv",
+            stats_store=processed_dir / "estadisticas_cambio",
+            histograms_dir=processed_dir / "histogramas_umbrales",
+            zones_shp=vector_dir / "manzanas_censales.shp",
+            boundary_gpkg=vector_dir / "limite_comuna.gpkg",
+        )
+
 
 def list_index_years(processed_dir: Path, pattern: str = "indices_*.tif") -> list[int]:
     years: list[int] = []
@@ -28,13 +46,24 @@ def list_index_years(processed_dir: Path, pattern: str = "indices_*.tif") -> lis
     return sorted(set(years))
 
 
-def load_stats(paths: DataPaths) -> pd.DataFrame:
-    df = pd.read_csv(paths.stats_csv)
+@perf.medido("utils.load_stats")
+def load_stats(paths: DataPaths, periodo: str | None = None, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Estadisticas de cambio por zona. Lee del almacen Parquet (solo `columns`, zona int64) el
+    `periodo` pedido o, por defecto, el de mayor extension; sin almacen, usa el CSV.
+    """
+    from zonal_store import list_periodos, periodo_total, read_periodo
+
+    periodos = list_periodos(paths.stats_store)
+    if periodos:
+        return read_periodo(paths.stats_store, periodo or periodo_total(periodos), columns)
+    df = pd.read_csv(paths.stats_csv, usecols=None if columns is None else lambda c: c in set(columns) | {"zona"})
     if "zona" in df.columns:
         df["zona"] = df["zona"].astype(str).str.strip()
     return df
 
 
+@perf.medido("utils.load_indices_stats")
 def load_indices_stats(paths: DataPaths) -> pd.DataFrame:
     df = pd.read_csv(paths.indices_stats_csv)
     if df.columns[0] == "" or str(df.columns[0]).lower().startswith("unnamed"):
@@ -54,10 +83,16 @@ def load_indices_stats(paths: DataPaths) -> pd.DataFrame:
                 df = df.rename(columns={col: "fecha"})
                 break
 
-    df["fecha"] = pd.to_numeric(df["fecha"], errors="ignore").astype(str)
+    # Equivalente a errors="ignore" (eliminado en pandas 3): si algun valor no es numerico, queda igual.
+    try:
+        fecha = pd.to_numeric(df["fecha"])
+    except (ValueError, TypeError):
+        fecha = df["fecha"]
+    df["fecha"] = fecha.astype(str)
     return df
 
 
+@perf.medido("utils.read_zones")
 def read_zones(paths: DataPaths):
     import geopandas as gpd
 
@@ -66,6 +101,7 @@ def read_zones(paths: DataPaths):
     return zones, boundary
 
 
+@perf.medido("utils.detect_join_column")
 def detect_join_column(stats: pd.DataFrame, zones) -> str | None:
     if stats is None or zones is None or stats.empty or zones.empty:
         return None
@@ -90,9 +126,15 @@ def detect_join_column(stats: pd.DataFrame, zones) -> str | None:
     return best_col if best_ratio >= 0.2 else None
 
 
+@perf.medido("utils.join_stats")
 def join_stats(zones, stats: pd.DataFrame, join_col: str | None):
     if zones is None or stats is None or join_col is None:
         return zones
+    if pd.api.types.is_integer_dtype(stats["zona"]):
+        # Zona ya tipada como int64 (almacen Parquet): solo se convierte la clave de las zonas.
+        key = pd.to_numeric(zones[join_col].astype(str).str.strip(), errors="coerce").astype("Int64")
+        joined = zones.assign(_zona=key).merge(stats, left_on="_zona", right_on="zona", how="left")
+        return joined.drop(columns="_zona")
     stats = stats.copy()
     stats["zona"] = stats["zona"].astype(str).str.strip()
     zones = zones.copy()
@@ -100,26 +142,57 @@ def join_stats(zones, stats: pd.DataFrame, join_col: str | None):
     return zones.merge(stats, left_on=join_col, right_on="zona", how="left")
 
 
-def raster_to_rgb(path: Path):
-    import rasterio
+# Muestra maxima para estimar percentiles del preview
+PREVIEW_SAMPLE = 1 << 16
+
+
+@lru_cache(maxsize=1)
+def _viridis_lut() -> np.ndarray:
+    """Colormap viridis como tabla uint8 de 256 x 3 (mismo muestreo que matplotlib)."""
     from matplotlib import cm
 
-    if not path.exists():
-        return None
-    with rasterio.open(path) as src:
-        band = src.read(1).astype("float32")
-        nodata = src.nodata
+    return (cm.viridis(np.arange(256))[:, :3] * 255).astype("uint8")
+
+
+def _approx_percentiles(values: np.ndarray, q: list[float]) -> np.ndarray:
+    # Percentiles sobre una muestra regular: suficiente para estirar el contraste de un preview.
+    step = max(1, values.size // PREVIEW_SAMPLE)
+    return np.percentile(values[::step], q)
+
+
+@lru_cache(maxsize=32)
+def _render_preview(path: str, mtime_ns: int, max_size: int):
+    from raster_io import read_preview
+
+    # Lee solo la resolucion necesaria para desplegar (usa las overviews del COG si existen).
+    band, nodata = read_preview(Path(path), max_size)
+    band = band.astype("float32", copy=False)
     if nodata is not None:
-        band = np.where(band == nodata, np.nan, band)
-    finite = band[np.isfinite(band)]
+        band[band == nodata] = np.nan
+    valid = np.isfinite(band)
+    finite = band[valid]
     if finite.size == 0:
         return None
-    vmin, vmax = np.percentile(finite, [2, 98])
+    vmin, vmax = _approx_percentiles(finite, [2, 98])
     if vmin == vmax:
-        vmin, vmax = float(np.nanmin(band)), float(np.nanmax(band))
+        vmin, vmax = float(finite.min()), float(finite.max())
     if vmin == vmax:
         return None
-    scaled = np.clip((band - vmin) / (vmax - vmin), 0, 1)
-    rgba = cm.viridis(scaled)
-    rgb = (rgba[:, :, :3] * 255).astype("uint8")
+    # Indice 0..255 en la tabla de colores, igual que cm.viridis sobre valores en [0, 1].
+    idx = np.clip((band - vmin) * (256 / (vmax - vmin)), 0, 255)
+    idx[~valid] = 0
+    rgb = _viridis_lut()[idx.astype("uint8")]
+    rgb[~valid] = 0
+    rgb.setflags(write=False)
+    return rgb
+
+
+@perf.medido("utils.raster_to_rgb")
+def raster_to_rgb(path: Path, max_size: int = 700):
+    """Preview RGB de la banda 1; se memoriza por (ruta, mtime, tamano)."""
+    if not path.exists():
+        return None
+    hits = _render_preview.cache_info().hits
+    rgb = _render_preview(str(path.resolve()), path.stat().st_mtime_ns, max_size)
+    perf.contar("utils.raster_to_rgb", _render_preview.cache_info().hits > hits)
     return rgb
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from zonal import CHANGE_COLUMNS, MIN_STRIP_PIXELS, PIXEL_AREA_HA, ZoneGrid
+
+# Limites superiores (metros) de las bandas de distancia a la red vial: 0-50, 50-100, 100-200.
+# Los pixeles mas lejos que la ultima banda no se asignan a ninguna.
+BANDAS_VIALES = (50, 100, 200)
+COLUMNA_CLASE_VIA = "Clase_Ruta"
+# Clases de cambio que se cruzan con la red vial (1 urbanizacion, 2 perdida, 3 ganancia)
+_CLASES = np.arange(1, len(CHANGE_COLUMNS) + 1)
+
+
+def nombre_banda(desde: float, hasta: float) -> str:
+    return f"{desde:g}_{hasta:g}m"
+
+
+def nombres_bandas(bandas=BANDAS_VIALES) -> list[str]:
+    limites = (0,) + tuple(bandas)
+    return [nombre_banda(a, b) for a, b in zip(limites[:-1], limites[1:])]
+
+
+def cambio_por_distancia_vial(
+    ruta_cambios: Path,
+    grid: ZoneGrid,
+    ruta_red: Path,
+    bandas=BANDAS_VIALES,
+    columna_clase: str = COLUMNA_CLASE_VIA,
+) -> pd.DataFrame:
+    """
+    Hectareas de cada clase de cambio por (zona, clase de via, banda de distancia a la via
+    mas cercana). Se arma un STRtree con la red y cada pixel con cambio dentro de una zona
+    se consulta una sola vez (`query_nearest` vectorizado, acotado a la ultima banda), en
+    franjas de filas del raster de cambios. Retorna una fila por combinacion con pixeles.
+    """
+    import geopandas as gpd
+    import rasterio
+    import shapely
+    from pyproj import Transformer
+    from rasterio.windows import Window
+
+    bandas = np.asarray(bandas, dtype=np.float64)
+    red = gpd.read_file(ruta_red)
+    red = red[red.geometry.notna() & ~red.geometry.is_empty]
+    # Distancias en metros: el CRS de la red si es proyectado, si no su zona UTM
+    crs_metrico = red.crs if red.crs.is_projected else red.estimate_utm_crs()
+    red = red.to_crs(crs_metrico)
+    if columna_clase in red.columns:
+        clases_via, clase_por_via = np.unique(red[columna_clase].astype(str).to_numpy(), return_inverse=True)
+    else:
+        clases_via, clase_por_via = np.array(["todas"]), np.zeros(len(red), dtype=np.int64)
+    tree = shapely.STRtree(red.geometry.to_numpy())
+
+    n_vias, n_bandas, n_cambios = len(clases_via), len(bandas), len(_CLASES)
+    n_bins = grid.n_zones * n_vias * n_bandas * n_cambios
+    counts = np.zeros(n_bins, dtype=np.int64)
+    with rasterio.open(ruta_cambios) as src:
+        crs_wkt = src.crs.to_wkt() if src.crs else ""
+        if not grid.matches(src.transform, src.shape, crs_wkt):
+            raise ValueError(f"La grilla de zonas no esta alineada con {ruta_cambios}")
+        to_metric = Transformer.from_crs(src.crs, crs_metrico, always_xy=True)
+        transform = src.transform
+        block_h = src.block_shapes[0][0]
+        strip_rows = max(block_h, -(-MIN_STRIP_PIXELS // src.width))
+        strip_rows = -(-strip_rows // block_h) * block_h
+        for row in range(0, src.height, strip_rows):
+            h = min(strip_rows, src.height - row)
+            clase = src.read(1, window=Window(0, row, src.width, h))
+            labels = grid.labels[row : row + h]
+            rows, cols = np.nonzero((labels > 0) & np.isin(clase, _CLASES))
+            if not len(rows):
+                continue
+            # Centro de cada pixel en el CRS del raster y luego en metros
+            x, y = transform * (cols + 0.5, rows + row + 0.5)
+            x, y = to_metric.transform(x, y)
+            pares, distancia = tree.query_nearest(
+                shapely.points(x, y), max_distance=bandas[-1], return_distance=True, all_matches=False
+            )
+            pixel, via = pares
+            banda = np.searchsorted(bandas, distancia, side="left")
+            zona = labels[rows[pixel], cols[pixel]].astype(np.int64) - 1
+            codes = ((zona * n_vias + clase_por_via[via]) * n_bandas + banda) * n_cambios
+            codes += clase[rows[pixel], cols[pixel]].astype(np.int64) - 1
+            counts += np.bincount(codes, minlength=n_bins)
+
+    counts = counts.reshape(grid.n_zones, n_vias, n_bandas, n_cambios)
+    zona, via, banda = np.nonzero(counts.sum(axis=3))
+    df = pd.DataFrame(
+        {
+            "zona": grid.zone_ids[zona],
+            "clase_via": clases_via[via],
+            "banda": np.asarray(nombres_bandas(bandas))[banda],
+        }
+    )
+    for k, col in enumerate(CHANGE_COLUMNS):
+        df[f"{col}_ha"] = counts[zona, via, banda, k] * PIXEL_AREA_HA
+    return df
+
+
+def columnas_por_banda(cambio_vial: pd.DataFrame, bandas=BANDAS_VIALES) -> pd.DataFrame:
+    """
+    Tabla ancha por zona (todas las clases de via) con una columna por cambio y banda, p. ej.
+    `urbanizacion_ha_0_50m`, para unir a las estadisticas zonales por `zona`.
+    """
+    valores = [f"{col}_ha" for col in CHANGE_COLUMNS]
+    ancha = cambio_vial.pivot_table(index="zona", columns="banda", values=valores, aggfunc="sum", fill_value=0.0)
+    columnas = [(valor, banda) for valor in valores for banda in nombres_bandas(bandas)]
+    ancha = ancha.reindex(columns=pd.MultiIndex.from_tuples(columnas), fill_value=0.0)
+    ancha.columns = [f"{valor}_{banda}" for valor, banda in ancha.columns]
+    return ancha.reset_index()
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from change import CLASES_CAMBIO
+
+# Mismo category_map que usaba rasterstats en el notebook 04; las demas clases quedan con su codigo.
+CATEGORY_MAP = {0: "sin_cambio", 1: "urbanizacion", 2: "perdida_veg", 3: "ganancia_veg"}
+CHANGE_COLUMNS = ["urbanizacion", "perdida_veg", "ganancia_veg"]
+# 10m x 10m = 100 m2 por pixel
+PIXEL_AREA_HA = 100 / 10000
+N_CLASES = len(CLASES_CAMBIO)
+# Minimo de pixeles por franja para que el histograma no quede dominado por el tamano de la tabla
+MIN_STRIP_PIXELS = 1 << 22
+
+
+@dataclass
+class ZoneGrid:
+    """
+    Zonas rasterizadas sobre la grilla del raster de cambios.
+    `labels` vale 0 fuera de las zonas e i + 1 para la zona i de `zone_ids`.
+    """
+
+    labels: np.ndarray
+    zone_ids: np.ndarray
+    transform: tuple
+    crs_wkt: str
+
+    @property
+    def n_zones(self) -> int:
+        return len(self.zone_ids)
+
+    def matches(self, transform, shape, crs_wkt: str) -> bool:
+        return (
+            tuple(self.labels.shape) == tuple(shape)
+            and np.allclose(self.transform, tuple(transform)[:6])
+            and self.crs_wkt == crs_wkt
+        )
+
+    def save(self, path: Path, extra: dict | None = None) -> None:
+        meta = {"transform": list(self.transform), "crs_wkt": self.crs_wkt}
+        meta.update(extra or {})
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            np.savez(f, labels=self.labels, zone_ids=self.zone_ids, meta=np.array(json.dumps(meta)))
+
+    @classmethod
+    def load(cls, path: Path) -> tuple["ZoneGrid", dict]:
+        with np.load(path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            grid = cls(data["labels"], data["zone_ids"], tuple(meta["transform"]), meta["crs_wkt"])
+        return grid, meta
+
+
+def rasterize_zones(zonas, zone_ids, transform, shape, crs_wkt: str) -> ZoneGrid:
+    """
+    Rasteriza todas las zonas (ya en el CRS del raster) en una sola grilla de etiquetas.
+    Igual que rasterstats, un pixel pertenece a la zona que contiene su centro;
+    si dos zonas se solapan, el pixel queda en la ultima.
+    """
+    from rasterio import features
+
+    n = len(zonas)
+    dtype = "int32" if n < np.iinfo(np.int32).max else "int64"
+    shapes = ((geom, i + 1) for i, geom in enumerate(zonas.geometry) if geom is not None and not geom.is_empty)
+    labels = features.rasterize(shapes, out_shape=shape, transform=transform, fill=0, dtype=dtype)
+    zone_ids = np.asarray(zone_ids)
+    if zone_ids.dtype == object:
+        # Los identificadores de texto se guardan como unicode fijo para poder usar np.savez sin pickle.
+        zone_ids = zone_ids.astype(str)
+    return ZoneGrid(labels, zone_ids, tuple(transform)[:6], crs_wkt)
+
+
+def zone_class_counts(grid: ZoneGrid, ruta_cambios: Path, n_clases: int = N_CLASES) -> np.ndarray:
+    """
+    Cuenta pixeles por (zona, clase) con un histograma `np.bincount` sobre etiqueta * n_clases + clase.
+    Retorna un arreglo (n_zonas, n_clases). Lee el raster por franjas de filas.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    n_bins = (grid.n_zones + 1) * n_clases
+    counts = np.zeros(n_bins, dtype=np.int64)
+    with rasterio.open(ruta_cambios) as src:
+        if not grid.matches(src.transform, src.shape, src.crs.to_wkt() if src.crs else ""):
+            raise ValueError(f"La grilla de zonas no esta alineada con {ruta_cambios}")
+        block_h = src.block_shapes[0][0]
+        strip_rows = max(block_h, -(-max(n_bins, MIN_STRIP_PIXELS) // src.width))
+        strip_rows = -(-strip_rows // block_h) * block_h
+        for row in range(0, src.height, strip_rows):
+            h = min(strip_rows, src.height - row)
+            clase = src.read(1, window=Window(0, row, src.width, h))
+            labels = grid.labels[row : row + h]
+            valid = labels > 0
+            if src.nodata is not None:
+                valid &= clase != src.nodata
+            clase = clase[valid].astype(np.int64)
+            if clase.size and (clase.min() < 0 or clase.max() >= n_clases):
+                raise ValueError(f"Clase fuera de rango [0, {n_clases}) en {ruta_cambios}")
+            codes = labels[valid].astype(np.int64) * n_clases + clase
+            counts += np.bincount(codes, minlength=n_bins)
+    return counts.reshape(grid.n_zones + 1, n_clases)[1:]
+
+
+def zone_band_means(grid: ZoneGrid, ruta: Path) -> np.ndarray:
+    """
+    Promedio por zona de cada banda de `ruta` (p. ej. indices_<ano>.tif), sin NaN ni nodata:
+    arreglo (n_zonas, n_bandas), NaN si la zona no tiene pixeles validos. Sumas y conteos
+    salen de un `np.bincount` con pesos por franja de filas.
+    """
+    import rasterio
+    from rasterio.windows import Window
+
+    from raster_io import is_scaled, read_scaled
+
+    with rasterio.open(ruta) as src:
+        if not grid.matches(src.transform, src.shape, src.crs.to_wkt() if src.crs else ""):
+            raise ValueError(f"La grilla de zonas no esta alineada con {ruta}")
+        n_bins = grid.n_zones + 1
+        sums = np.zeros((src.count, n_bins), dtype=np.float64)
+        counts = np.zeros((src.count, n_bins), dtype=np.int64)
+        nodata = src.nodata if src.nodata is not None and not np.isnan(src.nodata) and not is_scaled(src) else None
+        block_h = src.block_shapes[0][0]
+        strip_rows = max(block_h, -(-MIN_STRIP_PIXELS // src.width))
+        strip_rows = -(-strip_rows // block_h) * block_h
+        for row in range(0, src.height, strip_rows):
+            h = min(strip_rows, src.height - row)
+            data = read_scaled(src, window=Window(0, row, src.width, h))
+            labels = grid.labels[row : row + h]
+            inside = labels > 0
+            for b in range(src.count):
+                band = data[b]
+                valid = inside & ~np.isnan(band)
+                if nodata is not None:
+                    valid &= band != nodata
+                codes = labels[valid].astype(np.int64)
+                sums[b] += np.bincount(codes, weights=band[valid], minlength=n_bins)
+                counts[b] += np.bincount(codes, minlength=n_bins)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+    return means[:, 1:].T
+
+
+def tabla_zonal(counts: np.ndarray, zone_ids) -> pd.DataFrame:
+    """
+    Arma las columnas de estadisticas_cambio.csv a partir de los conteos por clase:
+    conteo por categoria (NaN si la zona no tiene pixeles de esa clase, como rasterstats),
+    count/sum/mean, zona, `_pct` y `_ha`.
+    """
+    counts = np.asarray(counts)
+    data = {}
+    for clase in range(counts.shape[1]):
+        col = counts[:, clase].astype("float64")
+        col[col == 0] = np.nan
+        data[CATEGORY_MAP.get(clase, clase)] = col
+    df = pd.DataFrame(data)
+    total = counts.sum(axis=1)
+    suma = (counts * np.arange(counts.shape[1])).sum(axis=1).astype("float64")
+    df["count"] = total
+    df["sum"] = np.where(total > 0, suma, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        df["mean"] = np.where(total > 0, suma / np.maximum(total, 1), np.nan)
+    df["zona"] = zone_ids
+
+    total_pixeles = df[list(CATEGORY_MAP.values())].sum(axis=1)
+    for col in CHANGE_COLUMNS:
+        df[f"{col}_pct"] = 100 * df[col] / total_pixeles
+    for col in CHANGE_COLUMNS:
+        df[f"{col}_ha"] = df[col] * PIXEL_AREA_HA
+    return df
+
+
+def load_zone_grid(
+    zonas,
+    columna_zona: str,
+    ruta_cambios: Path,
+    cache_path: Path | None = None,
+    source_key: str | None = None,
+) -> ZoneGrid:
+    """
+    Rasteriza las zonas sobre la grilla de `ruta_cambios`, reutilizando `cache_path` si coincide
+    la grilla, la columna de zona y `source_key` (identificador del archivo de zonas).
+    """
+    import rasterio
+
+    with rasterio.open(ruta_cambios) as src:
+        transform, shape = src.transform, src.shape
+        crs_wkt = src.crs.to_wkt() if src.crs else ""
+
+    if cache_path is not None and cache_path.exists():
+        grid, meta = ZoneGrid.load(cache_path)
+        if (
+            grid.matches(transform, shape, crs_wkt)
+            and meta.get("columna_zona") == columna_zona
+            and meta.get("source_key") == source_key
+        ):
+            return grid
+
+    if zonas.crs is not None and crs_wkt:
+        zonas = zonas.to_crs(crs_wkt)
+    grid = rasterize_zones(zonas, zonas[columna_zona].to_numpy(), transform, shape, crs_wkt)
+    if cache_path is not None:
+        grid.save(cache_path, {"columna_zona": columna_zona, "source_key": source_key})
+    return grid
+
+
+def analisis_zonal_cambios(ruta_cambios: Path, ruta_zonas: Path, columna_zona: str = "NOM_ZONA", cache_path: Path | None = None):
+    """
+    Calcula estadisticas de cambio por zona.
+    Con `cache_path`, la grilla de etiquetas se guarda y las siguientes corridas solo
+    recalculan el histograma sobre el raster de cambios.
+    """
+    import geopandas as gpd
+
+    zonas = gpd.read_file(ruta_zonas)
+    stat = Path(ruta_zonas).stat()
+    source_key = f"{Path(ruta_zonas).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+    grid = load_zone_grid(zonas, columna_zona, ruta_cambios, cache_path, source_key)
+    if zonas.crs is not None and grid.crs_wkt:
+        zonas = zonas.to_crs(grid.crs_wkt)
+
+    df_stats = tabla_zonal(zone_class_counts(grid, ruta_cambios), grid.zone_ids)
+    # Agrega la geometria
+    return gpd.GeoDataFrame(df_stats, geometry=zonas.geometry.to_numpy(), crs=zonas.crs)
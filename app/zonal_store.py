@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pandas as pd
+
+from change import CLASES_CAMBIO
+from zonal import CHANGE_COLUMNS
+
+PARTITION = "periodo"
+PART_FILE = "part-0.parquet"
+# Filas por row group. Los lectores de la app (mapa, totales, top 10, descarga) usan todas las
+# zonas de un periodo, asi que la lectura solo recorta columnas; con ~1000 manzanas cada
+# particion es un unico grupo. El limite acota la memoria al escribir tablas grandes (datos
+# sinteticos) y, con las filas ordenadas por zona, deja estadisticas min/max por grupo para
+# lectores externos que filtren por zona.
+ROW_GROUP_SIZE = 64 * 1024
+COUNT_COLUMNS = [CLASES_CAMBIO[clase] for clase in sorted(CLASES_CAMBIO)]
+PCT_COLUMNS = [f"{col}_pct" for col in CHANGE_COLUMNS]
+HA_COLUMNS = [f"{col}_ha" for col in CHANGE_COLUMNS]
+
+
+def zonal_schema(zona_entera: bool = True):
+    """
+    Esquema de las estadisticas zonales. `zona` es int64 cuando los identificadores son
+    enteros (p. ej. MANZENT de 14 digitos) y un diccionario de texto en otro caso.
+    Los conteos por clase son enteros (0 si la zona no tiene esa clase, con `_pct`/`_ha` en NaN).
+    """
+    import pyarrow as pa
+
+    zona_type = pa.int64() if zona_entera else pa.dictionary(pa.int32(), pa.string())
+    fields = [pa.field("zona", zona_type, nullable=False)]
+    fields += [pa.field(col, pa.int32(), nullable=False) for col in COUNT_COLUMNS]
+    fields.append(pa.field("count", pa.int64(), nullable=False))
+    fields += [pa.field(col, pa.float64()) for col in PCT_COLUMNS + HA_COLUMNS]
+    return pa.schema(fields)
+
+
+def periodo_key(t1, t2) -> str:
+    return f"{t1}_{t2}"
+
+
+def _zona_entera(zona: pd.Series) -> pd.Series | None:
+    """Identificadores como int64 si la conversion es exacta (sin ceros a la izquierda ni texto)."""
+    texto = zona.astype(str).str.strip()
+    numeros = pd.to_numeric(texto, errors="coerce")
+    if numeros.isna().any():
+        return None
+    numeros = numeros.astype("int64")
+    return numeros if (numeros.astype(str) == texto).all() else None
+
+
+def to_table(stats: pd.DataFrame):
+    """
+    Convierte una tabla zonal (columnas de `zonal.tabla_zonal` o de estadisticas_cambio.csv)
+    al esquema tipado. Las clases sin nombre (4, 5) pasan a `agua_nueva`/`agua_perdida` y se
+    descartan `mean`/`sum`, que promedian codigos de clase.
+    """
+    import pyarrow as pa
+
+    stats = stats.rename(columns={str(k): v for k, v in CLASES_CAMBIO.items()})
+    stats = stats.rename(columns={k: v for k, v in CLASES_CAMBIO.items()})
+    zona = _zona_entera(stats["zona"])
+    data = {"zona": zona if zona is not None else stats["zona"].astype(str).str.strip()}
+    for col in COUNT_COLUMNS:
+        values = stats[col] if col in stats.columns else 0
+        data[col] = pd.Series(values, index=stats.index).fillna(0).astype("int32")
+    data["count"] = stats["count"].fillna(0).astype("int64")
+    # Sin pixeles de la clase el porcentaje y las hectareas quedan en NaN, igual que en el CSV:
+    # el mapa pinta esas zonas en gris (sin dato) y no como 0 %
+    for col in CHANGE_COLUMNS:
+        for suffix in ("pct", "ha"):
+            data[f"{col}_{suffix}"] = stats[f"{col}_{suffix}"].astype("float64").mask(data[col] == 0)
+    df = pd.DataFrame(data).sort_values("zona", kind="stable")
+    return pa.Table.from_pandas(df, schema=zonal_schema(zona is not None), preserve_index=False)
+
+
+def write_periodo(stats: pd.DataFrame, root: Path, periodo: str) -> Path:
+    """Escribe (o reemplaza) la particion `periodo=<periodo>` del almacen."""
+    import pyarrow.parquet as pq
+
+    path = root / f"{PARTITION}={periodo}" / PART_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    pq.write_table(to_table(stats), tmp, row_group_size=ROW_GROUP_SIZE, compression="zstd")
+    os.replace(tmp, path)
+    return path
+
+
+def list_periodos(root: Path) -> list[str]:
+    if not root.is_dir():
+        return []
+    prefix = f"{PARTITION}="
+    return sorted(
+        p.name[len(prefix) :] for p in root.iterdir() if p.name.startswith(prefix) and (p / PART_FILE).exists()
+    )
+
+
+def periodo_files(root: Path) -> list[Path]:
+    return [root / f"{PARTITION}={periodo}" / PART_FILE for periodo in list_periodos(root)]
+
+
+def periodo_total(periodos: list[str]) -> str | None:
+    """Periodo de mayor extension (primera fecha mas antigua, ultima mas reciente)."""
+    pares = [tuple(p.split("_", 1)) for p in periodos if "_" in p]
+    if not pares:
+        return None
+    t1 = min(a for a, _ in pares)
+    candidatos = [b for a, b in pares if a == t1]
+    return periodo_key(t1, max(candidatos))
+
+
+def read_periodo(root: Path, periodo: str, columns: list[str] | None = None) -> pd.DataFrame:
+    """
+    Lee una particion completa (todas las zonas) leyendo solo `columns` (siempre incluye `zona`):
+    con `columns` pyarrow solo decodifica esas columnas de cada row group.
+    """
+    import pyarrow.parquet as pq
+
+    path = root / f"{PARTITION}={periodo}" / PART_FILE
+    if columns is not None:
+        columns = ["zona"] + [c for c in columns if c != "zona"]
+    df = pq.read_table(path, columns=columns).to_pandas()
+    if isinstance(df["zona"].dtype, pd.CategoricalDtype):
+        df["zona"] = df["zona"].astype(str)
+    return df
+
+
+def export_csv(root: Path, periodo: str, path: Path) -> Path:
+    """Exporta una particion como CSV (formato de intercambio; la app lee el almacen)."""
+    read_periodo(root, periodo).to_csv(path, index=False)
+    return path
+
+
+def migrate_csv(csv_path: Path, root: Path, periodo: str) -> Path:
+    """Carga un estadisticas_cambio.csv existente en el almacen."""
+    return write_periodo(pd.read_csv(csv_path), root, periodo)
+
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from multiprocessing import get_context
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "app"))
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+
+from config import MAP_COLUMNS, MAP_DETAIL_ZOOM  # noqa: E402
+from datos_sinteticos import generar_conjunto  # noqa: E402
+
+ETAPAS = (
+    "calcular_indices",
+    "detectar_cambios",
+    "analisis_zonal_cambios",
+    "raster_to_rgb",
+    "join_stats",
+    "geojson_mapa",
+)
+TOLERANCIA = 0.25
+# Alcance de `rss_pico_mb`: solo la etapa medida o todo el proceso (imports y carga de insumos)
+ALCANCE_ETAPA = "etapa"
+ALCANCE_PROCESO = "proceso"
+
+
+def _proc_status_mb(campo: str) -> float | None:
+    """Campo de /proc/self/status en MB (VmRSS, VmHWM); None fuera de Linux."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for linea in f:
+                if linea.startswith(campo + ":"):
+                    return int(linea.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _reiniciar_pico() -> bool:
+    """Reinicia el RSS maximo del proceso (Linux >= 4.0); False si no se puede."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _rss_pico_mb() -> float | None:
+    """RSS maximo del proceso desde el inicio o desde el ultimo `_reiniciar_pico` (MB)."""
+    pico = _proc_status_mb("VmHWM")
+    if pico is not None:
+        return pico
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss nunca baja: es el pico acumulado del proceso. Linux reporta KB y macOS bytes
+    return pico / (1024 * 1024) if sys.platform == "darwin" else pico / 1024
+
+
+@dataclass
+class Medicion:
+    etapa: str
+    segundos: float
+    rss_pico_mb: float | None
+    rss_pico_alcance: str
+    rss_previo_mb: float | None
+    unidades: int
+    unidad: str
+
+    @property
+    def throughput(self) -> float:
+        return self.unidades / self.segundos if self.segundos > 0 else float("inf")
+
+    def as_dict(self) -> dict:
+        return {**asdict(self), "throughput": self.throughput, "throughput_unidad": f"{self.unidad}/s"}
+
+
+def _preparar(etapa: str, conjunto: dict, trabajo: Path):
+    """
+    Carga las entradas de `etapa` fuera del tiempo medido. Retorna (fn, unidades, unidad,
+    guardar): `fn` es lo que se mide y `guardar` (opcional) deja su salida para las siguientes.
+    """
+    pixeles = conjunto["ancho"] * conjunto["alto"]
+    indices = {t: trabajo / f"indices_{t}.tif" for t in ("t1", "t2")}
+    cambios = trabajo / "cambio_clasificado.tif"
+    store = trabajo / "estadisticas_cambio"
+
+    if etapa == "calcular_indices":
+        from indices import calcular_indices
+
+        def _fn():
+            for t in ("t1", "t2"):
+                calcular_indices(conjunto[t], indices[t])
+
+        return _fn, 2 * pixeles, "px", None
+    if etapa == "detectar_cambios":
+        from change import detectar_cambios
+
+        # Recorrido por bloques con ClasificadorCambio, el mismo de clasificar_cambio_urbano.
+        return (
+            lambda: detectar_cambios(indices["t1"], indices["t2"], cambios, trabajo / "cambio_diferencia_ndvi.tif"),
+            pixeles,
+            "px",
+            None,
+        )
+    if etapa == "analisis_zonal_cambios":
+        import pandas as pd
+        from zonal import analisis_zonal_cambios
+        from zonal_store import write_periodo
+
+        salida = {}
+
+        def _fn():
+            salida["resultados"] = analisis_zonal_cambios(cambios, conjunto["zonas"], "MANZENT")
+
+        def _guardar():
+            write_periodo(pd.DataFrame(salida["resultados"].drop(columns="geometry")), store, "2018_2024")
+
+        return _fn, conjunto["manzanas"], "zonas", _guardar
+    if etapa == "raster_to_rgb":
+        from utils import _render_preview, raster_to_rgb
+
+        def _fn():
+            # Sin el cache en memoria: se mide la lectura de overviews y el coloreado.
+            _render_preview.cache_clear()
+            return raster_to_rgb(indices["t1"])
+
+        return _fn, pixeles, "px", None
+
+    import geopandas as gpd
+    from utils import detect_join_column, join_stats
+    from zonal_store import read_periodo
+
+    # Mismo estado que la app: zonas en EPSG:4326 y estadisticas del almacen Parquet.
+    zonas = gpd.read_file(conjunto["zonas"]).to_crs("EPSG:4326")
+    stats = read_periodo(store, "2018_2024")
+    n = conjunto["manzanas"]
+    if etapa == "join_stats":
+        return (lambda: join_stats(zonas, stats, detect_join_column(stats, zonas))), n, "zonas", None
+    if etapa == "geojson_mapa":
+        from map_layer import MapData
+
+        unidas = join_stats(zonas, stats, detect_join_column(stats, zonas))
+        return (lambda: MapData(unidas, list(MAP_COLUMNS), "MANZENT").geojson(MAP_DETAIL_ZOOM)), n, "zonas", None
+    raise ValueError(f"Etapa desconocida: {etapa}")
+
+
+def _medir_etapa(etapa: str, conjunto: dict, trabajo: Path, repeticiones: int) -> dict:
+    """
+    Se ejecuta en un proceso nuevo por etapa. El RSS pico se reinicia despues de cargar los
+    insumos: es el maximo mientras corre la etapa. Donde no se puede reiniciar (fuera de
+    Linux) es el pico acumulado del proceso y `rss_pico_alcance` lo indica.
+    """
+    fn, unidades, unidad, guardar = _preparar(etapa, conjunto, trabajo)
+    previo = _proc_status_mb("VmRSS") or _rss_pico_mb()
+    alcance = ALCANCE_ETAPA if _reiniciar_pico() else ALCANCE_PROCESO
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    pico = _rss_pico_mb()
+    if guardar is not None:
+        guardar()
+    return Medicion(etapa, mejor, pico, alcance, previo, unidades, unidad).as_dict()
+
+
+def _entorno() -> dict:
+    import numpy as np
+    import rasterio
+
+    return {
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+        "numpy": np.__version__,
+        "rasterio": rasterio.__version__,
+        "gdal": rasterio.__gdal_version__,
+    }
+
+
+def comparar(actual: dict, base: dict, tolerancia: float = TOLERANCIA) -> list[str]:
+    """Etapas cuyo tiempo o RSS pico supera al de `base` en mas de `tolerancia` (fraccion)."""
+    anteriores = {m["etapa"]: m for m in base.get("etapas", [])}
+    regresiones = []
+    for m in actual["etapas"]:
+        ref = anteriores.get(m["etapa"])
+        if ref is None:
+            continue
+        for campo in ("segundos", "rss_pico_mb"):
+            if m.get(campo) is None or not ref.get(campo):
+                continue
+            if campo == "rss_pico_mb" and m.get("rss_pico_alcance") != ref.get("rss_pico_alcance"):
+                continue
+            if m[campo] > ref[campo] * (1 + tolerancia):
+                regresiones.append(f"{m['etapa']}: {campo} {ref[campo]:.3f} -> {m[campo]:.3f}")
+    return regresiones
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Mide tiempo, RSS pico y throughput de las etapas de raster y de la app sobre datos sinteticos."
+    )
+    parser.add_argument("--megapixeles", type=float, default=10.0, help="Pixeles por escena (10 a 1000).")
+    parser.add_argument("--manzanas", type=int, default=1000, help="Cantidad de poligonos (1k a 1M).")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--etapas", nargs="+", choices=ETAPAS, default=list(ETAPAS))
+    parser.add_argument("--repeticiones", type=int, default=1, help="Se reporta el mejor tiempo.")
+    parser.add_argument("--datos-dir", type=Path, default=None, help="Por defecto data/benchmark/<mp>mp_<manzanas>.")
+    parser.add_argument("--salida", type=Path, help="Archivo JSON de resultados (por defecto, stdout).")
+    parser.add_argument("--comparar", type=Path, help="JSON de una corrida anterior; falla si hay regresiones.")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Regresion tolerada (0.25 = 25%%).")
+    args = parser.parse_args()
+
+    datos_dir = args.datos_dir or REPO_ROOT / "data" / "benchmark" / f"{args.megapixeles:g}mp_{args.manzanas}"
+    conjunto = generar_conjunto(datos_dir, args.megapixeles, args.manzanas, args.semilla)
+    # Cada etapa usa las salidas de las anteriores: siempre se corren en orden.
+    etapas = [etapa for etapa in ETAPAS if etapa in set(args.etapas)]
+    necesarias = ETAPAS[: ETAPAS.index(etapas[-1]) + 1]
+
+    mediciones = []
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as tmp:
+        for etapa in necesarias:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                medicion = executor.submit(_medir_etapa, etapa, conjunto, Path(tmp), args.repeticiones).result()
+            if etapa in etapas:
+                mediciones.append(medicion)
+                print(
+                    f"{etapa:>24}: {medicion['segundos']:8.3f} s"
+                    f"  {medicion['throughput']:14.1f} {medicion['throughput_unidad']}"
+                    f"  RSS pico {medicion['rss_pico_mb'] or float('nan'):.0f} MB ({medicion['rss_pico_alcance']})",
+                    file=sys.stderr,
+                )
+
+    resultado = {
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "entorno": _entorno(),
+        "datos": {k: v for k, v in conjunto.items() if not isinstance(v, Path)},
+        "repeticiones": args.repeticiones,
+        "etapas": mediciones,
+    }
+    texto = json.dumps(resultado, indent=1)
+    if args.salida:
+        args.salida.parent.mkdir(parents=True, exist_ok=True)
+        args.salida.write_text(texto, encoding="utf-8")
+    else:
+        print(texto)
+
+    if args.comparar:
+        regresiones = comparar(resultado, json.loads(args.comparar.read_text(encoding="utf-8")), args.tolerancia)
+        for linea in regresiones:
+            print(f"REGRESION {linea}", file=sys.stderr)
+        return 1 if regresiones else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "app"))
+
+from change import ClasificadorCambio, clasificar_cambio_urbano_mascaras  # noqa: E402
+
+
+def _indices_sinteticos(rng: np.random.Generator, shape: tuple[int, int]) -> dict[str, np.ndarray]:
+    indices = {key: rng.uniform(-1, 1, size=shape).astype("float32") for key in ("ndvi", "ndbi", "ndwi")}
+    # Algunos NaN y valores exactamente en los umbrales para verificar los bordes.
+    indices["ndvi"].flat[:: 997] = np.nan
+    indices["ndbi"].flat[:: 1009] = 0.0
+    indices["ndwi"].flat[:: 1013] = 0.1
+    return indices
+
+
+def _medir(fn, repeticiones: int) -> float:
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        fn()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark del clasificador de cambio (megapixeles/s).")
+    parser.add_argument("--megapixeles", type=float, default=16.0, help="Tamano total de la escena sintetica.")
+    parser.add_argument("--bloque", type=int, default=512, help="Lado del bloque procesado por pasada.")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    lado = int(np.sqrt(args.megapixeles * 1e6))
+    t1 = _indices_sinteticos(rng, (lado, lado))
+    t2 = _indices_sinteticos(rng, (lado, lado))
+    ventanas = [
+        (slice(r, r + args.bloque), slice(c, c + args.bloque))
+        for r in range(0, lado, args.bloque)
+        for c in range(0, lado, args.bloque)
+    ]
+    bloques = [
+        ({k: v[w] for k, v in t1.items()}, {k: v[w] for k, v in t2.items()})
+        for w in ventanas
+    ]
+
+    clasificador = ClasificadorCambio()
+    salida = np.empty((lado, lado), dtype=np.uint8)
+
+    def referencia():
+        for w, (b1, b2) in zip(ventanas, bloques):
+            salida[w] = clasificar_cambio_urbano_mascaras(b1, b2)
+
+    def lut():
+        for w, (b1, b2) in zip(ventanas, bloques):
+            clasificador.clasificar(b1, b2, out=salida[w])
+
+    referencia()
+    esperado = salida.copy()
+    lut()
+    if not np.array_equal(esperado, salida):
+        print("ERROR: el clasificador LUT no coincide con la referencia")
+        return 1
+
+    megapixeles = lado * lado / 1e6
+    print(f"Escena: {lado}x{lado} ({megapixeles:.1f} MP), bloque {args.bloque}px")
+    resultados = {}
+    for nombre, fn in (("mascaras", referencia), ("lut", lut)):
+        segundos = _medir(fn, args.repeticiones)
+        resultados[nombre] = megapixeles / segundos
+        print(f"{nombre:>9}: {segundos:.3f} s  {resultados[nombre]:.1f} MP/s")
+    print(f"Aceleracion: {resultados['lut'] / resultados['mascaras']:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
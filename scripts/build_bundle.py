@@ -0,0 +1,39 @@
+import argparse
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "app"))
+
+from bundle import build_bundle  # noqa: E402
+from config import BUNDLE_DIR, CACHE_DIR, MAP_DETAIL_ZOOM, PROCESSED_DIR, VECTOR_DIR  # noqa: E402
+from utils import DataPaths  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Precalcula el bundle que carga la app (mapa serializado, estadisticas, previews)."
+    )
+    parser.add_argument("--out-dir", type=Path, default=BUNDLE_DIR)
+    parser.add_argument("--processed-dir", type=Path, default=PROCESSED_DIR)
+    parser.add_argument("--vector-dir", type=Path, default=VECTOR_DIR)
+    parser.add_argument("--cache-dir", type=Path, default=CACHE_DIR)
+    parser.add_argument("--zoom", type=int, default=MAP_DETAIL_ZOOM, help="Zoom para simplificar la geometria.")
+    args = parser.parse_args()
+
+    manifest = build_bundle(
+        DataPaths.from_dirs(args.processed_dir, args.vector_dir),
+        out_dir=args.out_dir,
+        processed_dir=args.processed_dir,
+        cache_dir=args.cache_dir,
+        zoom=args.zoom,
+    )
+    print(
+        f"Bundle {manifest['version']} en {args.out_dir}: {len(manifest['periodos'])} periodos, "
+        f"{len(manifest['previews'])} previews"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
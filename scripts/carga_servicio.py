@@ -0,0 +1,172 @@
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "app"))
+sys.path.insert(0, str(REPO_ROOT / "scripts"))
+
+import numpy as np  # noqa: E402
+
+from servicio_consultas import agregar_argumentos, cargar_indice  # noqa: E402
+
+TIPOS = ("zona", "zonas", "bbox", "top", "trayectoria", "lote")
+
+
+def _get(conn: http.client.HTTPConnection, url: str) -> tuple[int, bytes]:
+    conn.request("GET", url)
+    respuesta = conn.getresponse()
+    return respuesta.status, respuesta.read()
+
+
+def generar_consultas(host: str, port: int, n: int, distintas: int, tipos: list[str], semilla: int) -> list[tuple]:
+    """
+    (tipo, metodo, url, cuerpo) al azar sobre las zonas y periodos que reporta el servicio.
+    Cada tipo usa a lo mas `distintas` consultas diferentes, de modo que se repiten como en
+    un uso real y se mide tambien la cache de respuestas.
+    """
+    rng = random.Random(semilla)
+    conn = http.client.HTTPConnection(host, port)
+    info = json.loads(_get(conn, "/periodos")[1])
+    zonas = [z["zona"] for z in json.loads(_get(conn, "/top?metrica=count&n=1000")[1])["zonas"]]
+    conn.close()
+    periodos, metricas, extension = info["periodos"], info["metricas"], info["extension"]
+
+    def _bbox() -> str:
+        minx, miny, maxx, maxy = extension
+        ancho, alto = (maxx - minx) * rng.uniform(0.02, 0.2), (maxy - miny) * rng.uniform(0.02, 0.2)
+        x, y = rng.uniform(minx, maxx - ancho), rng.uniform(miny, maxy - alto)
+        return f"/bbox?bbox={x:.5f},{y:.5f},{x + ancho:.5f},{y + alto:.5f}&periodo={rng.choice(periodos)}"
+
+    generadores = {
+        "zona": lambda: f"/zona/{rng.choice(zonas)}?periodo={rng.choice(periodos)}",
+        "zonas": lambda: f"/zonas?ids={','.join(rng.sample(zonas, min(20, len(zonas))))}&periodo={rng.choice(periodos)}",
+        "top": lambda: f"/top?metrica={rng.choice(metricas)}&n={rng.choice((5, 10, 50))}&periodo={rng.choice(periodos)}",
+        "trayectoria": lambda: f"/trayectoria/{rng.choice(zonas)}",
+    }
+    if extension is not None:
+        generadores["bbox"] = _bbox
+    tipos = [tipo for tipo in tipos if tipo in generadores or tipo == "lote"]
+    pool = {tipo: [generadores[tipo]() for _ in range(distintas)] for tipo in generadores}
+
+    consultas = []
+    for _ in range(n):
+        tipo = rng.choice(tipos)
+        if tipo == "lote":
+            urls = [rng.choice(pool[rng.choice(list(pool))]) for _ in range(10)]
+            consultas.append((tipo, "POST", "/lote", json.dumps({"consultas": urls})))
+        else:
+            consultas.append((tipo, "GET", rng.choice(pool[tipo]), None))
+    return consultas
+
+
+def ejecutar(host: str, port: int, consultas: list[tuple], concurrencia: int) -> tuple[dict[str, list[float]], int, float]:
+    """Latencias (ms) por tipo, cantidad de errores y segundos totales; una conexion por hilo."""
+    local = threading.local()
+    latencias: dict[str, list[float]] = {}
+    errores = 0
+    lock = threading.Lock()
+
+    def _una(consulta: tuple) -> None:
+        nonlocal errores
+        tipo, metodo, url, cuerpo = consulta
+        if not hasattr(local, "conn"):
+            local.conn = http.client.HTTPConnection(host, port)
+        inicio = time.perf_counter()
+        try:
+            headers = {"Content-Type": "application/json"} if cuerpo else {}
+            local.conn.request(metodo, url, body=cuerpo, headers=headers)
+            respuesta = local.conn.getresponse()
+            respuesta.read()
+            ok = respuesta.status == 200
+        except (OSError, http.client.HTTPException):
+            local.conn.close()
+            local.conn = http.client.HTTPConnection(host, port)
+            ok = False
+        ms = (time.perf_counter() - inicio) * 1000
+        with lock:
+            latencias.setdefault(tipo, []).append(ms)
+            errores += not ok
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(concurrencia, 1)) as executor:
+        list(executor.map(_una, consultas))
+    return latencias, errores, time.perf_counter() - inicio
+
+
+def resumen(latencias: dict[str, list[float]]) -> list[dict]:
+    filas = []
+    todas = [ms for valores in latencias.values() for ms in valores]
+    for tipo, valores in [*sorted(latencias.items()), ("total", todas)]:
+        valores = np.asarray(valores)
+        filas.append(
+            {
+                "tipo": tipo,
+                "consultas": int(valores.size),
+                "p50_ms": float(np.percentile(valores, 50)),
+                "p99_ms": float(np.percentile(valores, 99)),
+                "max_ms": float(valores.max()),
+            }
+        )
+    return filas
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Prueba de carga del servicio de consultas: reporta latencia p50/p99 por tipo de consulta."
+    )
+    parser.add_argument("--url", help="Servicio ya levantado (p. ej. http://127.0.0.1:8765); si no, se levanta uno local.")
+    parser.add_argument("--consultas", type=int, default=5000)
+    parser.add_argument("--concurrencia", type=int, default=8, help="Clientes simultaneos.")
+    parser.add_argument("--distintas", type=int, default=200, help="Consultas diferentes por tipo.")
+    parser.add_argument("--tipos", nargs="+", choices=TIPOS, default=list(TIPOS))
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", type=Path, help="Archivo JSON de resultados.")
+    agregar_argumentos(parser)
+    args = parser.parse_args()
+
+    servidor = None
+    if args.url:
+        partes = urlsplit(args.url)
+        host, port = partes.hostname, partes.port or 80
+    else:
+        from consultas import ServidorConsultas
+
+        servidor = ServidorConsultas(cargar_indice(args), port=0)
+        threading.Thread(target=servidor.serve_forever, daemon=True).start()
+        host, port = servidor.server_address[:2]
+
+    try:
+        consultas = generar_consultas(host, port, args.consultas, args.distintas, args.tipos, args.semilla)
+        latencias, errores, segundos = ejecutar(host, port, consultas, args.concurrencia)
+    finally:
+        if servidor is not None:
+            servidor.shutdown()
+            servidor.server_close()
+
+    filas = resumen(latencias)
+    print(f"{'tipo':<12} {'consultas':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for fila in filas:
+        print(f"{fila['tipo']:<12} {fila['consultas']:>9} {fila['p50_ms']:>8.2f} {fila['p99_ms']:>8.2f} {fila['max_ms']:>8.2f}")
+    print(f"{len(consultas) / segundos:.0f} consultas/s con {args.concurrencia} clientes, {errores} errores")
+    if args.salida:
+        resultado = {
+            "consultas": len(consultas),
+            "concurrencia": args.concurrencia,
+            "segundos": segundos,
+            "errores": errores,
+            "latencias": filas,
+        }
+        args.salida.write_text(json.dumps(resultado, indent=1), encoding="utf-8")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,171 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# Misma grilla que las escenas exportadas desde GEE: EPSG:4326, ~10 m por pixel, esquina
+# noroeste en Estacion Central, 6 bandas uint16 (B2, B3, B4, B8, B11, B12) x 10000.
+PIXEL_DEG = 8.983152841195215e-05
+ORIGEN = (-70.74008283620202, -33.399991084262695)
+BLOQUE = 256
+# Reflectancia media x 10000 por cobertura, en el orden de bandas de la escena
+REFLECTANCIAS = {
+    "vegetacion": (400, 700, 500, 3500, 1800, 900),
+    "urbano": (1200, 1300, 1400, 1800, 2500, 2200),
+    "suelo": (1000, 1300, 1600, 2300, 3000, 2600),
+    "agua": (700, 800, 600, 300, 150, 100),
+}
+RUIDO = 0.08
+# Prefijo de MANZENT (region, provincia, comuna) de las manzanas sinteticas
+PREFIJO_MANZENT = "13106"
+VERTICES_POR_LADO = 6
+
+
+def _cobertura(x: np.ndarray, y: np.ndarray, fecha: int) -> np.ndarray:
+    """
+    Cobertura por pixel (0 vegetacion, 1 urbano, 2 suelo, 3 agua) como funcion suave de las
+    coordenadas globales del pixel, para que cada bloque sea independiente del resto.
+    En cada fecha posterior crece una zona de urbanizacion sobre vegetacion.
+    """
+    f = np.sin(x / 173.0) * np.cos(y / 211.0) + 0.5 * np.sin((x + y) / 97.0)
+    cobertura = np.where(f > 0.4, 0, np.where(f < -1.1, 3, np.where(f < -0.5, 2, 1))).astype(np.uint8)
+    if fecha:
+        g = np.sin(x / 523.0 + 1.3) * np.sin(y / 467.0)
+        cobertura[(cobertura == 0) & (g > 0.9 - 0.15 * fecha)] = 1
+    return cobertura
+
+
+def generar_escena(path: Path, ancho: int, alto: int, fecha: int = 0, semilla: int = 0, compress: str = "lzw") -> Path:
+    """
+    Escribe una escena tipo Sentinel-2 de `ancho` x `alto` pixeles por franjas de un bloque
+    de alto, sin cargarla completa. `fecha` (0, 1, ...) controla el cambio de cobertura.
+    """
+    import rasterio
+    from rasterio.transform import Affine
+    from rasterio.windows import Window
+
+    profile = {
+        "driver": "GTiff",
+        "dtype": "uint16",
+        "count": len(REFLECTANCIAS["urbano"]),
+        "width": ancho,
+        "height": alto,
+        "crs": "EPSG:4326",
+        "transform": Affine(PIXEL_DEG, 0.0, ORIGEN[0], 0.0, -PIXEL_DEG, ORIGEN[1]),
+        "tiled": True,
+        "blockxsize": BLOQUE,
+        "blockysize": BLOQUE,
+        "compress": compress,
+        "interleave": "pixel",
+        "BIGTIFF": "IF_SAFER",
+    }
+    medias = np.array(list(REFLECTANCIAS.values()), dtype=np.float32).T  # (bandas, coberturas)
+    rng = np.random.default_rng([semilla, fecha])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with rasterio.open(tmp, "w", **profile) as dst:
+        x = np.arange(ancho, dtype=np.float32)
+        for row in range(0, alto, BLOQUE):
+            h = min(BLOQUE, alto - row)
+            y = np.arange(row, row + h, dtype=np.float32)[:, None]
+            cobertura = _cobertura(x[None, :], y, fecha)
+            bandas = medias[:, cobertura]
+            bandas *= 1 + RUIDO * rng.standard_normal(bandas.shape, dtype=np.float32)
+            dst.write(np.clip(bandas, 0, 10000).astype(np.uint16), window=Window(0, row, ancho, h))
+    tmp.replace(path)
+    return path
+
+
+def generar_manzanas(path: Path, n: int, escena: Path, semilla: int = 0) -> Path:
+    """
+    Escribe `n` manzanas que cubren la extension de `escena`, en EPSG:3857 y con MANZENT de
+    14 digitos como texto, igual que manzanas_censales.shp. Son celdas de una grilla con
+    vertices intermedios desplazados en funcion de su coordenada: los bordes compartidos
+    quedan identicos entre vecinas y la simplificacion del mapa tiene trabajo real.
+    """
+    import geopandas as gpd
+    import rasterio
+    import shapely
+    from rasterio.warp import transform_bounds
+
+    with rasterio.open(escena) as src:
+        xmin, ymin, xmax, ymax = transform_bounds(src.crs, "EPSG:3857", *src.bounds)
+    cols = max(1, int(np.ceil(np.sqrt(n * (xmax - xmin) / (ymax - ymin)))))
+    rows = int(np.ceil(n / cols))
+    dx, dy = (xmax - xmin) / cols, (ymax - ymin) / rows
+    i = np.arange(n)
+    x0 = xmin + (i % cols) * dx
+    y0 = ymax - (i // cols + 1) * dy
+    geoms = shapely.segmentize(shapely.box(x0, y0, x0 + dx, y0 + dy), min(dx, dy) / VERTICES_POR_LADO)
+
+    amplitud = 0.1 * min(dx, dy)
+    fase = np.random.default_rng(semilla).uniform(0, 2 * np.pi, 2)
+
+    def _desplazar(coords: np.ndarray) -> np.ndarray:
+        u = (coords[:, 0] - xmin) / dx
+        v = (coords[:, 1] - ymin) / dy
+        en_vertical = np.isclose(u, np.round(u))
+        en_horizontal = np.isclose(v, np.round(v))
+        # Cada vertice intermedio se mueve perpendicular a su lado; las esquinas quedan fijas.
+        out = coords.copy()
+        out[:, 0] += np.where(en_vertical & ~en_horizontal, amplitud * np.sin(7.3 * v + fase[0]), 0.0)
+        out[:, 1] += np.where(en_horizontal & ~en_vertical, amplitud * np.sin(5.1 * u + fase[1]), 0.0)
+        return out
+
+    geoms = shapely.transform(geoms, _desplazar)
+    manzent = [f"{PREFIJO_MANZENT}{k:09d}" for k in range(1, n + 1)]
+    zonas = gpd.GeoDataFrame({"MANZENT": manzent, "TOTAL_PERS": (i % 400).astype("int64")}, geometry=geoms, crs="EPSG:3857")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    zonas.to_file(path, driver="GPKG", engine="pyogrio")
+    return path
+
+
+def generar_conjunto(directorio: Path, megapixeles: float, manzanas: int, semilla: int = 0, forzar: bool = False) -> dict:
+    """
+    Genera (o reutiliza, si los parametros coinciden con `meta.json`) dos escenas
+    `sentinel2_2018.tif` / `sentinel2_2024.tif` y `manzanas.gpkg` en `directorio`.
+    """
+    lado = int(np.sqrt(megapixeles * 1e6))
+    params = {"ancho": lado, "alto": lado, "manzanas": manzanas, "semilla": semilla}
+    conjunto = {
+        "t1": directorio / "sentinel2_2018.tif",
+        "t2": directorio / "sentinel2_2024.tif",
+        "zonas": directorio / "manzanas.gpkg",
+    }
+    meta_path = directorio / "meta.json"
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        meta = None
+    if forzar or meta != params or not all(p.exists() for p in conjunto.values()):
+        meta_path.unlink(missing_ok=True)
+        for fecha, key in enumerate(("t1", "t2")):
+            print(f"Generando {conjunto[key]} ({lado}x{lado})")
+            generar_escena(conjunto[key], lado, lado, fecha, semilla)
+        print(f"Generando {conjunto['zonas']} ({manzanas} manzanas)")
+        generar_manzanas(conjunto["zonas"], manzanas, conjunto["t1"], semilla)
+        meta_path.write_text(json.dumps(params, indent=1), encoding="utf-8")
+    return {**conjunto, **params}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Genera escenas Sentinel-2 y manzanas sinteticas para benchmarks.")
+    parser.add_argument("--megapixeles", type=float, default=10.0, help="Pixeles por escena (10 a 1000).")
+    parser.add_argument("--manzanas", type=int, default=1000, help="Cantidad de poligonos (1k a 1M).")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--out-dir", type=Path, default=None, help="Por defecto data/benchmark/<mp>mp_<manzanas>.")
+    parser.add_argument("--forzar", action="store_true", help="Regenera aunque ya existan.")
+    args = parser.parse_args()
+
+    out_dir = args.out_dir or REPO_ROOT / "data" / "benchmark" / f"{args.megapixeles:g}mp_{args.manzanas}"
+    conjunto = generar_conjunto(out_dir, args.megapixeles, args.manzanas, args.semilla, args.forzar)
+    print(f"Datos en {out_dir}: escenas {conjunto['ancho']}x{conjunto['alto']}, {conjunto['manzanas']} manzanas")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
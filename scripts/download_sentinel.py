@@ -1,6 +1,5 @@
 import argparse
 import os
-import shutil
 
 import ee
 import geemap
@@ -41,37 +40,27 @@ def _classify_dest(filename: str, repo_root: str) -> str:
     return os.path.join(repo_root, "data", "raw")
 
 
-def _move_downloaded_files(download_root: str, repo_root: str) -> None:
-    for root, _dirs, files in os.walk(download_root):
-        for filename in files:
-            src = os.path.join(root, filename)
-            dest_dir = _classify_dest(filename, repo_root)
-            _ensure_dir(dest_dir)
-            dst = os.path.join(dest_dir, filename)
-            if os.path.abspath(src) == os.path.abspath(dst):
-                continue
-            if os.path.exists(dst):
-                os.remove(dst)
-            shutil.move(src, dst)
-
-
 def download_from_drive() -> None:
     try:
-        import gdown
+        import gdown  # noqa: F401
     except ImportError:
         print("Falta gdown. Instala con: python -m pip install gdown")
         return
 
+    from downloader import Manifest, download_all, drive_jobs
+
     repo_root = _repo_root()
-    temp_dir = os.path.join(repo_root, "data", "_drive_tmp")
-    if os.path.exists(temp_dir):
-        shutil.rmtree(temp_dir)
-    _ensure_dir(temp_dir)
-
-    url = f"https://drive.google.com/drive/folders/{DRIVE_FOLDER_ID}"
-    gdown.download_folder(url=url, output=temp_dir, quiet=False, use_cookies=False)
-    _move_downloaded_files(temp_dir, repo_root)
-    shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _destination(path: str) -> str:
+        filename = os.path.basename(path)
+        dest_dir = _classify_dest(filename, repo_root)
+        _ensure_dir(dest_dir)
+        return os.path.join(dest_dir, filename)
+
+    # Descarga directa a data/raw y data/vector: sin carpeta temporal, solo los archivos
+    # nuevos o modificados y con reanudacion de descargas parciales.
+    manifest = Manifest(os.path.join(repo_root, "data", "cache", "descargas.json"), root=repo_root)
+    download_all(drive_jobs(DRIVE_FOLDER_ID, _destination), manifest, workers=4)
 
 
 def export_sentinel_gee() -> None:
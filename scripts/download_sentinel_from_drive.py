@@ -7,17 +7,25 @@ FOLDER_ID = "1fgVm3omjUBq0Fm0xAxqVudoD1J2M0MeK"
 
 def main() -> int:
     try:
-        import gdown
+        import gdown  # noqa: F401
     except ImportError:
         print("Falta gdown. Instala con: python -m pip install gdown")
         return 1
 
+    from downloader import Manifest, download_all, drive_jobs
+
     repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
     out_dir = os.path.join(repo_root, "data", "raw")
     os.makedirs(out_dir, exist_ok=True)
 
-    url = f"https://drive.google.com/drive/folders/{FOLDER_ID}"
-    gdown.download_folder(url=url, output=out_dir, quiet=False, use_cookies=False)
+    def _destination(path: str) -> str:
+        dst = os.path.join(out_dir, path)
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        return dst
+
+    # Solo se transfieren los archivos nuevos o modificados; los cortes se reanudan.
+    manifest = Manifest(os.path.join(repo_root, "data", "cache", "descargas.json"), root=repo_root)
+    download_all(drive_jobs(FOLDER_ID, _destination), manifest, workers=4)
     return 0
 
 
@@ -1,7 +1,9 @@
+import argparse
 import os
-import sys
 from urllib.parse import urlparse
 
+from downloader import Manifest, download_all
+
 
 def _filename_from_url(url: str, fallback: str) -> str:
     path = urlparse(url).path
@@ -9,18 +11,11 @@ def _filename_from_url(url: str, fallback: str) -> str:
     return name or fallback
 
 
-def _download(url: str, dst_path: str) -> None:
-    import requests
-
-    with requests.get(url, stream=True, timeout=60) as resp:
-        resp.raise_for_status()
-        with open(dst_path, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=1024 * 1024):
-                if chunk:
-                    f.write(chunk)
-
-
 def main() -> int:
+    parser = argparse.ArgumentParser(description="Descarga las capas vectoriales (IDE, INE y OSM) en data/vector.")
+    parser.add_argument("--workers", type=int, default=3, help="Descargas simultaneas.")
+    args = parser.parse_args()
+
     ide_url = os.getenv("IDE_COMUNA_URL", "").strip()
     ine_url = os.getenv("INE_MANZANAS_URL", "").strip()
     osm_url = os.getenv("OSM_ROADS_URL", "").strip()
@@ -42,12 +37,13 @@ def main() -> int:
         (osm_url, _filename_from_url(osm_url, "red_vial.geojson")),
     ]
 
-    for url, name in downloads:
-        dst = os.path.join(out_dir, name)
-        print(f"Descargando {url} -> {dst}")
-        _download(url, dst)
+    # Descargas en paralelo con sesion compartida; los archivos sin cambios no se transfieren
+    # y los cortes se reanudan desde el .part. Los .zip se descomprimen en data/vector.
+    manifest = Manifest(os.path.join(repo_root, "data", "cache", "descargas.json"), root=repo_root)
+    jobs = [(url, os.path.join(out_dir, name)) for url, name in downloads]
+    download_all(jobs, manifest, workers=args.workers, unzip_to=out_dir)
 
-    print("Descargas completas. Si los archivos vienen en .zip, descomprime en data\\vector.")
+    print("Descargas completas.")
     return 0
 
 
@@ -0,0 +1,289 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = (10, 60)
+# Reintentos por archivo ante cortes a mitad de la transferencia (se reanuda desde el .part)
+ATTEMPTS = 5
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+def make_session(pool_size: int = 8, retries: int = 3):
+    """Sesion con pool de conexiones y reintentos con backoff para errores de conexion y 5xx."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=("GET", "HEAD"),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def sha256_file(path: str, prefix_only: int | None = None):
+    """Hash sha256 del archivo (o de sus primeros `prefix_only` bytes); retorna el objeto hash."""
+    digest = hashlib.sha256()
+    remaining = prefix_only
+    with open(path, "rb") as f:
+        while remaining is None or remaining > 0:
+            chunk = f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest
+
+
+class Manifest:
+    """
+    Registro de descargas por archivo destino: url, ETag, Last-Modified, tamano y sha256.
+    Tambien guarda los validadores de los `.part` para reanudar solo si el recurso no cambio.
+    Cada destino se identifica por su ruta relativa a `root` (la raiz de las descargas), asi
+    que archivos con el mismo nombre en carpetas distintas no comparten entrada.
+    """
+
+    def __init__(self, path: str, root: str | None = None):
+        self.path = path
+        self.root = os.path.abspath(root or os.getcwd())
+        self._lock = threading.Lock()
+        try:
+            with open(path, encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def key(self, dst: str) -> str:
+        return os.path.relpath(os.path.abspath(dst), self.root).replace(os.sep, "/")
+
+    def get(self, key: str) -> dict:
+        with self._lock:
+            return dict(self.entries.get(key, {}))
+
+    def update(self, key: str, **values) -> None:
+        with self._lock:
+            entry = self.entries.setdefault(key, {})
+            entry.update(values)
+            for name in [name for name, value in entry.items() if value is None]:
+                del entry[name]
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+
+
+@dataclass
+class Result:
+    url: str
+    path: str
+    changed: bool
+    size: int
+    sha256: str
+    resumed_from: int = 0
+
+
+class ChecksumError(Exception):
+    pass
+
+
+def _local_is_current(path: str, entry: dict) -> bool:
+    if not os.path.exists(path) or "sha256" not in entry:
+        return False
+    if os.path.getsize(path) != entry.get("size"):
+        return False
+    stat = os.stat(path)
+    if entry.get("mtime_ns") == stat.st_mtime_ns:
+        return True
+    return sha256_file(path).hexdigest() == entry["sha256"]
+
+
+def _validators(resp) -> dict:
+    return {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+
+
+def fetch(session, url: str, dst: str, manifest: Manifest, sha256: str | None = None) -> Result:
+    """
+    Descarga `url` en `dst` a traves de `dst.part`:
+    - si el archivo local coincide con el manifiesto, pide la URL con If-None-Match /
+      If-Modified-Since y no transfiere nada ante un 304 (o si ETag y tamano no cambiaron);
+    - si quedo un `.part` de un intento anterior, reanuda con `Range` + `If-Range`;
+    - verifica tamano (Content-Length) y sha256 (si se indica) antes de reemplazar `dst`.
+    """
+    import requests
+
+    key = manifest.key(dst)
+    part = dst + ".part"
+    entry = manifest.get(key)
+    if not entry:
+        # Manifiestos anteriores usaban solo el nombre del archivo como clave
+        legacy = manifest.get(os.path.basename(dst))
+        entry = legacy if legacy.get("url") == url else {}
+    current = entry.get("url") == url and _local_is_current(dst, entry)
+    if current and sha256 and entry["sha256"] != sha256:
+        current = False
+
+    for attempt in range(ATTEMPTS):
+        headers = {}
+        offset = 0
+        partial = entry.get("partial", {})
+        if current:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        elif os.path.exists(part) and partial.get("url") == url and (partial.get("etag") or partial.get("last_modified")):
+            offset = os.path.getsize(part)
+            if offset:
+                headers["Range"] = f"bytes={offset}-"
+                headers["If-Range"] = partial.get("etag") or partial["last_modified"]
+
+        try:
+            with session.get(url, headers=headers, stream=True, timeout=TIMEOUT) as resp:
+                if resp.status_code == 304 and current:
+                    return Result(url, dst, False, entry["size"], entry["sha256"])
+                if resp.status_code == 416 and offset:
+                    # El .part ya no corresponde al recurso: se descarta y se reintenta completo.
+                    os.remove(part)
+                    continue
+                resp.raise_for_status()
+                validators = _validators(resp)
+                length = resp.headers.get("Content-Length")
+                if current and validators["etag"] and validators["etag"] == entry.get("etag"):
+                    if length is None or int(length) == entry["size"]:
+                        return Result(url, dst, False, entry["size"], entry["sha256"])
+
+                if resp.status_code == 206 and offset:
+                    mode = "ab"
+                    digest = sha256_file(part, offset)
+                    expected = offset + int(length) if length is not None else None
+                else:
+                    mode, offset = "wb", 0
+                    digest = hashlib.sha256()
+                    expected = int(length) if length is not None else None
+                manifest.update(key, partial={"url": url, **validators})
+
+                with open(part, mode) as f:
+                    for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                            digest.update(chunk)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as exc:
+            if attempt == ATTEMPTS - 1:
+                raise
+            print(f"Reintentando {url} ({exc.__class__.__name__})")
+            entry = manifest.get(key)
+            # Si ya se estaba transfiriendo una version nueva, el siguiente intento reanuda el .part.
+            current = current and "partial" not in entry
+            continue
+
+        size = os.path.getsize(part)
+        if expected is not None and size != expected:
+            if attempt == ATTEMPTS - 1:
+                raise ChecksumError(f"{url}: se esperaban {expected} bytes y llegaron {size}")
+            entry, current = manifest.get(key), False
+            continue
+        hexdigest = digest.hexdigest()
+        if sha256 and hexdigest != sha256:
+            os.remove(part)
+            raise ChecksumError(f"{url}: sha256 {hexdigest} distinto del esperado {sha256}")
+        os.replace(part, dst)
+        manifest.update(
+            key,
+            url=url,
+            size=size,
+            sha256=hexdigest,
+            mtime_ns=os.stat(dst).st_mtime_ns,
+            partial=None,
+            **validators,
+        )
+        return Result(url, dst, True, size, hexdigest, offset)
+
+    raise ChecksumError(f"No se pudo descargar {url}")
+
+
+def extract_zip(path: str, out_dir: str) -> list[str]:
+    """Descomprime `path` en `out_dir` (sin rutas fuera de `out_dir`) y retorna los archivos extraidos."""
+    root = os.path.realpath(out_dir)
+    extracted = []
+    with zipfile.ZipFile(path) as zf:
+        for member in zf.infolist():
+            if member.is_dir():
+                continue
+            target = os.path.realpath(os.path.join(out_dir, member.filename))
+            if os.path.commonpath([root, target]) != root:
+                raise ValueError(f"Ruta fuera del destino en {path}: {member.filename}")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with zf.open(member) as src, open(target + ".tmp", "wb") as dst:
+                while True:
+                    chunk = src.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            os.replace(target + ".tmp", target)
+            extracted.append(target)
+    return extracted
+
+
+def download_all(
+    jobs: list,
+    manifest: Manifest,
+    workers: int = 4,
+    session=None,
+    unzip_to: str | None = None,
+) -> list[Result]:
+    """
+    Descarga en paralelo `jobs` = [(url, destino) o (url, destino, sha256)] con una sesion
+    compartida. Con `unzip_to`, los .zip nuevos o modificados se descomprimen ahi.
+    """
+    session = session or make_session(pool_size=max(workers, 1))
+
+    def _job(job) -> Result:
+        url, dst, *rest = job
+        print(f"Descargando {url} -> {dst}")
+        result = fetch(session, url, dst, manifest, rest[0] if rest else None)
+        if unzip_to and dst.lower().endswith(".zip"):
+            members = manifest.get(manifest.key(dst)).get("extracted", [])
+            if not members or result.changed or not all(os.path.exists(os.path.join(unzip_to, m)) for m in members):
+                files = extract_zip(dst, unzip_to)
+                manifest.update(manifest.key(dst), extracted=[os.path.relpath(f, unzip_to) for f in files])
+        print(f"{'Actualizado' if result.changed else 'Sin cambios'}: {dst}")
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        return list(executor.map(_job, jobs))
+
+
+DRIVE_DOWNLOAD_URL = "https://drive.usercontent.google.com/download?id={id}&export=download&confirm=t"
+
+
+def list_drive_folder(folder_id: str) -> list[tuple[str, str]]:
+    """Lista (id, ruta relativa) de los archivos de una carpeta publica de Drive sin descargarlos."""
+    import gdown
+
+    url = f"https://drive.google.com/drive/folders/{folder_id}"
+    files = gdown.download_folder(url=url, output=".", quiet=True, use_cookies=False, skip_download=True)
+    return [(f.id, f.path) for f in files]
+
+
+def drive_jobs(folder_id: str, destination) -> list[tuple[str, str]]:
+    """
+    Trabajos de `download_all` para una carpeta de Drive. `destination(ruta_relativa)` decide
+    la ruta local de cada archivo.
+    """
+    return [(DRIVE_DOWNLOAD_URL.format(id=file_id), destination(path)) for file_id, path in list_drive_folder(folder_id)]
@@ -0,0 +1,68 @@
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "app"))
+
+from dag import Dag  # noqa: E402
+from reportes import construir_reportes  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Genera las figuras de outputs/ (mapa de cambio, top 10, evolucion de indices, paneles e "
+            "histogramas NDVI) sin ventana y en paralelo; solo redibuja las figuras cuyos insumos cambiaron."
+        )
+    )
+    parser.add_argument("--processed-dir", type=Path, default=REPO_ROOT / "data" / "processed")
+    parser.add_argument("--vector-dir", type=Path, default=REPO_ROOT / "data" / "vector")
+    parser.add_argument("--cache-dir", type=Path, default=REPO_ROOT / "data" / "cache")
+    parser.add_argument("--outputs-dir", type=Path, default=REPO_ROOT / "outputs")
+    parser.add_argument(
+        "--t1",
+        help=(
+            "Ano inicial del mapa de cambio y del top 10; debe coincidir con el raster de cambios "
+            "(por defecto, el par guardado en cambio_clasificado.tif)."
+        ),
+    )
+    parser.add_argument(
+        "--t2",
+        help="Ano final del mapa de cambio y del top 10; debe coincidir con el raster de cambios.",
+    )
+    parser.add_argument("--columna-zona", default="MANZENT", help="Columna identificadora de las manzanas.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Figuras en paralelo.")
+    parser.add_argument("--forzar", action="store_true", help="Redibuja todas las figuras.")
+    args = parser.parse_args()
+
+    try:
+        nodes = construir_reportes(
+            args.processed_dir,
+            args.vector_dir,
+            args.cache_dir,
+            args.outputs_dir,
+            t1=args.t1,
+            t2=args.t2,
+            columna_zona=args.columna_zona,
+        )
+    except ValueError as exc:
+        print(exc)
+        return 1
+    if not nodes:
+        print(f"No hay insumos para ninguna figura en {args.processed_dir}")
+        return 1
+
+    inicio = time.perf_counter()
+    dag = Dag(nodes, args.cache_dir / "reportes_state.json")
+    status = dag.run(args.workers, force=args.forzar)
+    for name, estado in status.items():
+        print(f"{name}: {estado}")
+    print(f"Reporte en {time.perf_counter() - inicio:.1f} s")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,81 @@
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "app"))
+
+from change import UMBRAL_DIFERENCIA  # noqa: E402
+from dag import Dag, construir_dag  # noqa: E402
+from indices import INDEX_FORMATS  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Pipeline incremental: solo recalcula las etapas cuyas entradas o parametros cambiaron."
+    )
+    parser.add_argument("--raw-dir", type=Path, default=REPO_ROOT / "data" / "raw")
+    parser.add_argument("--processed-dir", type=Path, default=REPO_ROOT / "data" / "processed")
+    parser.add_argument("--vector-dir", type=Path, default=REPO_ROOT / "data" / "vector")
+    parser.add_argument("--cache-dir", type=Path, default=REPO_ROOT / "data" / "cache")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Etapas independientes en paralelo (por defecto, todos los nucleos).",
+    )
+    parser.add_argument("--t1", help="Ano inicial para la deteccion de cambios (por defecto, el primero).")
+    parser.add_argument("--t2", help="Ano final para la deteccion de cambios (por defecto, el ultimo).")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_DIFERENCIA, help="Umbral de diferencia NDVI.")
+    parser.add_argument("--columna-zona", default="MANZENT", help="Columna identificadora de las manzanas.")
+    parser.add_argument(
+        "--periodos",
+        choices=("todos", "consecutivos", "ninguno"),
+        default="todos",
+        help="Pares de fechas para la tabla de cambios por zona que usa la app.",
+    )
+    parser.add_argument(
+        "--formato-indices",
+        choices=INDEX_FORMATS,
+        default="float32",
+        help="int16 guarda los indices cuantizados (escala 1e-4): la mitad de disco y de lectura.",
+    )
+    parser.add_argument("--descargar", action="store_true", help="Descarga las imagenes de Drive antes de procesar.")
+    parser.add_argument("--forzar", action="store_true", help="Recalcula todas las etapas.")
+
+    args = parser.parse_args()
+    if args.descargar:
+        # Los archivos descargados sin cambios no invalidan nada: las claves usan su contenido.
+        script = REPO_ROOT / "scripts" / "download_sentinel_from_drive.py"
+        if subprocess.run([sys.executable, str(script)]).returncode != 0:
+            return 1
+
+    try:
+        nodes = construir_dag(
+            args.raw_dir,
+            args.processed_dir,
+            args.vector_dir,
+            args.cache_dir,
+            t1=args.t1,
+            t2=args.t2,
+            umbral=args.umbral,
+            columna_zona=args.columna_zona,
+            modo_periodos=None if args.periodos == "ninguno" else args.periodos,
+            formato_indices=args.formato_indices,
+        )
+    except (FileNotFoundError, ValueError) as exc:
+        print(exc)
+        return 1
+
+    args.processed_dir.mkdir(parents=True, exist_ok=True)
+    dag = Dag(nodes, args.cache_dir / "pipeline_state.json")
+    status = dag.run(args.workers, force=args.forzar)
+    for name, estado in status.items():
+        print(f"{name}: {estado}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,75 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "app"))
+
+from indices import INDEX_FORMATS, year_from_path  # noqa: E402
+from pipeline import TILE_BLOCKS, calcular_indices_paralelo, detectar_cambios_paralelo  # noqa: E402
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Calcula indices y deteccion de cambios en paralelo (anos y teselas)."
+    )
+    parser.add_argument("--raw-dir", type=Path, default=REPO_ROOT / "data" / "raw")
+    parser.add_argument("--processed-dir", type=Path, default=REPO_ROOT / "data" / "processed")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="Procesos del pool (por defecto, todos los nucleos).",
+    )
+    parser.add_argument(
+        "--tile-blocks",
+        type=int,
+        default=TILE_BLOCKS,
+        help="Bloques internos del raster por tarea.",
+    )
+    parser.add_argument("--t1", help="Ano inicial para la deteccion de cambios (por defecto, el primero).")
+    parser.add_argument("--t2", help="Ano final para la deteccion de cambios (por defecto, el ultimo).")
+    parser.add_argument("--umbral", type=float, default=0.15, help="Umbral de diferencia NDVI.")
+    parser.add_argument("--solo-indices", action="store_true", help="No ejecuta la deteccion de cambios.")
+    parser.add_argument(
+        "--formato-indices",
+        choices=INDEX_FORMATS,
+        default="float32",
+        help="int16 guarda los indices cuantizados (escala 1e-4): la mitad de disco y de lectura.",
+    )
+
+    args = parser.parse_args()
+    imagenes = sorted(args.raw_dir.glob("sentinel2_*.tif"))
+    if not imagenes:
+        print(f"No se encontraron archivos sentinel2_*.tif en {args.raw_dir}")
+        return 1
+
+    calcular_indices_paralelo(imagenes, args.processed_dir, args.workers, args.tile_blocks, args.formato_indices)
+    if args.solo_indices:
+        return 0
+
+    years = [year_from_path(img) for img in imagenes]
+    t1 = args.t1 or years[0]
+    t2 = args.t2 or years[-1]
+    par = (
+        args.processed_dir / f"indices_{t1}.tif",
+        args.processed_dir / f"indices_{t2}.tif",
+        args.processed_dir / "cambio_clasificado.tif",
+        args.processed_dir / "cambio_diferencia_ndvi.tif",
+    )
+    for path in par[:2]:
+        if not path.exists():
+            print(f"Falta {path}")
+            return 1
+
+    (resumen,) = detectar_cambios_paralelo([par], args.workers, args.tile_blocks, umbral=args.umbral)
+    print(f"Cambios {t1}-{t2}:")
+    resumen.imprimir()
+    print("Guardado:", par[2])
+    print("Guardado:", par[3])
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
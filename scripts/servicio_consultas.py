@@ -0,0 +1,65 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "app"))
+
+from consultas import CACHE_RESPUESTAS, IndiceConsultas, ServidorConsultas  # noqa: E402
+from utils import DataPaths  # noqa: E402
+
+
+def cargar_indice(args) -> IndiceConsultas:
+    inicio = time.perf_counter()
+    consultas = IndiceConsultas(
+        DataPaths.from_dirs(args.processed_dir, args.vector_dir),
+        args.processed_dir,
+        args.cache_dir,
+        args.columna_zona,
+        indices_por_zona=not args.sin_indices,
+        cache_respuestas=args.cache,
+    )
+    print(
+        f"{len(consultas.por_zona[consultas.periodo_defecto])} zonas, {len(consultas.por_zona)} periodos, "
+        f"indices de {len(consultas.indices)} zonas cargados en {time.perf_counter() - inicio:.2f} s"
+    )
+    return consultas
+
+
+def agregar_argumentos(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--processed-dir", type=Path, default=REPO_ROOT / "data" / "processed")
+    parser.add_argument("--vector-dir", type=Path, default=REPO_ROOT / "data" / "vector")
+    parser.add_argument("--cache-dir", type=Path, default=REPO_ROOT / "data" / "cache")
+    parser.add_argument("--columna-zona", default="MANZENT", help="Columna identificadora de las manzanas.")
+    parser.add_argument("--sin-indices", action="store_true", help="No calcula los indices por zona (trayectorias).")
+    parser.add_argument("--cache", type=int, default=CACHE_RESPUESTAS, help="Respuestas guardadas en memoria (LRU).")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Servicio HTTP/JSON local con el cambio por manzana: /periodos, /zona/<id>, /zonas?ids=, "
+            "/bbox?bbox=minx,miny,maxx,maxy, /top?metrica=&n=, /trayectoria/<id>, /trayectorias?ids= "
+            "(todas con ?periodo=<t1>_<t2>) y POST /lote."
+        )
+    )
+    agregar_argumentos(parser)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--verbose", action="store_true", help="Registra cada consulta.")
+    args = parser.parse_args()
+
+    servidor = ServidorConsultas(cargar_indice(args), args.host, args.port, args.verbose)
+    print(f"Escuchando en http://{args.host}:{servidor.server_address[1]}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
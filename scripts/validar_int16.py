@@ -0,0 +1,39 @@
+import argparse
+import sys
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(REPO_ROOT / "app"))
+
+from change import UMBRAL_DIFERENCIA, validar_cuantizacion  # noqa: E402
+
+# Fraccion de pixeles con clase distinta que se tolera (pixeles a ~1e-4 de un umbral)
+TOLERANCIA = 1e-3
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Compara la clasificacion de cambios con indices float32 y con los mismos indices en int16."
+    )
+    parser.add_argument("--processed-dir", type=Path, default=REPO_ROOT / "data" / "processed")
+    parser.add_argument("--t1", required=True, help="Ano inicial (indices_<t1>.tif en float32).")
+    parser.add_argument("--t2", required=True, help="Ano final (indices_<t2>.tif en float32).")
+    parser.add_argument("--umbral", type=float, default=UMBRAL_DIFERENCIA, help="Umbral de diferencia NDVI.")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA, help="Fraccion de pixeles distintos tolerada.")
+    args = parser.parse_args()
+
+    rutas = [args.processed_dir / f"indices_{t}.tif" for t in (args.t1, args.t2)]
+    for ruta in rutas:
+        if not ruta.exists():
+            print(f"Falta {ruta}")
+            return 1
+    validacion = validar_cuantizacion(*rutas, umbral=args.umbral)
+    validacion.imprimir()
+    if validacion.fraccion > args.tolerancia:
+        print(f"La cuantizacion cambia {validacion.fraccion:.6f} de los pixeles (tolerancia {args.tolerancia})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from downloader import ChecksumError, Manifest, download_all, fetch, make_session
+
+
+class Recurso:
+    def __init__(self, contenido: bytes, etag: str):
+        self.contenido = contenido
+        self.etag = etag
+        # Bytes a enviar antes de cortar la conexion en la proxima respuesta (None: sin corte)
+        self.cortar_en: int | None = None
+
+
+class ServidorPrueba(ThreadingHTTPServer):
+    """
+    Servidor HTTP local que imita lo que usa el descargador: ETag, If-None-Match (304),
+    Range + If-Range (206) y cortes a mitad de una transferencia. Registra cada respuesta
+    como (ruta, status, bytes del cuerpo enviados).
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.recursos: dict[str, Recurso] = {}
+        self.registro: list[tuple[str, int, int]] = []
+        self.lock = threading.Lock()
+
+    def url(self, ruta: str) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}{ruta}"
+
+    def respuestas(self, ruta: str) -> list[tuple[int, int]]:
+        with self.lock:
+            return [(status, enviados) for r, status, enviados in self.registro if r == ruta]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        servidor = self.server
+        recurso = servidor.recursos.get(self.path)
+        if recurso is None:
+            self._responder(404, b"", {})
+            return
+        if self.headers.get("If-None-Match") == recurso.etag:
+            self._responder(304, b"", {"ETag": recurso.etag})
+            return
+        cuerpo, status, headers = recurso.contenido, 200, {"ETag": recurso.etag}
+        rango = re.fullmatch(r"bytes=(\d+)-", self.headers.get("Range", ""))
+        if rango and self.headers.get("If-Range", recurso.etag) == recurso.etag:
+            inicio = int(rango.group(1))
+            if inicio >= len(cuerpo):
+                self._responder(416, b"", {"Content-Range": f"bytes */{len(cuerpo)}"})
+                return
+            cuerpo, status = cuerpo[inicio:], 206
+            headers["Content-Range"] = f"bytes {inicio}-{len(recurso.contenido) - 1}/{len(recurso.contenido)}"
+        corte, recurso.cortar_en = recurso.cortar_en, None
+        self._responder(status, cuerpo, headers, corte)
+
+    def _responder(self, status: int, cuerpo: bytes, headers: dict, corte: int | None = None) -> None:
+        self.send_response(status)
+        for nombre, valor in headers.items():
+            self.send_header(nombre, valor)
+        if status != 304:
+            self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        enviados = len(cuerpo) if corte is None else min(corte, len(cuerpo))
+        self.wfile.write(cuerpo[:enviados])
+        with self.server.lock:
+            self.server.registro.append((self.path, status, enviados))
+        if corte is not None:
+            # Corte a mitad del cuerpo: el cliente recibe menos bytes que Content-Length
+            self.wfile.flush()
+            self.close_connection = True
+
+
+def _sha256(contenido: bytes) -> str:
+    return hashlib.sha256(contenido).hexdigest()
+
+
+def _leer(ruta: str) -> bytes:
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
+def verificar(tamano: int) -> list[tuple[str, bool]]:
+    """Ejecuta cada caso contra el servidor local y retorna (caso, paso)."""
+    resultados = []
+    servidor = ServidorPrueba()
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    session = make_session(pool_size=4, retries=0)
+    raiz = tempfile.mkdtemp(prefix="descargas_")
+    try:
+        manifest = Manifest(os.path.join(raiz, "descargas.json"), root=raiz)
+        datos = {
+            "/a/escena.tif": os.urandom(tamano),
+            "/b/escena.tif": os.urandom(tamano // 2),
+        }
+        for ruta, contenido in datos.items():
+            servidor.recursos[ruta] = Recurso(contenido, f'"{_sha256(contenido)[:16]}"')
+        jobs = [(servidor.url(ruta), os.path.join(raiz, ruta.strip("/"))) for ruta in datos]
+        for _, dst in jobs:
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+
+        # 1. Descarga completa; mismo nombre en dos carpetas, dos entradas del manifiesto
+        primera = download_all(jobs, manifest, workers=2, session=session)
+        resultados.append(
+            (
+                "descarga inicial con nombres repetidos en carpetas distintas",
+                all(r.changed for r in primera)
+                and all(_leer(dst) == datos[ruta] for ruta, (_, dst) in zip(datos, jobs))
+                and {"a/escena.tif", "b/escena.tif"} <= set(manifest.entries),
+            )
+        )
+
+        # 2. Sin cambios: If-None-Match -> 304, sin transferir el cuerpo
+        segunda = download_all(jobs, manifest, workers=2, session=session)
+        resultados.append(
+            (
+                "archivos vigentes se omiten con ETag (304, 0 bytes)",
+                not any(r.changed for r in segunda)
+                and all(servidor.respuestas(ruta)[-1] == (304, 0) for ruta in datos),
+            )
+        )
+
+        # 3. Corte a mitad de la transferencia: el reintento reanuda el .part con Range
+        ruta, dst = "/c/escena.tif", os.path.join(raiz, "c", "escena.tif")
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        contenido = os.urandom(tamano)
+        servidor.recursos[ruta] = Recurso(contenido, '"c1"')
+        servidor.recursos[ruta].cortar_en = tamano // 3
+        resultado = fetch(session, servidor.url(ruta), dst, manifest, _sha256(contenido))
+        respuestas = servidor.respuestas(ruta)
+        resultados.append(
+            (
+                "reanudacion con Range tras un corte",
+                resultado.changed
+                and resultado.resumed_from > 0
+                and _leer(dst) == contenido
+                and [status for status, _ in respuestas] == [200, 206]
+                and sum(enviados for _, enviados in respuestas) == tamano,
+            )
+        )
+
+        # 4. Recurso modificado (ETag nuevo): se descarga solo ese archivo
+        nuevo = os.urandom(tamano)
+        servidor.recursos["/a/escena.tif"] = Recurso(nuevo, '"a2"')
+        tercera = download_all(jobs, manifest, workers=2, session=session)
+        resultados.append(
+            (
+                "recurso modificado se vuelve a descargar",
+                [r.changed for r in tercera] == [True, False] and _leer(jobs[0][1]) == nuevo,
+            )
+        )
+
+        # 5. .part de una version anterior: If-Range no coincide y llega el archivo completo
+        ruta, dst = "/d/escena.tif", os.path.join(raiz, "d", "escena.tif")
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        contenido = os.urandom(tamano)
+        servidor.recursos[ruta] = Recurso(contenido, '"d2"')
+        with open(dst + ".part", "wb") as f:
+            f.write(os.urandom(tamano // 4))
+        manifest.update(manifest.key(dst), partial={"url": servidor.url(ruta), "etag": '"d1"'})
+        resultado = fetch(session, servidor.url(ruta), dst, manifest)
+        resultados.append(
+            (
+                ".part obsoleto se descarta (If-Range)",
+                resultado.changed
+                and resultado.resumed_from == 0
+                and _leer(dst) == contenido
+                and servidor.respuestas(ruta) == [(200, tamano)],
+            )
+        )
+
+        # 6. sha256 esperado distinto: falla sin reemplazar el destino
+        try:
+            fetch(session, servidor.url(ruta), os.path.join(raiz, "d", "otra.tif"), manifest, "0" * 64)
+            rechazado = False
+        except ChecksumError:
+            rechazado = not os.path.exists(os.path.join(raiz, "d", "otra.tif"))
+        resultados.append(("sha256 distinto se rechaza", rechazado))
+
+        # El manifiesto guardado se puede volver a leer con las mismas claves
+        with open(manifest.path, encoding="utf-8") as f:
+            resultados.append(("manifiesto persistido", set(json.load(f)) == set(manifest.entries)))
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+        session.close()
+        shutil.rmtree(raiz, ignore_errors=True)
+    return resultados
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=(
+            "Verifica el descargador (reanudacion con Range, omision por ETag/tamano, claves del manifiesto) "
+            "contra un servidor HTTP local."
+        )
+    )
+    parser.add_argument("--tamano", type=int, default=3 * 1024 * 1024, help="Bytes de cada archivo de prueba.")
+    args = parser.parse_args()
+
+    resultados = verificar(args.tamano)
+    for caso, paso in resultados:
+        print(f"{'OK   ' if paso else 'FALLA'} {caso}")
+    return 0 if all(paso for _, paso in resultados) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())